@@ -0,0 +1,128 @@
+"""
+Benchmarks the function dispatching path: the per-argument `asyncio.Queue`s that were allocated for every registered
+function, against the lazily created `Channel`s.
+
+Both hand the values over by reference, so the difference is in the bookkeeping: the allocations are measured as the
+peak bytes, and as the number of memory blocks that are alive once all the tokens have been sent (before the consumer
+has read them).
+
+Run with: python -m benchmarks.bench_dispatch
+"""
+import asyncio
+import time
+import tracemalloc
+from typing import AsyncGenerator, Callable, Optional
+
+from openai_streaming.fn_dispatcher import Channel, dispatch_yielded_functions_with_args
+
+TOOLS = 40
+ARGS_PER_TOOL = 4
+TOKENS = 20_000
+WARMUP = 100
+SAMPLE = 1_000  # The tokens of the run that measures the allocations per token
+
+
+def _make_registry():
+    funcs = []
+    for i in range(TOOLS):
+        args = ", ".join(f"a{j}: AsyncGenerator[str, None]" for j in range(ARGS_PER_TOOL))
+        ns = {"AsyncGenerator": AsyncGenerator}
+        body = "\n".join(f"    async for _ in a{j}: pass" for j in range(ARGS_PER_TOOL))
+        exec(f"async def tool_{i}({args}):\n{body}\n", ns)
+        funcs.append(ns[f"tool_{i}"])
+    return funcs
+
+
+def _gen(tokens: int, sent: Optional[Callable[[], None]] = None):
+    async def gen():
+        for _ in range(tokens):
+            yield "tool_0", {"a0": "tok"}
+        if sent is not None:
+            sent()
+
+    return gen
+
+
+async def _queue_handoff(tokens: int, sent: Optional[Callable[[], None]] = None):
+    """A replica of the previous path: a queue per argument of every registered function, and sentinels for all."""
+    queues = {f"tool_{i}": {f"a{j}": asyncio.Queue() for j in range(ARGS_PER_TOOL)} for i in range(TOOLS)}
+
+    async def consume(q):
+        while (await q.get()) is not None:
+            pass
+
+    consumer = asyncio.create_task(consume(queues["tool_0"]["a0"]))
+    for _ in range(tokens):
+        await queues["tool_0"]["a0"].put("tok")
+    if sent is not None:
+        sent()
+    for args in queues.values():
+        for q in args.values():
+            await q.put(None)
+    await consumer
+
+
+async def _channel_handoff(tokens: int, sent: Optional[Callable[[], None]] = None):
+    ch = Channel()
+
+    async def consume():
+        async for _ in ch:
+            pass
+
+    consumer = asyncio.create_task(consume())
+    for _ in range(tokens):
+        ch.send("tok")
+    if sent is not None:
+        sent()
+    ch.close()
+    await consumer
+
+
+def _peak(loop, coro_factory, tokens: int) -> int:
+    tracemalloc.start()
+    loop.run_until_complete(coro_factory(tokens))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def _count_blocks() -> int:
+    snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    return sum(stat.count for stat in snapshot.statistics("lineno"))
+
+
+def _blocks(loop, coro_factory, tokens: int) -> int:
+    counts = []
+    tracemalloc.start()
+    before = _count_blocks()
+    loop.run_until_complete(coro_factory(tokens, lambda: counts.append(_count_blocks())))
+    tracemalloc.stop()
+    return counts[0] - before
+
+
+def _measure(name: str, coro_factory, tokens: int):
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(coro_factory(WARMUP))  # warm the caches (specs, validators, imports) up first
+    request = _peak(loop, coro_factory, 1)
+    per_token = (_peak(loop, coro_factory, SAMPLE) - request) / (SAMPLE - 1)
+    request_blocks = _blocks(loop, coro_factory, 1)
+    blocks_per_token = (_blocks(loop, coro_factory, SAMPLE) - request_blocks) / (SAMPLE - 1)
+
+    start = time.perf_counter()
+    loop.run_until_complete(coro_factory(tokens))
+    elapsed = time.perf_counter() - start
+    loop.close()
+    print(f"{name:<24} peak bytes per request: {request:>8}    bytes per token: {per_token:>6.1f}    "
+          f"blocks per request: {request_blocks:>5}    blocks per token: {blocks_per_token:>5.2f}    "
+          f"per token: {elapsed / tokens * 1e6:.2f}us")
+
+
+def main():
+    funcs = _make_registry()
+    _measure("asyncio.Queue handoff", _queue_handoff, TOKENS)
+    _measure("Channel handoff", _channel_handoff, TOKENS)
+    _measure("dispatch (40 tools)", lambda n, sent=None: dispatch_yielded_functions_with_args(_gen(n, sent), funcs, None), TOKENS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Benchmarks the import (cold-start) time of the package's entry points, as reported by `python -X importtime` in fresh
+interpreters, and the modules they pull in.
+
+Run with: python -m benchmarks.bench_import
+"""
+import statistics
+import subprocess
+import sys
+
+RUNS = 7
+
+ENTRY_POINTS = [
+    "import openai_streaming",
+    "import openai_streaming.struct",
+    "from openai_streaming import process_response",
+    "from openai_streaming.struct import process_struct_response",
+]
+
+
+def _import_time(code: str) -> float:
+    """
+    :return: The import time (in ms) of the modules imported by the code, without the interpreter's own startup imports
+    """
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", code], check=True, capture_output=True,
+                         text=True).stderr
+    total = 0
+    started = False
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        started = started or name.startswith(" openai_streaming")  # the startup imports come before the package
+        if started and not name.startswith("  "):  # a top-level import (its cumulative time includes the nested ones)
+            total += int(cumulative)
+    return total / 1000
+
+
+if __name__ == '__main__':
+    for code in ENTRY_POINTS:
+        ms = statistics.median(_import_time(code) for _ in range(RUNS))
+        print(f"{code:<60} {ms:8.1f} ms")
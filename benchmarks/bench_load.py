@@ -0,0 +1,126 @@
+"""
+An end-to-end load generator: drives `AsyncOpenAI` + `process_response` against the local `FakeOpenAIServer` (running
+in a separate process) at a high number of concurrent streams, and reports the throughput, the latency percentiles and
+the event-loop lag of the client.
+
+Run with: python -m benchmarks.bench_load --streams 5000 --concurrency 2000
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+from typing import AsyncGenerator, List, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from openai_streaming import process_response
+from openai_streaming.fake_server import FakeOpenAIServer
+
+
+def _serve(options: dict, ready: multiprocessing.Queue) -> None:
+    async def serve():
+        server = FakeOpenAIServer(**options)
+        await server.start()
+        ready.put(server.url)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+async def _monitor_lag(lags: List[float], interval: float = 0.01) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+async def _stream(client: AsyncOpenAI, ttfts: List[float], durations: List[float]) -> int:
+    start = time.perf_counter()
+    first: Optional[float] = None
+    tokens = 0
+
+    async def content_handler(content: AsyncGenerator[str, None]):
+        nonlocal first, tokens
+        async for _ in content:
+            if first is None:
+                first = time.perf_counter() - start
+            tokens += 1
+
+    resp = await client.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": "Hi"}],
+                                                stream=True)
+    await process_response(resp, content_handler)
+    durations.append(time.perf_counter() - start)
+    if first is not None:
+        ttfts.append(first)
+    return tokens
+
+
+async def run(url: str, streams: int, concurrency: int) -> None:
+    client = AsyncOpenAI(base_url=url, api_key="fake", max_retries=0, http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        timeout=httpx.Timeout(60)))
+    semaphore = asyncio.Semaphore(concurrency)
+    ttfts: List[float] = []
+    durations: List[float] = []
+    lags: List[float] = []
+    failures = 0
+    tokens = 0
+
+    async def one():
+        nonlocal failures, tokens
+        async with semaphore:
+            try:
+                received = await _stream(client, ttfts, durations)
+                tokens += received
+            except Exception:
+                failures += 1
+
+    monitor = asyncio.create_task(_monitor_lag(lags))
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(streams)))
+    elapsed = time.perf_counter() - start
+    monitor.cancel()
+    await client.close()
+
+    print(f"streams:     {streams} ({failures} failed), concurrency {concurrency}, {elapsed:.2f}s")
+    print(f"throughput:  {(streams - failures) / elapsed:.1f} streams/s, {tokens / elapsed:.0f} tokens/s")
+    for name, values in (("ttft", ttfts), ("duration", durations), ("loop lag", lags)):
+        print(f"{name + ':':<12} p50 {_percentile(values, 0.5) * 1000:8.1f}ms  "
+              f"p95 {_percentile(values, 0.95) * 1000:8.1f}ms  p99 {_percentile(values, 0.99) * 1000:8.1f}ms  "
+              f"max {max(values, default=float('nan')) * 1000:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--streams", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--token-rate", type=float, default=50)
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    options = dict(tokens=args.tokens, latency=args.latency, token_rate=args.token_rate, jitter=args.jitter,
+                   failure_rate=args.failure_rate, disconnect_rate=args.disconnect_rate)
+    ready = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve, args=(options, ready), daemon=True)
+    server.start()
+    try:
+        asyncio.run(run(ready.get(timeout=10), args.streams, args.concurrency))
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
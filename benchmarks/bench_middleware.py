@@ -0,0 +1,132 @@
+"""
+Benchmarks transforming the content with 1, 4 and 16 stages: wrapping the content generator with an async generator
+per stage (an extra await hop per token per stage), against a middleware chain that runs the stages in one pass in the
+reading coroutine.
+
+The stages alone are measured first (tokens from a generator, through the stages): the chain has a fixed cost per
+event (a call, and a pass over the event's arguments), and then costs a plain call per stage, where a generator costs
+a hop. Then whole responses are measured, where the rest of the processing dominates (and the machine's noise with
+it).
+
+Run with: python -m benchmarks.bench_middleware
+"""
+import asyncio
+import gc
+import time
+from types import SimpleNamespace
+from typing import AsyncGenerator, Dict, List
+
+from openai_streaming import process_response
+from openai_streaming.middleware import MiddlewareChain, Middleware
+
+RESPONSES = 100
+TOKENS = 500
+STAGES = (1, 4, 16)
+REPEATS = 5
+
+
+def _make_chunks() -> list:
+    def chunk(content):
+        delta = SimpleNamespace(content=content, function_call=None, tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)])
+
+    return [chunk(f"token{i} ") for i in range(TOKENS)]
+
+
+class Normalize(Middleware):
+    text_only = True
+
+    def process(self, state: Dict, func: str, arg: str, value):
+        return value.replace(" ", " ")
+
+
+async def _stage(content: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+    async for token in content:
+        yield token.replace(" ", " ")
+
+
+async def _tokens(tokens: List[str]) -> AsyncGenerator[str, None]:
+    for token in tokens:
+        yield token
+
+
+async def _stages_wrapped(tokens: List[str], stages: int) -> int:
+    content = _tokens(tokens)
+    for _ in range(stages):
+        content = _stage(content)
+    return sum([1 async for _ in content])
+
+
+async def _stages_chained(tokens: List[str], stages: int) -> int:
+    run = MiddlewareChain([Normalize() for _ in range(stages)]).start()
+    return sum([1 async for token in _tokens(tokens) if run("content", {"content": token})])
+
+
+async def _wrapped(chunks, stages: int) -> int:
+    count = 0
+
+    async def content_handler(content: AsyncGenerator[str, None]):
+        nonlocal count
+        for _ in range(stages):
+            content = _stage(content)
+        async for _ in content:
+            count += 1
+
+    await process_response(chunks, content_handler)
+    return count
+
+
+async def _chained(chunks, stages: int) -> int:
+    count = 0
+
+    async def content_handler(content: AsyncGenerator[str, None]):
+        nonlocal count
+        async for _ in content:
+            count += 1
+
+    chain = MiddlewareChain([Normalize() for _ in range(stages)])
+    await process_response(chunks, content_handler, middleware=chain)
+    return count
+
+
+async def _plain(chunks, stages: int) -> int:
+    count = 0
+
+    async def content_handler(content: AsyncGenerator[str, None]):
+        nonlocal count
+        async for _ in content:
+            count += 1
+
+    await process_response(chunks, content_handler)
+    return count
+
+
+async def _compare(fns, data, stages: int) -> List[float]:
+    best = [float("inf")] * len(fns)
+    for _ in range(REPEATS):  # interleaved, so a slow period of the machine affects them all
+        for i, fn in enumerate(fns):
+            start = time.process_time()
+            for _ in range(RESPONSES):
+                assert await fn(data, stages) == TOKENS
+            best[i] = min(best[i], time.process_time() - start)
+    return [t / (RESPONSES * TOKENS) * 1e6 for t in best]
+
+
+async def main():
+    tokens = [f"token{i} " for i in range(TOKENS)]
+    chunks = _make_chunks()
+    gc.disable()  # the collector's pauses would dominate the differences
+    print(f"{RESPONSES} responses of {TOKENS} tokens (best of {REPEATS}, in us/token of CPU time)")
+    print("stages alone:  stages  wrapping generators  middleware chain")
+    for stages in STAGES:
+        wrapped, chained = await _compare((_stages_wrapped, _stages_chained), tokens, stages)
+        print(f"               {stages:>6}  {wrapped:>19.2f}  {chained:>16.2f}")
+    print("responses:     stages  no stages  wrapping generators  middleware chain")
+    for stages in STAGES:
+        plain, wrapped, chained = await _compare((_plain, _wrapped, _chained), chunks, stages)
+        print(f"               {stages:>6}  {plain:>9.2f}  {wrapped:>19.2f}  {chained:>16.2f}")
+    gc.enable()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
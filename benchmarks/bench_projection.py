@@ -0,0 +1,80 @@
+"""
+Benchmarks structured parsing of a chain-of-thought-heavy response (a long `reasoning` field that the handler ignores):
+the previous parser, which re-decodes the whole buffer for every token, against the projected parser, which skips the
+fields that are not in the handler's model.
+
+Run with: python -m benchmarks.bench_projection
+"""
+import asyncio
+import json
+import time
+from typing import List, Optional
+
+from json_streamer import JsonParser
+from pydantic import BaseModel
+
+from openai_streaming.struct import BaseHandler, Terminate
+from openai_streaming.struct.handler import _ContentHandler
+
+RESPONSES = 20
+REASONING_WORDS = 2000
+
+
+class Answer(BaseModel):
+    steps: List[str]
+    answer: Optional[int] = None
+
+
+class Handler(BaseHandler[Answer]):
+    async def handle_partially_parsed(self, data: Answer) -> Optional[Terminate]:
+        pass
+
+    async def terminated(self):
+        pass
+
+
+def _make_tokens() -> List[str]:
+    content = json.dumps({
+        "reasoning": " ".join(f"thought{i}" for i in range(REASONING_WORDS)),
+        "steps": [f"step number {i}" for i in range(20)],
+        "answer": 7,
+    })
+    return [content[i:i + 4] for i in range(0, len(content), 4)]
+
+
+async def _stream(tokens):
+    for t in tokens:
+        yield t
+
+
+async def _parse(tokens, parser=None) -> Answer:
+    handler = _ContentHandler(Handler(), "json")
+    if parser is not None:
+        handler.parser = parser
+    await handler.handle_content(_stream(tokens))
+    return handler.get_last_response()
+
+
+async def _measure(tokens, parser_factory=lambda: None) -> float:
+    start = time.perf_counter()
+    for _ in range(RESPONSES):
+        last = await _parse(tokens, parser_factory())
+    elapsed = time.perf_counter() - start
+    assert last.answer == 7 and len(last.steps) == 20
+    return elapsed
+
+
+async def main():
+    tokens = _make_tokens()
+    total = RESPONSES * len(tokens)
+
+    full = await _measure(tokens, JsonParser)
+    projected = await _measure(tokens)
+    print(f"{RESPONSES} responses of {len(tokens)} tokens")
+    print(f"full buffer: {full:.3f}s ({full / total * 1e6:.1f}us/token)")
+    print(f"projected:   {projected:.3f}s ({projected / total * 1e6:.1f}us/token)")
+    print(f"speedup: {full / projected:.1f}x")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+"""
+Benchmarks the relay: frames per second and bytes per token, when sending a frame per token versus batching.
+
+Run with: python -m benchmarks.bench_relay
+"""
+import asyncio
+import time
+
+from openai.types.chat import ChatCompletionChunk
+
+from openai_streaming.relay import Relay
+
+TOKENS = 20_000
+
+
+CHUNKS = [ChatCompletionChunk.model_construct(**{"choices": [{"index": 0, "delta": {"content": f" tok{i % 10}"}}]})
+          for i in range(TOKENS)]
+
+
+async def _stream():
+    for i, chunk in enumerate(CHUNKS):
+        yield chunk
+        if i % 100 == 0:
+            await asyncio.sleep(0)  # let the flushing timer run, as a real network stream would
+
+
+async def _run(fmt: str, flush_bytes: int, flush_interval: float):
+    async def send(frame: str):
+        pass
+
+    relay = Relay(send, fmt, flush_bytes=flush_bytes, flush_interval=flush_interval)
+    start = time.perf_counter()
+    await relay.run(_stream())
+    elapsed = time.perf_counter() - start
+    print(f"{fmt:<10} flush_bytes={flush_bytes:<6} frames: {relay.frames:>6}  "
+          f"frames/s: {relay.frames / elapsed:>10.0f}  bytes/token: {relay.bytes_sent / TOKENS:.2f}  "
+          f"tokens/s: {TOKENS / elapsed:.0f}")
+
+
+def main():
+    for fmt in ("sse", "websocket"):
+        asyncio.run(_run(fmt, 0, 0.05))
+        asyncio.run(_run(fmt, 256, 0.05))
+        asyncio.run(_run(fmt, 4096, 0.05))
+
+
+if __name__ == '__main__':
+    main()
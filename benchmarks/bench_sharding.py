@@ -0,0 +1,73 @@
+"""
+Benchmarks the throughput of parse-heavy batches (long, chunked function arguments) on a single event loop, against
+the process-sharded runner with 2 worker processes, and with a worker process per CPU.
+
+Run with: python -m benchmarks.bench_sharding
+"""
+import json
+import os
+import time
+from typing import AsyncGenerator, List
+
+from openai_streaming import process_response, openai_streaming_function
+from openai_streaming.sharding import run_sharded
+from openai_streaming.utils import logs_to_response
+
+STREAMS = 32
+ARGUMENT_CHUNKS = 300
+
+
+@openai_streaming_function
+async def write_document(title: AsyncGenerator[str, None], body: AsyncGenerator[str, None]):
+    """
+    Write a document.
+
+    :param title: The document's title.
+    :param body: The document's body.
+    """
+    async for _ in title:
+        pass
+    async for _ in body:
+        pass
+
+
+def _chunk(arguments: str, name: str = None, finish_reason: str = None) -> dict:
+    function = {"name": name, "arguments": arguments}
+    return {
+        "id": "chatcmpl", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4",
+        "choices": [{"index": 0, "finish_reason": finish_reason, "delta": {
+            "tool_calls": [{"index": 0, "id": "call_1" if name else None, "function": function}],
+        }}],
+    }
+
+
+def _make_log() -> List[dict]:
+    log = [_chunk('{"title": "A document", "body": "', name="write_document")]
+    log += [_chunk("lorem ipsum dolor sit amet ") for _ in range(ARGUMENT_CHUNKS)]
+    log += [_chunk('"}'), {**_chunk(""), "choices": [{"index": 0, "finish_reason": "tool_calls", "delta": {}}]}]
+    return log
+
+
+async def parse_log(log: List[dict]) -> int:
+    _, message = await process_response(logs_to_response(log), funcs=[write_document])
+    return len(json.loads(message.tool_calls[0].function.arguments)["body"])
+
+
+def main():
+    logs = [_make_log() for _ in range(STREAMS)]
+    cpus = os.cpu_count() or 1
+    print(f"{STREAMS} streams of {ARGUMENT_CHUNKS} argument chunks, {cpus} CPUs")
+
+    baseline = None
+    for processes in sorted({1, 2, cpus}):  # 2 processes show the sharding's overhead, even on a single CPU
+        start = time.perf_counter()
+        result = run_sharded(parse_log, logs, processes=processes)
+        elapsed = time.perf_counter() - start
+        assert result.failures == 0
+        baseline = baseline or elapsed
+        print(f"{processes:>3} processes: {result.throughput:8.1f} streams/s "
+              f"(speedup {baseline / elapsed:4.2f}x, cpu {sum(s.cpu_time for s in result.shards):.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
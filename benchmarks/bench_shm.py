@@ -0,0 +1,117 @@
+"""
+Benchmarks handing streamed tokens over to another process: a `multiprocessing.Queue` (a pickle and a pipe write per
+token), against the shared-memory `ShmRing` - the throughput of a burst of tokens, and the latency of tokens that
+arrive one at a time (when the reader is waiting for each of them).
+
+Run with: python -m benchmarks.bench_shm
+"""
+import multiprocessing
+import statistics
+import time
+
+from openai_streaming.shm_ring import ShmRing
+
+TOKENS = 200_000
+TOKEN = "token "
+IDLE_TOKENS = 200
+IDLE_GAP = 0.005
+
+
+def _consume_queue(q, done) -> None:
+    count = 0
+    while q.get() is not None:
+        count += 1
+    done.put(count)
+
+
+def _consume_ring(ring: ShmRing, done) -> None:
+    count = sum(1 for _ in ring)
+    ring.release()
+    done.put(count)
+
+
+def _receive_queue(q, done) -> None:
+    done.put([time.monotonic() for _ in iter(q.get, None)])
+
+
+def _receive_ring(ring: ShmRing, done) -> None:
+    done.put([time.monotonic() for _ in ring])
+    ring.release()
+
+
+def _bench_queue(ctx) -> float:
+    q, done = ctx.Queue(), ctx.Queue()
+    worker = ctx.Process(target=_consume_queue, args=(q, done))
+    worker.start()
+    start = time.perf_counter()
+    for _ in range(TOKENS):
+        q.put(TOKEN)
+    q.put(None)
+    assert done.get() == TOKENS
+    elapsed = time.perf_counter() - start
+    worker.join()
+    return elapsed
+
+
+def _bench_ring(ctx) -> float:
+    done = ctx.Queue()
+    with ShmRing.create(1 << 16, ctx) as ring:
+        worker = ctx.Process(target=_consume_ring, args=(ring, done))
+        worker.start()
+        start = time.perf_counter()
+        for _ in range(TOKENS):
+            ring.put(TOKEN)
+        ring.close()
+        assert done.get() == TOKENS
+        elapsed = time.perf_counter() - start
+        worker.join()
+    return elapsed
+
+
+def _idle_latencies(worker, put, close, done) -> list:
+    worker.start()
+    time.sleep(0.5)  # let the worker start, and wait for the first token
+    sent = []
+    for _ in range(IDLE_TOKENS):
+        time.sleep(IDLE_GAP)
+        sent.append(time.monotonic())
+        put(TOKEN)
+    close()
+    received = done.get()
+    worker.join()
+    return [r - s for s, r in zip(sent, received)]
+
+
+def _bench_queue_latency(ctx) -> list:
+    q, done = ctx.Queue(), ctx.Queue()
+    worker = ctx.Process(target=_receive_queue, args=(q, done))
+    return _idle_latencies(worker, q.put, lambda: q.put(None), done)
+
+
+def _bench_ring_latency(ctx) -> list:
+    done = ctx.Queue()
+    with ShmRing.create(1 << 16, ctx) as ring:
+        worker = ctx.Process(target=_receive_ring, args=(ring, done))
+        return _idle_latencies(worker, ring.put, ring.close, done)
+
+
+def _report(name: str, latencies: list) -> None:
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name} median {statistics.median(latencies) * 1e6:.0f}us, p99 {p99 * 1e6:.0f}us")
+
+
+def main():
+    ctx = multiprocessing.get_context("spawn")
+    queue = _bench_queue(ctx)
+    ring = _bench_ring(ctx)
+    print(f"{TOKENS} tokens")
+    print(f"multiprocessing.Queue: {queue:.3f}s ({queue / TOKENS * 1e6:.2f}us/token)")
+    print(f"ShmRing:               {ring:.3f}s ({ring / TOKENS * 1e6:.2f}us/token)")
+    print(f"{IDLE_TOKENS} tokens, {IDLE_GAP * 1e3:.0f}ms apart")
+    _report("multiprocessing.Queue:", _bench_queue_latency(ctx))
+    _report("ShmRing:              ", _bench_ring_latency(ctx))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmarks the structured response path: the content routed through the functions' dispatching machinery (a channel
+and a dispatched task per response), against the direct path that feeds the content straight into the parser, in the
+same coroutine.
+
+Run with: python -m benchmarks.bench_struct
+"""
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from openai_streaming import process_response
+from openai_streaming.struct import BaseHandler, Terminate, process_struct_response
+from openai_streaming.struct.handler import _ContentHandler
+
+RESPONSES = 200
+STEPS = 20
+
+
+class MathProblem(BaseModel):
+    steps: List[str]
+    answer: Optional[int] = None
+
+
+class Handler(BaseHandler[MathProblem]):
+    async def handle_partially_parsed(self, data: MathProblem) -> Optional[Terminate]:
+        pass
+
+    async def terminated(self):
+        pass
+
+
+def _make_chunks() -> list:
+    content = json.dumps({"steps": [f"step number {i}" for i in range(STEPS)], "answer": 7})
+    tokens = [content[i:i + 4] for i in range(0, len(content), 4)]
+
+    def chunk(content: Optional[str] = None, finish_reason: Optional[str] = None):
+        delta = SimpleNamespace(content=content, function_call=None, tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=finish_reason)])
+
+    return [chunk(t) for t in tokens] + [chunk(finish_reason="stop")]
+
+
+async def _stream(chunks):
+    for c in chunks:
+        yield c
+
+
+async def _dispatched(chunks) -> MathProblem:
+    """The previous path: the content is dispatched to the content handler through a channel and a task."""
+    handler = _ContentHandler(Handler(), "json")
+    await process_response(_stream(chunks), handler.handle_content, self=handler)
+    return handler.get_last_response()
+
+
+async def _direct(chunks) -> MathProblem:
+    last, _ = await process_struct_response(_stream(chunks), Handler(), "json")
+    return last
+
+
+async def _measure(fn, chunks) -> float:
+    start = time.perf_counter()
+    for _ in range(RESPONSES):
+        last = await fn(chunks)
+    elapsed = time.perf_counter() - start
+    assert last.answer == 7 and len(last.steps) == STEPS
+    return elapsed
+
+
+async def main():
+    chunks = _make_chunks()
+    tokens = RESPONSES * len(chunks)
+    await _measure(_direct, chunks)  # warm up
+
+    dispatched = await _measure(_dispatched, chunks)
+    direct = await _measure(_direct, chunks)
+    print(f"{RESPONSES} responses of {len(chunks)} tokens")
+    print(f"dispatched: {dispatched:.3f}s ({dispatched / tokens * 1e6:.1f}us/token)")
+    print(f"direct:     {direct:.3f}s ({direct / tokens * 1e6:.1f}us/token)")
+    print(f"overhead removed: {(dispatched - direct) / tokens * 1e6:.1f}us/token")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,2 +1,44 @@
-from .decorator import openai_streaming_function
-from .stream_processing import process_response
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .decorator import openai_streaming_function
+    from .stream_processing import process_response, StreamTimeout
+    from .events import stream_events, iter_events
+    from .fn_dispatcher import Prefetch, InvalidArguments
+
+# The public names are resolved on first use, so importing the package does not import `openai` (and the other
+# dependencies) until they are needed
+_LAZY = {
+    "openai_streaming_function": ".decorator",
+    "process_response": ".stream_processing",
+    "StreamTimeout": ".stream_processing",
+    "stream_events": ".events",
+    "iter_events": ".events",
+    "Prefetch": ".fn_dispatcher",
+    "InvalidArguments": ".fn_dispatcher",
+}
+
+# spelled out, so static tools see the public names (and the imports above are used)
+__all__ = [
+    "openai_streaming_function",
+    "process_response",
+    "StreamTimeout",
+    "stream_events",
+    "iter_events",
+    "Prefetch",
+    "InvalidArguments",
+]
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value  # resolve it only once
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
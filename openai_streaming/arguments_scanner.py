@@ -0,0 +1,251 @@
+import json
+import re
+from typing import Dict, List, Optional, Union
+
+from .fn_dispatcher import StreamedItems
+
+_WHITESPACE = " \t\n\r"
+_STRING_RUN = re.compile(r'[^"\\]+')
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+# Scanner states
+_BEFORE_OBJECT = 0
+_BEFORE_KEY = 1
+_KEY = 2
+_AFTER_KEY = 3
+_BEFORE_VALUE = 4
+_STRING = 5
+_RAW = 6
+_BEFORE_ITEM = 7
+_ITEM = 8
+_AFTER_VALUE = 9
+_DONE = 10
+
+
+class ArgumentsScanner:
+    """
+    Incrementally scans a streamed JSON object of arguments, and returns the changes as they arrive - without keeping
+    the arguments in memory.
+
+    Unlike re-parsing the whole buffer for every chunk, the scanner holds only a bounded state: strings are decoded and
+    handed over as fragments, and arrays are handed over item by item. Only the current array item (or the current
+    non-string value) is buffered until it is complete.
+
+    The changes have the same form as the output of `DiffPreprocessor`: a string fragment for strings that are still
+    streaming, or `StreamedItems` for array items, other values and completed values.
+    """
+
+    def __init__(self):
+        self.complete = False
+        self._state = _BEFORE_OBJECT
+        self._field: Optional[str] = None
+        self._buffer: List[str] = []  # The raw key, array item or value that is currently being scanned
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._escape: Optional[str] = None  # A pending escape sequence of a streamed string
+        self._high_surrogate: Optional[str] = None
+        self._array = False  # Whether the current value is an array
+        self._out: Dict[str, list] = {}
+
+    def feed(self, chunk: str) -> Dict[str, Union[str, StreamedItems]]:
+        """
+        Scans a chunk of the arguments.
+        :param chunk: The next chunk of the arguments JSON
+        :return: The changes of the arguments since the previous chunk
+        :raises ValueError: If the arguments are not a valid JSON object
+        """
+        self._out = {}
+        i = 0
+        n = len(chunk)
+        while i < n:
+            state = self._state
+            c = chunk[i]
+
+            if state == _STRING:
+                if self._escape is not None:
+                    i = self._scan_escape(chunk, i)
+                    continue
+                m = _STRING_RUN.match(chunk, i)
+                if m:
+                    self._emit_text(m.group())
+                    i = m.end()
+                    continue
+                if c == '\\':
+                    self._escape = ""
+                else:  # closing quote
+                    self._flush_surrogate()
+                    self._finish_field()
+                    self._state = _AFTER_VALUE
+                i += 1
+                continue
+
+            if state in (_RAW, _ITEM):
+                self._scan_raw(c)
+            elif c in _WHITESPACE:
+                pass
+            elif state == _BEFORE_OBJECT:
+                if c != '{':
+                    raise ValueError(f"Arguments must be a JSON object, got {c!r}")
+                self._state = _BEFORE_KEY
+            elif state == _BEFORE_KEY:
+                if c == '"':
+                    self._state = _KEY
+                    self._buffer = ['"']
+                elif c == '}':
+                    self._state = _DONE
+                    self.complete = True
+                elif c != ',':
+                    raise ValueError(f"Unexpected {c!r} in arguments")
+            elif state == _KEY:
+                self._buffer.append(c)
+                if c == '"' and not self._escaped:
+                    self._field = json.loads("".join(self._buffer))
+                    self._buffer = []
+                    self._state = _AFTER_KEY
+                self._escaped = c == '\\' and not self._escaped
+            elif state == _AFTER_KEY:
+                if c != ':':
+                    raise ValueError(f"Unexpected {c!r} in arguments")
+                self._state = _BEFORE_VALUE
+            elif state == _BEFORE_VALUE:
+                self._array = False
+                if c == '"':
+                    self._state = _STRING
+                    self._entry(True)
+                elif c == '[':
+                    self._state = _BEFORE_ITEM
+                    self._array = True
+                    self._entry(False)
+                else:
+                    self._state = _RAW
+                    self._entry(False)
+                    self._start_raw(c)
+            elif state == _BEFORE_ITEM:
+                if c == ']':
+                    self._finish_field()
+                    self._state = _AFTER_VALUE
+                elif c != ',':
+                    self._state = _ITEM
+                    self._start_raw(c)
+            elif state == _AFTER_VALUE:
+                if c == ',':
+                    self._state = _BEFORE_KEY
+                elif c == '}':
+                    self._state = _DONE
+                    self.complete = True
+                else:
+                    raise ValueError(f"Unexpected {c!r} in arguments")
+            i += 1
+
+        return self._changes()
+
+    def _entry(self, is_string: bool) -> list:
+        entry = self._out.get(self._field)
+        if entry is None:
+            entry = self._out[self._field] = [is_string, [], False, self._array]  # string, parts, complete, array
+        return entry
+
+    def _emit_text(self, text: str) -> None:
+        if self._high_surrogate is not None:
+            text = self._high_surrogate + text
+            self._high_surrogate = None
+        self._entry(True)[1].append(text)
+
+    def _flush_surrogate(self) -> None:
+        if self._high_surrogate is not None:
+            self._emit_text("")
+
+    def _scan_escape(self, chunk: str, i: int) -> int:
+        self._escape += chunk[i]
+        esc = self._escape
+        if esc[0] == 'u':
+            if len(esc) < 5:
+                return i + 1
+            char = chr(int(esc[1:], 16))
+            self._escape = None
+            if 0xd800 <= ord(char) <= 0xdbff:
+                self._flush_surrogate()
+                self._high_surrogate = char
+            elif 0xdc00 <= ord(char) <= 0xdfff and self._high_surrogate is not None:
+                pair = (self._high_surrogate + char).encode('utf-16', 'surrogatepass').decode('utf-16')
+                self._high_surrogate = None
+                self._emit_text(pair)
+            else:
+                self._emit_text(char)
+            return i + 1
+
+        if esc not in _ESCAPES:
+            raise ValueError(f"Invalid escape sequence \\{esc} in arguments")
+        self._escape = None
+        self._emit_text(_ESCAPES[esc])
+        return i + 1
+
+    def _start_raw(self, c: str) -> None:
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._scan_raw(c)
+
+    def _scan_raw(self, c: str) -> None:
+        if self._in_string:
+            self._buffer.append(c)
+            if c == '"' and not self._escaped:
+                self._in_string = False
+            self._escaped = c == '\\' and not self._escaped
+            return
+
+        if c == '"':
+            self._in_string = True
+        elif c in '{[':
+            self._depth += 1
+        elif c in '}]' or c == ',':
+            if self._depth == 0:  # the terminator of a scalar value
+                self._finish_raw()
+                self._after_value(c)
+                return
+            if c != ',':
+                self._depth -= 1
+        self._buffer.append(c)
+        if self._depth == 0 and c in '}]':
+            self._finish_raw()
+
+    def _after_value(self, c: str) -> None:
+        # the terminator belongs to the container of the value
+        if self._state == _BEFORE_ITEM:
+            if c == ']':
+                self._finish_field()
+                self._state = _AFTER_VALUE
+        elif self._state == _AFTER_VALUE:
+            if c == '}':
+                self._state = _DONE
+                self.complete = True
+            elif c == ',':
+                self._state = _BEFORE_KEY
+            else:
+                raise ValueError(f"Unexpected {c!r} in arguments")
+
+    def _finish_raw(self) -> None:
+        value = json.loads("".join(self._buffer))
+        self._buffer = []
+        self._entry(False)[1].append(value)
+        if self._state == _ITEM:
+            self._state = _BEFORE_ITEM
+        else:
+            self._finish_field()
+            self._state = _AFTER_VALUE
+
+    def _finish_field(self) -> None:
+        self._entry(self._state == _STRING)[2] = True
+
+    def _changes(self) -> Dict[str, Union[str, StreamedItems]]:
+        changes = {}
+        for field, (is_string, parts, complete, array) in self._out.items():
+            if is_string:
+                parts = ["".join(parts)] if parts and any(parts) else []
+            if complete:
+                changes[field] = StreamedItems(parts, complete=True, array=array)
+            elif parts:
+                changes[field] = parts[0] if is_string else StreamedItems(parts, array=array)
+        return changes
@@ -0,0 +1,285 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Callable, Awaitable, Optional, List, Tuple, Set, Any, Dict, NamedTuple, Protocol, \
+    runtime_checkable
+
+from openai.types.chat import ChatCompletionChunk, ChatCompletionMessage
+
+from .stream_processing import StreamFactory, process_response, _close_response
+from .utils import logs_to_response
+
+
+class CacheEntry(NamedTuple):
+    """
+    A completed stream, as stored in the cache.
+    """
+    chunks: List[Dict[str, Any]]  # The chunks of the stream (as dicts, like the logs of `logs_to_response`)
+    offsets: List[float]  # The time (in seconds) of each chunk, since the request
+    created: float  # The time (epoch seconds) the entry was stored
+
+    @property
+    def size(self) -> int:
+        """
+        The approximate size of the entry, in bytes.
+        """
+        return len(json.dumps(self.chunks, separators=(",", ":")))
+
+
+@runtime_checkable
+class CacheBackend(Protocol):
+    """
+    The storage of a response cache.
+    """
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        :param key: The key of the request
+        :return: The entry of the request, or None if it is not in the cache (or has expired)
+        """
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        """
+        Stores an entry (and evicts entries if the cache is over its bounds).
+        :param key: The key of the request
+        :param entry: The entry to store
+        """
+
+
+class MemoryCache:
+    """
+    An in-memory LRU cache of completed streams, bounded by the number of entries and/or their total size, with an
+    optional time-to-live.
+    """
+
+    def __init__(self, max_entries: Optional[int] = 1024, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None):
+        """
+        :param max_entries: The maximum number of entries
+        :param max_bytes: The maximum total size (in bytes) of the entries
+        :param ttl: The time (in seconds) after which an entry expires
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[CacheEntry, int]]" = OrderedDict()
+        self.bytes = 0  # The total size of the entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        entry, _ = item
+        if self.ttl is not None and time.time() - entry.created > self.ttl:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        if key in self._entries:
+            self._remove(key)
+        size = entry.size
+        self._entries[key] = (entry, size)
+        self.bytes += size
+        while self._entries and (self.max_entries is not None and len(self._entries) > self.max_entries
+                                 or self.max_bytes is not None and self.bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))  # the least recently used
+
+    def _remove(self, key: str) -> None:
+        _, size = self._entries.pop(key)
+        self.bytes -= size
+
+
+class DiskCache:
+    """
+    An on-disk LRU cache of completed streams (a JSON file per entry), bounded by the number of entries and/or their
+    total size, with an optional time-to-live. It persists between runs, e.g. across reruns of a pipeline.
+    """
+
+    def __init__(self, directory: str, max_entries: Optional[int] = None, max_bytes: Optional[int] = 1 << 30,
+                 ttl: Optional[float] = None):
+        """
+        :param directory: The directory of the cache (created if it does not exist)
+        :param max_entries: The maximum number of entries
+        :param max_bytes: The maximum total size (in bytes) of the entries
+        :param ttl: The time (in seconds) after which an entry expires
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        entry = CacheEntry(data["chunks"], data["offsets"], data["created"])
+        if self.ttl is not None and time.time() - entry.created > self.ttl:
+            self._remove(path)
+            return None
+        os.utime(path)  # the modification time orders the entries by their last use
+        return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        # write atomically, so concurrent readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry._asdict(), f, separators=(",", ":"))
+        os.replace(tmp, self._path(key))
+        self._evict()
+
+    def _evict(self) -> None:
+        if self.max_entries is None and self.max_bytes is None:
+            return
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, name))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        count = len(files)
+        for _, size, name in files:  # the least recently used first
+            if not (self.max_entries is not None and count > self.max_entries
+                    or self.max_bytes is not None and total > self.max_bytes):
+                break
+            self._remove(os.path.join(self.directory, name))
+            total -= size
+            count -= 1
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class CachedStream:
+    """
+    A stream that is replayed from a cache when its request is cached, and is recorded into the cache otherwise.
+
+    Cached streams are replayed as `ChatCompletionChunk`s (like `logs_to_response`), either instantly or paced by their
+    recorded timing, so the handlers see a regular stream. Only streams that have completed (with a finish reason) are
+    stored.
+
+    The streams must be async streams.
+
+    :Example:
+    ```python
+    cache = DiskCache(".openai-cache")
+    params = dict(model="gpt-4", messages=messages, temperature=0, stream=True)
+
+    stream = CachedStream(cache, request_key(**params), lambda: client.chat.completions.create(**params))
+    await process_response(stream, content_handler)
+    ```
+    """
+
+    def __init__(self, cache: CacheBackend, key: str, factory: StreamFactory, pace: Optional[float] = None):
+        """
+        :param cache: The cache
+        :param key: The key of the request (see `coalescing.request_key`)
+        :param factory: A function that requests the stream on a cache miss (it may be a coroutine function)
+        :param pace: The speed of a replay, relative to the recorded timing (1.0 for the original timing, 2.0 for
+            twice as fast), or None to replay instantly
+        """
+        if pace is not None and pace <= 0:
+            raise ValueError("pace must be positive")
+        self._cache = cache
+        self.key = key
+        self._factory = factory
+        self.pace = pace
+        self.hit: Optional[bool] = None  # Whether the stream was replayed from the cache (set once it has started)
+        self._gen = self._stream()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> ChatCompletionChunk:
+        return await self._gen.__anext__()
+
+    async def aclose(self) -> None:
+        await self._gen.aclose()
+
+    async def _stream(self):
+        entry = self._cache.get(self.key)
+        self.hit = entry is not None
+        if entry is not None:
+            async for chunk in self._replay(entry):
+                yield chunk
+            return
+
+        response = self._factory()
+        if isinstance(response, Awaitable):
+            response = await response
+        start = time.monotonic()
+        chunks, offsets = [], []
+        finished = False
+        try:
+            async for chunk in response:
+                chunks.append(chunk.model_dump(mode="json"))
+                offsets.append(time.monotonic() - start)
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finished = True
+                yield chunk
+        finally:
+            await _close_response(response)
+        if finished:
+            self._cache.set(self.key, CacheEntry(chunks, offsets, time.time()))
+
+    async def _replay(self, entry: CacheEntry):
+        start = time.monotonic()
+        i = 0
+        async for chunk in logs_to_response(entry.chunks):
+            if self.pace is not None:
+                delay = entry.offsets[i] / self.pace - (time.monotonic() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            i += 1
+            yield chunk
+
+
+async def process_cached_response(
+        cache: CacheBackend,
+        key: str,
+        factory: StreamFactory,
+        content_func: Optional[Callable[[Any], Awaitable[None]]] = None,
+        funcs: Optional[List[Callable[[], Awaitable[None]]]] = None,
+        pace: Optional[float] = None,
+        **kwargs,
+) -> Tuple[Set[str], ChatCompletionMessage]:
+    """
+    Processes a response like `process_response`, replaying it from the cache if its request is cached (see
+    `CachedStream`).
+
+    :param cache: The cache
+    :param key: The key of the request (see `coalescing.request_key`)
+    :param factory: A function that requests the stream on a cache miss
+    :param content_func: The function to use for the assistant's text message
+    :param funcs: The functions to use when called by the assistant
+    :param pace: The speed of a replay, relative to the recorded timing (None to replay instantly)
+    :param kwargs: Additional arguments for `process_response`
+    :return: The result of `process_response`
+    """
+    stream = CachedStream(cache, key, factory, pace)
+    try:
+        return await process_response(stream, content_func, funcs, **kwargs)
+    finally:
+        await stream.aclose()
@@ -0,0 +1,226 @@
+import hashlib
+import json
+from asyncio import Future, Task, create_task, get_running_loop, wait, CancelledError
+from typing import Callable, Awaitable, Optional, List, Tuple, Set, Any, Dict
+
+from openai.types.chat import ChatCompletionChunk, ChatCompletionMessage
+
+from .stream_processing import StreamFactory, process_response, _close_response
+
+
+def _json_default(value: Any) -> Any:
+    if hasattr(value, "model_dump"):  # pydantic models (e.g. typed messages or tools)
+        return value.model_dump()
+    raise TypeError(f"Cannot hash a request parameter of type {type(value).__name__}")
+
+
+def request_key(**params) -> str:
+    """
+    Returns a canonical hash of a request's parameters: requests with the same parameters (in any order) have the
+    same key.
+
+    :param params: The parameters of the request (e.g. `model`, `messages`, `temperature`)
+    :return: The key of the request
+    """
+    data = json.dumps(params, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=_json_default)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class _Flight:
+    """
+    An upstream stream that is in flight, and the chunks it has produced so far.
+    """
+
+    def __init__(self, coalescer: "StreamCoalescer", key: str):
+        self.coalescer = coalescer
+        self.key = key
+        self.chunks: List[ChatCompletionChunk] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed: Future = get_running_loop().create_future()
+        self.task: Optional[Task] = None
+
+    def _notify(self) -> None:
+        changed = self.changed
+        self.changed = get_running_loop().create_future()
+        changed.set_result(None)
+
+    async def pump(self, factory: StreamFactory) -> None:
+        response = None
+        try:
+            response = factory()
+            if isinstance(response, Awaitable):
+                response = await response
+            async for chunk in response:
+                self.chunks.append(chunk)
+                self._notify()
+        except CancelledError:
+            self.error = ConnectionAbortedError("The upstream stream was cancelled")
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            self.coalescer._land(self)
+            if response is not None:
+                await _close_response(response)
+
+    def detach(self) -> None:
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.done:  # nobody is listening anymore
+            self.coalescer._land(self)
+            self.task.cancel()
+
+
+class CoalescedStream:
+    """
+    A subscription to a shared upstream stream. The chunks that the upstream has already produced are replayed first,
+    and then the live chunks follow.
+    """
+
+    def __init__(self, flight: _Flight, leader: bool):
+        self._flight = flight
+        self.leader = leader  # Whether this subscription has opened the upstream stream
+        self.replayed = len(flight.chunks)  # The number of chunks that were already produced when it joined
+        flight.subscribers += 1
+        self._gen = self._stream()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> ChatCompletionChunk:
+        return await self._gen.__anext__()
+
+    async def aclose(self) -> None:
+        """
+        Detaches from the upstream stream (which is closed when it has no subscribers left).
+        """
+        await self._gen.aclose()
+        if self._flight is not None:  # the stream was never iterated
+            self._detach()
+
+    def _detach(self) -> None:
+        flight, self._flight = self._flight, None
+        flight.detach()
+
+    async def _stream(self):
+        flight = self._flight
+        i = 0
+        try:
+            while True:
+                if i < len(flight.chunks):
+                    yield flight.chunks[i]
+                    i += 1
+                elif flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                else:
+                    await wait((flight.changed,))  # not cancelled with this subscriber, as it is shared
+        finally:
+            if self._flight is not None:
+                self._detach()
+
+
+class StreamCoalescer:
+    """
+    Coalesces identical in-flight streaming requests (single-flight): the first request opens the upstream stream, and
+    identical requests that arrive while it is in flight attach to it, instead of opening their own streams.
+
+    Each subscriber is a separate stream, so it gets its own handlers' invocations - and a subscriber that joins late
+    gets the chunks that were already produced replayed first. The upstream stream is closed once all of its
+    subscribers have detached. Once it has ended, the next identical request opens a new stream (this is not a cache).
+
+    Coalesce only requests whose response does not depend on who sent them (e.g. with `temperature=0`). The streams
+    must be async streams.
+
+    :Example:
+    ```python
+    coalescer = StreamCoalescer()  # shared by the whole process
+
+    stream = coalescer.create(client.chat.completions.create, model="gpt-4", messages=messages, stream=True)
+    try:
+        await process_response(stream, content_handler)
+    finally:
+        await stream.aclose()
+    ```
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.requests = 0  # The number of requests
+        self.upstreams = 0  # The number of upstream streams that were opened
+
+    @property
+    def coalesced(self) -> int:
+        """
+        The number of requests that were attached to an in-flight stream.
+        """
+        return self.requests - self.upstreams
+
+    @property
+    def inflight(self) -> int:
+        """
+        The number of upstream streams that are in flight.
+        """
+        return len(self._flights)
+
+    def stream(self, key: str, factory: StreamFactory) -> CoalescedStream:
+        """
+        Subscribes to the in-flight stream of a key, or opens it.
+        :param key: The key of the request (see `request_key`)
+        :param factory: A function that requests the stream (it may be a coroutine function). It is called only if
+            no stream of the key is in flight
+        :return: The subscriber's stream
+        """
+        self.requests += 1
+        flight = self._flights.get(key)
+        if flight is not None:
+            return CoalescedStream(flight, leader=False)
+
+        self.upstreams += 1
+        flight = self._flights[key] = _Flight(self, key)
+        stream = CoalescedStream(flight, leader=True)
+        flight.task = create_task(flight.pump(factory))
+        return stream
+
+    def create(self, create: Callable[..., Any], **params) -> CoalescedStream:
+        """
+        Requests a stream, coalesced with identical in-flight requests.
+        :param create: The function that requests the stream (e.g. `AsyncOpenAI().chat.completions.create`)
+        :param params: The parameters of the request
+        :return: The subscriber's stream
+        """
+        return self.stream(request_key(**params), lambda: create(**params))
+
+    def _land(self, flight: _Flight) -> None:
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+
+async def process_coalesced_response(
+        coalescer: StreamCoalescer,
+        key: str,
+        factory: StreamFactory,
+        content_func: Optional[Callable[[Any], Awaitable[None]]] = None,
+        funcs: Optional[List[Callable[[], Awaitable[None]]]] = None,
+        **kwargs,
+) -> Tuple[Set[str], ChatCompletionMessage]:
+    """
+    Processes a response like `process_response`, while coalescing it with identical in-flight requests (see
+    `StreamCoalescer`).
+
+    :param coalescer: The coalescer (shared by the requests that may be coalesced)
+    :param key: The key of the request (see `request_key`)
+    :param factory: A function that requests the stream
+    :param content_func: The function to use for the assistant's text message
+    :param funcs: The functions to use when called by the assistant
+    :param kwargs: Additional arguments for `process_response`
+    :return: The result of `process_response`
+    """
+    stream = coalescer.stream(key, factory)
+    try:
+        return await process_response(stream, content_func, funcs, **kwargs)
+    finally:
+        await stream.aclose()
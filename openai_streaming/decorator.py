@@ -1,13 +1,13 @@
 from collections.abc import AsyncGenerator
 from inspect import iscoroutinefunction, signature
-from typing import Generator, get_origin, Union, Optional, get_type_hints, Protocol, TypeVar, Callable
+from functools import partial
+from typing import Generator, get_origin, Union, Optional, get_type_hints, Protocol, TypeVar, Callable, Iterator, \
+    List, Dict, TYPE_CHECKING
 from typing import get_args
 
-from docstring_parser import parse
-from openai.types.beta import FunctionTool
-from openai.types.chat import ChatCompletionToolParam
-from openai.types.shared import FunctionDefinition
-from pydantic import create_model
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletionToolParam
+    from .fn_dispatcher import Prefetch
 
 
 class OpenAIStreamingFunction(Protocol):
@@ -15,7 +15,7 @@ class OpenAIStreamingFunction(Protocol):
     A Protocol that represents a function that can be used with OpenAI Streaming.
     """
 
-    openai_schema: ChatCompletionToolParam  # The OpenAI Schema for the function.
+    openai_schema: "ChatCompletionToolParam"  # The OpenAI Schema for the function.
 
     def __call__(self, *args, **kwargs):
         pass
@@ -24,13 +24,20 @@ class OpenAIStreamingFunction(Protocol):
 F = TypeVar('F', bound=Callable[..., any])
 
 
-def openai_streaming_function(func: F) -> OpenAIStreamingFunction:
+def openai_streaming_function(func: Optional[F] = None, *, prefetch: Optional[Dict[str, "Prefetch"]] = None) \
+        -> OpenAIStreamingFunction:
     """
     Decorator that creates an OpenAI Schema for your function, while support using Generators for Streaming.
     
     To document your function (so the model will know how to use it), simply use docstring.
     Using standard docstring styles will also allow you to document your argument's description
 
+    Sync functions are supported as well (e.g. for CPU-bound handlers), and are run in an executor. Their streamed
+    arguments should be annotated as `Iterator` instead of `AsyncGenerator`.
+
+    Streaming a non-string type (e.g. `AsyncGenerator[LineItem, None]`) declares an array argument, whose items are
+    validated and yielded one by one as soon as each of them is complete.
+
     :Example:
     ```python
     @openai_streaming_function
@@ -44,11 +51,53 @@ def openai_streaming_function(func: F) -> OpenAIStreamingFunction:
         pass
     ```
 
+    Prefetches start work speculatively, as soon as the arguments they depend on have been parsed (while the model is
+    still generating the rest of the call). The result of each prefetch is handed to the function as an awaitable,
+    in the parameter it is declared for (which is not part of the schema). If the stream is interrupted, the running
+    prefetches are cancelled.
+
+    :Example:
+    ```python
+    async def load_order(order_id: str) -> Order:
+        ...
+
+    @openai_streaming_function(prefetch={"order": Prefetch(load_order, ("order_id",))})
+    async def refund(order_id: str, reason: AsyncGenerator[str, None], order: Awaitable[Order]):
+        \"""
+        Refunds an order.
+
+        :param order_id: The order's id
+        :param reason: The reason for the refund
+        \"""
+        order = await order  # already loaded (or loading) while the reason was being generated
+    ```
+
     :param func: The function to convert
+    :param prefetch: The prefetches of the function, by the name of the parameter that receives each of them
     :return: Your function with additional attribute `openai_schema`
     """
-    if not iscoroutinefunction(func):
-        raise ValueError("openai_streaming only supports async functions.")
+    if func is None:
+        return partial(openai_streaming_function, prefetch=prefetch)
+
+    # imported here, so importing the package stays cheap (`openai` alone takes hundreds of milliseconds to import)
+    from docstring_parser import parse
+    from openai.types.beta import FunctionTool
+    from openai.types.shared import FunctionDefinition
+    from pydantic import create_model
+
+    is_async = iscoroutinefunction(func)
+    prefetch = prefetch or {}
+    if prefetch:
+        if not is_async:
+            raise ValueError("Prefetches are only supported for async functions")
+        params = signature(func).parameters
+        for name, p in prefetch.items():
+            if name not in params:
+                raise ValueError(f"Prefetch `{name}` is not a parameter of {func.__name__}")
+            for arg in p.args:
+                if arg not in params or arg in prefetch:
+                    raise ValueError(f"Prefetch `{name}` depends on `{arg}`, which is not an argument of "
+                                     f"{func.__name__}")
 
     type_hints = get_type_hints(func)
     for key, val in type_hints.items():
@@ -62,10 +111,14 @@ def openai_streaming_function(func: F) -> OpenAIStreamingFunction:
             val = args[0]
             args = get_args(val)
 
-        if get_origin(val) is get_origin(Generator):
+        if is_async and get_origin(val) is get_origin(Generator):
             raise ValueError("openai_streaming does not support `Generator` type, instead use `AsyncGenerator`.")
-        if get_origin(val) is AsyncGenerator:
+        if get_origin(val) is AsyncGenerator or (not is_async and get_origin(val) in (
+                get_origin(Generator), get_origin(Iterator))):
             val = args[0]
+            # streamed non-string values are the items of an array, which are yielded one by one
+            if val is not str:
+                val = List[val]
 
         if optional:
             val = Optional[val]
@@ -76,7 +129,7 @@ def openai_streaming_function(func: F) -> OpenAIStreamingFunction:
     fields = {
         param.name: (type_hints[param.name], ...)
         for param in signature(func).parameters.values()
-        if param.name in type_hints
+        if param.name in type_hints and param.name not in prefetch
     }
 
     # Create a Pydantic model dynamically
@@ -96,6 +149,7 @@ def openai_streaming_function(func: F) -> OpenAIStreamingFunction:
         if (name := param.arg_name) in parameters["properties"] and (description := param.description):
             parameters["properties"][name]["description"] = description
 
+    func.openai_prefetch = prefetch
     func.openai_schema = FunctionTool(type='function', function=FunctionDefinition(
         name=func.__name__,
         description=docstring.short_description,
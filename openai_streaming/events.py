@@ -0,0 +1,211 @@
+from typing import Optional, Any, Dict, List, Iterator, AsyncGenerator, Generator, Union, AsyncIterator
+
+from openai.types import CompletionUsage
+
+from .arguments_scanner import ArgumentsScanner
+from .stream_processing import OAIResponse
+
+
+class Event:
+    """
+    The base class of the stream's events.
+    """
+    __slots__ = ()
+
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other) and all(getattr(self, s) == getattr(other, s) for s in self.__slots__)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{s}={getattr(self, s)!r}" for s in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class ContentDelta(Event):
+    """
+    A fragment of the assistant's text message.
+    """
+    __slots__ = ("delta",)
+
+    def __init__(self, delta: str):
+        self.delta = delta
+
+
+class ToolCallStarted(Event):
+    """
+    The assistant has started calling a function.
+    """
+    __slots__ = ("index", "id", "name")
+
+    def __init__(self, index: int, id: Optional[str], name: str):
+        self.index = index  # The index of the tool call in the message
+        self.id = id  # The id of the tool call (None for legacy function calls)
+        self.name = name  # The name of the function
+
+
+class ArgumentDelta(Event):
+    """
+    A change of an argument of a function call: a fragment of a string, an item of an array, or a complete value
+    (of any other type).
+    """
+    __slots__ = ("index", "argument", "delta")
+
+    def __init__(self, index: int, argument: str, delta: Any):
+        self.index = index  # The index of the tool call
+        self.argument = argument  # The name of the argument
+        self.delta = delta
+
+
+class ArgumentCompleted(Event):
+    """
+    An argument of a function call is complete.
+    """
+    __slots__ = ("index", "argument")
+
+    def __init__(self, index: int, argument: str):
+        self.index = index  # The index of the tool call
+        self.argument = argument  # The name of the argument
+
+
+class ToolCallFinished(Event):
+    """
+    A function call is finished.
+    """
+    __slots__ = ("index", "id", "name", "arguments")
+
+    def __init__(self, index: int, id: Optional[str], name: str, arguments: str):
+        self.index = index  # The index of the tool call in the message
+        self.id = id  # The id of the tool call (None for legacy function calls)
+        self.name = name  # The name of the function
+        self.arguments = arguments  # The raw JSON arguments of the call
+
+
+class Finish(Event):
+    """
+    The stream has ended. This is always the last event.
+    """
+    __slots__ = ("finish_reason", "usage")
+
+    def __init__(self, finish_reason: Optional[str], usage: Optional[CompletionUsage] = None):
+        self.finish_reason = finish_reason  # The reason the model stopped generating (None if the stream was cut)
+        self.usage = usage  # The token usage (when requested with `stream_options={"include_usage": True}`)
+
+
+class _ToolCall:
+    __slots__ = ("index", "id", "name", "scanner", "parts")
+
+    def __init__(self, index: int, id: Optional[str], name: str):
+        self.index = index
+        self.id = id
+        self.name = name
+        self.scanner = ArgumentsScanner()
+        self.parts: List[str] = []
+
+
+class _EventsProcessor:
+    """
+    Converts the chunks of a stream to events.
+    """
+
+    def __init__(self):
+        self.calls: Dict[int, _ToolCall] = {}
+        self.finish_reason: Optional[str] = None
+        self.usage: Optional[CompletionUsage] = None
+
+    def process(self, chunk) -> Generator[Event, None, None]:
+        usage = getattr(chunk, "usage", None)
+        if usage is not None:
+            self.usage = usage
+        if not chunk.choices:  # e.g. the usage chunk
+            return
+
+        choice = chunk.choices[0]
+        delta = choice.delta
+        if delta is not None:
+            if delta.content:
+                yield ContentDelta(delta.content)
+            if delta.tool_calls:
+                for call in delta.tool_calls:
+                    if call.function is not None:
+                        yield from self._call_delta(call.index, call.id, call.function.name, call.function.arguments)
+            elif delta.function_call:
+                yield from self._call_delta(0, None, delta.function_call.name, delta.function_call.arguments)
+
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+
+    def _call_delta(self, index: int, id: Optional[str], name: Optional[str], arguments: Optional[str]) \
+            -> Generator[Event, None, None]:
+        call = self.calls.get(index)
+        if call is None:
+            yield from self._finish_calls()  # the previous calls have ended
+            call = self.calls[index] = _ToolCall(index, id, name or "")
+            yield ToolCallStarted(index, id, call.name)
+        if not arguments:
+            return
+
+        call.parts.append(arguments)
+        for argument, change in call.scanner.feed(arguments).items():
+            if isinstance(change, str):
+                yield ArgumentDelta(index, argument, change)
+                continue
+            for item in change:
+                yield ArgumentDelta(index, argument, item)
+            if change.complete:
+                yield ArgumentCompleted(index, argument)
+
+    def _finish_calls(self) -> Generator[Event, None, None]:
+        for call in self.calls.values():
+            yield ToolCallFinished(call.index, call.id, call.name, "".join(call.parts))
+        self.calls.clear()
+
+    def end(self) -> Generator[Event, None, None]:
+        yield from self._finish_calls()
+        yield Finish(self.finish_reason, self.usage)
+
+
+async def stream_events(response: OAIResponse) -> AsyncGenerator[Event, None]:
+    """
+    Iterates over the events of a stream: `ContentDelta`, `ToolCallStarted`, `ArgumentDelta`, `ArgumentCompleted`,
+    `ToolCallFinished` and finally `Finish`.
+
+    Unlike `process_response`, no tasks or queues are involved - the events are produced as the caller pulls them.
+    The arguments are scanned incrementally, and their changes have the same form as the arguments handed to the
+    functions of `process_response`: string fragments, array items, or complete values of any other type.
+
+    :Example:
+    ```python
+    async for event in stream_events(resp):
+        if isinstance(event, ContentDelta):
+            print(event.delta, end="")
+        elif isinstance(event, ArgumentDelta):
+            ...
+    ```
+
+    :param response: The response stream from OpenAI (async or sync)
+    :return: An async generator of the events
+    :raises ValueError: If the arguments of a function call are not a valid JSON object
+    """
+    processor = _EventsProcessor()
+    if isinstance(response, AsyncIterator) or isinstance(response, AsyncGenerator):
+        async for chunk in response:
+            for event in processor.process(chunk):
+                yield event
+    else:
+        for chunk in response:
+            for event in processor.process(chunk):
+                yield event
+    for event in processor.end():
+        yield event
+
+
+def iter_events(response: Union[OAIResponse, Iterator]) -> Iterator[Event]:
+    """
+    Iterates over the events of a sync stream (or a log). See `stream_events`.
+    :param response: The response stream from OpenAI (sync)
+    :return: An iterator of the events
+    :raises ValueError: If the arguments of a function call are not a valid JSON object
+    """
+    processor = _EventsProcessor()
+    for chunk in response:
+        yield from processor.process(chunk)
+    yield from processor.end()
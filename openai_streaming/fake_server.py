@@ -0,0 +1,190 @@
+import asyncio
+import json
+import random
+import time
+from typing import List, Optional, Dict, Any, Set
+
+
+class FakeOpenAIServer:
+    """
+    A local stand-in for OpenAI's chat completions API, that streams recorded or synthetic responses over real HTTP
+    and Server-Sent Events.
+
+    The streaming is shaped by a configurable latency (time to first token), token rate and jitter, and failures can
+    be injected: requests can fail with an HTTP 500 error, or be disconnected mid-stream.
+
+    :Example:
+    ```python
+    async with FakeOpenAIServer(logs=[log], token_rate=50) as server:
+        client = AsyncOpenAI(base_url=server.url, api_key="fake", max_retries=0)
+        resp = await client.chat.completions.create(model="gpt-4", messages=[...], stream=True)
+        await process_response(resp, content_handler)
+    ```
+    """
+
+    def __init__(
+            self,
+            logs: Optional[List[List[Dict[str, Any]]]] = None,
+            tokens: int = 50,
+            latency: float = 0.0,
+            token_rate: Optional[float] = None,
+            jitter: float = 0.0,
+            failure_rate: float = 0.0,
+            disconnect_rate: float = 0.0,
+            seed: Optional[int] = None,
+            host: str = "127.0.0.1",
+            port: int = 0,
+    ):
+        """
+        :param logs: Recorded streams (lists of chunks, as dicts) to replay, in turns. If not set, a synthetic stream
+            of `tokens` tokens is generated
+        :param tokens: The number of tokens of the synthetic streams
+        :param latency: The time (in seconds) before the first chunk
+        :param token_rate: The number of chunks per second (unlimited if not set)
+        :param jitter: The relative random variation of the latency and of the delay between chunks (0.2 for ±20%)
+        :param failure_rate: The probability of a request to fail with an HTTP 500 error
+        :param disconnect_rate: The probability of a stream to be disconnected halfway
+        :param seed: The seed of the random generator
+        :param host: The host to listen on
+        :param port: The port to listen on (0 for an arbitrary free port)
+        """
+        self.logs = logs
+        self.tokens = tokens
+        self.latency = latency
+        self.token_rate = token_rate
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.disconnect_rate = disconnect_rate
+        self.host = host
+        self.port = port
+
+        self._random = random.Random(seed)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.Task] = set()
+        self._writers: Set[asyncio.StreamWriter] = set()
+
+        self.requests = 0  # The number of streaming requests that were served (not the rejected or failed ones)
+        self.failures = 0  # The number of requests that failed with an error
+        self.disconnects = 0  # The number of streams that were disconnected halfway
+
+    @property
+    def url(self) -> str:
+        """
+        The base URL of the server (to be used as the `base_url` of the OpenAI client).
+        """
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in self._writers:  # idle keep-alive connections
+                writer.close()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "FakeOpenAIServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    def _vary(self, delay: float) -> float:
+        if not self.jitter:
+            return delay
+        return max(delay * (1 + self._random.uniform(-self.jitter, self.jitter)), 0.0)
+
+    def _synthetic(self, model: str) -> List[Dict[str, Any]]:
+        def chunk(delta: dict, finish_reason: Optional[str] = None) -> Dict[str, Any]:
+            return {
+                "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}],
+            }
+
+        return ([chunk({"role": "assistant", "content": ""})]
+                + [chunk({"content": f"token{i} "}) for i in range(self.tokens)]
+                + [chunk({}, "stop")])
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(asyncio.current_task())
+        self._writers.add(writer)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = lines[0].split(" ", 2)
+                headers = {k.strip().lower(): v.strip() for k, v in
+                           (line.split(":", 1) for line in lines[1:] if ":" in line)}
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if not await self._respond(method, path, body, writer):
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            self._writers.discard(writer)
+            self._connections.discard(asyncio.current_task())
+
+    async def _respond(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> bool:
+        """
+        Responds to a request.
+        :return: Whether the connection can be kept alive
+        """
+        if method != "POST" or not path.rstrip("/").endswith("/chat/completions"):
+            await self._error(writer, 404, "Not found")
+            return True
+
+        request = json.loads(body or b"{}")
+        if not request.get("stream"):
+            await self._error(writer, 400, "Only streaming requests are supported")
+            return True
+
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            self.failures += 1
+            await self._error(writer, 500, "Injected failure")
+            return True
+
+        self.requests += 1  # only the streams that are served take turns in the logs
+        if self.logs:
+            log = self.logs[(self.requests - 1) % len(self.logs)]
+        else:
+            log = self._synthetic(request.get("model", "gpt-4"))
+
+        writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\ncache-control: no-cache\r\n"
+                     b"transfer-encoding: chunked\r\n\r\n")
+        disconnect_at = len(log) // 2 if self.disconnect_rate and self._random.random() < self.disconnect_rate \
+            else None
+
+        await asyncio.sleep(self._vary(self.latency))
+        for i, chunk in enumerate(log):
+            if i == disconnect_at:
+                self.disconnects += 1
+                await writer.drain()
+                writer.transport.abort()
+                return False
+            if i and self.token_rate:
+                await asyncio.sleep(self._vary(1 / self.token_rate))
+            self._write_chunk(writer, f"data: {json.dumps(chunk)}\n\n".encode())
+            await writer.drain()
+
+        self._write_chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return True
+
+    @staticmethod
+    def _write_chunk(writer: asyncio.StreamWriter, data: bytes) -> None:
+        writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    @staticmethod
+    async def _error(writer: asyncio.StreamWriter, status: int, message: str) -> None:
+        body = json.dumps({"error": {"message": message, "type": "server_error", "code": None}}).encode()
+        reason = {400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\ncontent-type: application/json\r\n"
+                     f"content-length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
@@ -1,23 +1,338 @@
-from asyncio import Queue, gather, create_task
+import atexit
+import queue
+from asyncio import Queue, gather, create_task, get_running_loop, Future
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
 from inspect import getfullargspec, signature, iscoroutinefunction
-from typing import Callable, List, Dict, Tuple, Union, Optional, Set, AsyncGenerator, get_origin, get_args, Type
+from typing import Callable, List, Dict, Tuple, Union, Optional, Set, AsyncGenerator, get_origin, get_args, \
+    Iterator, Generator, NamedTuple, Awaitable, Any, FrozenSet, Iterable
+from weakref import WeakKeyDictionary
 
-from pydantic import ValidationError
+from pydantic import ValidationError, TypeAdapter, InstanceOf
+from pydantic.errors import PydanticSchemaGenerationError
 
+from .scheduler import Scheduler, get_default_scheduler
 
-async def _generator_from_queue(q: Queue) -> AsyncGenerator:
+_manager = None
+
+
+class StreamInterrupted(Exception):
     """
-    Converts a queue to a generator.
-    :param q: The queue to convert
-    :return: A generator that yields values from the queue
+    Raised when the stream was interrupted before its end (e.g. a deadline has expired).
+
+    The functions are notified by raising the exception from their arguments' generators (after the values that were
+    already received), and they are awaited before the exception is raised to the caller. A function that does not
+    handle the notification is stopped silently.
     """
-    while True:
-        value = await q.get()
-        if value is None:  # Sentinel value to signal the end
-            break
-        yield value
 
-    q.task_done()
+    invoked: Optional[Set[str]] = None  # The function names that were invoked before the interruption
+    result = None  # The partial result of the processing
+
+
+class InvalidArguments(ValueError):
+    """
+    Raised when the model has called a function with invalid arguments.
+
+    Only the invalid call is stopped: its function is notified by raising the exception from its arguments' generators
+    (after the values that were already received), and the rest of the stream (including the other calls of the same
+    function) is processed normally. The exception is raised to the caller once all the functions have finished.
+    It is a `ValueError`, like the error an unexpected argument used to raise.
+    """
+
+    invoked: Optional[Set[str]] = None  # The function names that were invoked
+    rejected: Optional[List["InvalidArguments"]] = None  # All the invalid calls of the response
+    result = None  # The result of the processing
+
+    def __init__(self, func: str, arg: str, errors: List[Dict[str, Any]], call: int = 0):
+        """
+        :param func: The name of the function
+        :param arg: The name of the invalid argument
+        :param errors: The validation errors (like pydantic's `ValidationError.errors()`, located from the argument)
+        :param call: The index of the call among the calls of the function in the response
+        """
+        super().__init__(func, arg, errors, call)
+        self.func = func
+        self.arg = arg
+        self.errors = errors
+        self.call = call
+
+    def __str__(self) -> str:
+        details = "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in self.errors)
+        return f"Invalid arguments for function {self.func}: {details}"
+
+
+class Channel:
+    """
+    A lightweight single-producer/single-consumer async channel.
+
+    Like `asyncio.Queue`, it hands the values over by reference. Unlike it, the consumer is woken up only when it is
+    actually waiting for a value, and there is no capacity bookkeeping and no sentinel values: the producer calls
+    `close()` to signal the end of the stream.
+    """
+
+    __slots__ = ('_items', '_waiter', '_closed', 'error')
+
+    def __init__(self):
+        self._items = deque()
+        self._waiter: Optional[Future] = None
+        self._closed = False
+        self.error: Optional[BaseException] = None
+
+    def send(self, value) -> None:
+        """
+        Sends a value to the consumer. Never blocks.
+        :param value: The value to send
+        """
+        self._items.append(value)
+        self._wakeup()
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        """
+        Closes the channel. The consumer will receive the pending values, and then stop.
+        :param error: An optional error to raise to the consumer (after the pending values), instead of stopping
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self.error = error
+        self._wakeup()
+
+    def _wakeup(self) -> None:
+        waiter = self._waiter
+        if waiter is not None:
+            self._waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def __aiter__(self) -> AsyncGenerator:
+        items = self._items
+        while True:
+            while items:
+                yield items.popleft()
+            if self._closed:
+                if self.error is not None:
+                    raise self.error
+                return
+            self._waiter = get_running_loop().create_future()
+            await self._waiter
+
+
+class StreamedItems(list):
+    """
+    A list of values of an argument, which are sent to the function one by one (instead of as a single value).
+    When `complete` is set, the argument's stream is closed after sending them. When `array` is set, the values are the
+    items of an array (rather than a single value, or the end of a string).
+    """
+
+    def __init__(self, items=(), complete: bool = False, array: bool = False):
+        super().__init__(items)
+        self.complete = complete
+        self.array = array
+
+
+class CallArguments(dict):
+    """
+    The changes of the arguments of a function call. When `complete` is set, the call is complete: its arguments that
+    were not sent are ended, and the next changes of the function belong to a new call.
+    """
+
+    def __init__(self, args=(), complete: bool = False):
+        super().__init__(args)
+        self.complete = complete
+
+
+class _QueueError:
+    """
+    Carries an error through a queue, to be raised by the `QueueIterator`.
+    """
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class _QueueEnd:
+    """
+    Marks the end of a queue. Values (including `None`) can't be mistaken for it, and it is pickled by reference, so
+    it is the same object in other processes.
+    """
+
+    def __reduce__(self):
+        return "_QUEUE_END"
+
+
+_QUEUE_END = _QueueEnd()
+
+
+class QueueIterator:
+    """
+    A thread-safe (and picklable) iterator over a queue, used to stream arguments to sync functions that run in an
+    executor. It yields values as they are put in the queue, until the end of the queue is received.
+    """
+
+    def __init__(self, q):
+        self._q = q
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        value = self._q.get()
+        if value is _QUEUE_END:
+            self._done = True
+            raise StopIteration
+        if isinstance(value, _QueueError):
+            self._done = True
+            raise value.error
+        return value
+
+
+class _SyncChannel:
+    """
+    Wraps a thread-safe queue with the `Channel` interface, so the reading coroutine can feed both async and sync
+    functions the same way.
+    """
+
+    __slots__ = ('q', 'closed', 'error')
+
+    def __init__(self, q):
+        self.q = q
+        self.closed = False
+        self.error: Optional[BaseException] = None
+
+    def send(self, value) -> None:
+        self.q.put(value)
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.error = error
+        self.q.put(_QUEUE_END if error is None else _QueueError(error))
+
+    def __iter__(self) -> Iterator:
+        return QueueIterator(self.q)
+
+
+def _thread_safe_queue(executor: Optional[Executor]):
+    """
+    Creates a queue that can be consumed from the given executor.
+    :param executor: The executor the consumer runs in (`None` for the loop's default thread pool)
+    :return: A thread-safe queue, or a managed queue if the executor runs in other processes (the manager's process is
+        started on first use, and shut down when the interpreter exits)
+    """
+    global _manager
+    if isinstance(executor, ProcessPoolExecutor):
+        if _manager is None:
+            from multiprocessing import Manager
+            _manager = Manager()
+            atexit.register(_manager.shutdown)
+        return _manager.Queue()
+    return queue.Queue()
+
+
+class Prefetch(NamedTuple):
+    """
+    A speculative prefetch of a function: the `callback` is called with the values of `args` as soon as they have
+    been parsed (before the rest of the call has been generated), and its result is handed to the function.
+    """
+    callback: Callable[..., Awaitable[Any]]  # A coroutine function that receives the arguments' values
+    args: Tuple[str, ...]  # The names of the arguments to wait for
+
+
+class _Prefetcher:
+    """
+    Runs the prefetches of a function call, as soon as their arguments are complete.
+    """
+
+    def __init__(self, prefetch: Dict[str, Prefetch], arrays: FrozenSet[str]):
+        loop = get_running_loop()
+        self.prefetch = prefetch
+        self.arrays = arrays
+        self.futures: Dict[str, Future] = {name: loop.create_future() for name in prefetch}
+        self.tasks: Dict[str, Future] = {}
+        self.watched = {arg for p in prefetch.values() for arg in p.args}
+        self.values: Dict[str, list] = {}
+        self.completed: Set[str] = set()
+        self.abandoned = False
+
+    def feed(self, arg: str, item) -> None:
+        if arg in self.watched:
+            self.values.setdefault(arg, []).append(item)
+
+    def complete(self, arg: str) -> None:
+        self.completed.add(arg)
+        for name, p in self.prefetch.items():
+            if self.completed.issuperset(p.args):
+                self._start(name)
+
+    def _start(self, name: str) -> None:
+        if name in self.tasks or self.abandoned:
+            return
+        p = self.prefetch[name]
+        task = self.tasks[name] = create_task(p.callback(**{a: self._value(a) for a in p.args}))
+        task.add_done_callback(partial(_chain_future, self.futures[name]))
+
+    def _value(self, arg: str):
+        items = self.values.get(arg, [])
+        if arg in self.arrays:
+            return items
+        if items and all(isinstance(item, str) for item in items):
+            return "".join(items)
+        return items[-1] if items else None
+
+    def finish(self, error: Optional[BaseException], complete: bool = True) -> None:
+        """
+        Ends the call. If it has ended normally, the prefetches that are still waiting for their arguments are started
+        with the values that were received (`None` for missing arguments). If it was cut off before its arguments were
+        complete (e.g. by the length limit), only the prefetches that have started keep running, and the others fail -
+        they are not started with partial values. Otherwise, the speculative work is abandoned: the running prefetches
+        are cancelled, and the functions receive the error from their prefetches.
+        :param error: The error that has ended the stream, if any
+        :param complete: Whether the call has ended with all its arguments
+        """
+        cut_off = error is None and not complete
+        if error is None and complete:
+            for name in self.prefetch:
+                self._start(name)
+            return
+        if cut_off:
+            error = StreamInterrupted("The call has ended before the arguments of its prefetch were complete")
+        else:
+            for task in self.tasks.values():
+                task.cancel()
+        for name, future in self.futures.items():
+            if not future.done() and not (cut_off and name in self.tasks):
+                future.set_exception(error)
+                future.exception()  # the function may never await it, and that's fine
+
+    def abandon(self) -> None:
+        """
+        Called once the function has returned: the prefetches it has not awaited are cancelled (or never started), and
+        the errors of the failed ones are retrieved, so they are not reported as unhandled.
+        """
+        self.abandoned = True
+        for task in self.tasks.values():
+            task.cancel()
+        for future in self.futures.values():
+            if not future.done():
+                future.cancel()
+            elif not future.cancelled():
+                future.exception()
+
+
+def _chain_future(future: Future, task: Future) -> None:
+    if future.done():
+        return
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
 
 
 def o_func(func):
@@ -36,111 +351,448 @@ def o_func(func):
     return func
 
 
-async def _invoke_function_with_queues(func: Callable, queues: Dict, self: Optional = None) -> None:
+class _FunctionSpec(NamedTuple):
+    is_async: bool
+    takes_self: bool
+    args: Tuple[str, ...]
+    validators: Dict[str, Callable[[Any], Any]]  # The validators of the arguments' values (or of their items)
+    text: FrozenSet[str]  # The arguments whose string fragments are streamed as they are (without validation)
+    arrays: FrozenSet[str]  # The arguments that are arrays (streamed item by item)
+    prefetch: Dict[str, Prefetch]  # The prefetches of the function, by the name of the argument that receives them
+
+
+def _unwrap_optional(annotation) -> Tuple[Any, bool]:
+    args = get_args(annotation)
+    if get_origin(annotation) is Union and len(args) == 2 and args[1] is type(None):
+        return args[0], True
+    return annotation, False
+
+
+def _compile_validator(annotation) -> Optional[Callable[[Any], Any]]:
+    """
+    Compiles the validator of an annotation once, so values are validated without rebuilding it.
+    :return: The validator, or None if the annotation cannot be validated
+    """
+    try:
+        return TypeAdapter(annotation).validate_python
+    except PydanticSchemaGenerationError:
+        pass
+    if isinstance(annotation, type):
+        return TypeAdapter(InstanceOf[annotation]).validate_python  # fallback to an instance check
+    return None
+
+
+# The specs by the underlying functions. They are held weakly, so per-request callables (closures, bound methods of
+# short-lived objects) are released with their functions.
+_specs: "WeakKeyDictionary[Callable, _FunctionSpec]" = WeakKeyDictionary()
+
+
+def _function_spec(func: Callable) -> _FunctionSpec:
+    """
+    Inspects a function once, and returns the details needed to dispatch it.
+    :param func: The function to inspect
+    :return: The function's spec
+    """
+    key = o_func(func)
+    key = getattr(key, "__func__", key)  # the bound methods of a function share its spec
+    try:
+        return _specs[key]
+    except KeyError:
+        spec = _inspect_function(func)
+    except TypeError:
+        return _inspect_function(func)  # not weakly referenceable, so not cached
+    _specs[key] = spec
+    return spec
+
+
+def _inspect_function(func: Callable) -> _FunctionSpec:
+    spec = getfullargspec(o_func(func))
+    prefetch = getattr(o_func(func), "openai_prefetch", None) or {}
+    takes_self = len(spec.args) > 0 and spec.args[0] == "self"
+    args = tuple(arg for arg in spec.args[1 if takes_self else 0:] if arg not in prefetch)
+
+    # Arrays are streamed item by item, so we validate their items
+    validators = {}
+    text = set()
+    arrays = set()
+    for arg in args:
+        if arg not in spec.annotations:
+            text.add(arg)
+            continue
+        a, optional = _unwrap_optional(spec.annotations[arg])
+        if get_origin(a) in (get_origin(AsyncGenerator), get_origin(Iterator), get_origin(Generator)):
+            a = get_args(a)[0]
+            if a is not str:
+                arrays.add(arg)
+        elif get_origin(a) is list and get_args(a):
+            a = get_args(a)[0]
+            arrays.add(arg)
+        if a in (str, Any) and arg not in arrays:
+            text.add(arg)
+        validator = _compile_validator(Optional[a] if optional else a)
+        if validator is not None:
+            validators[arg] = validator
+
+    return _FunctionSpec(iscoroutinefunction(o_func(func)), takes_self, args, validators, frozenset(text),
+                         frozenset(arrays), prefetch)
+
+
+def _validate(spec: _FunctionSpec, call: Tuple[str, int], arg: str, value):
+    """
+    Validates a complete value (or an item) of an argument of a call.
+    :return: The validated value
+    :raises InvalidArguments: If the value is invalid
     """
-    Invokes a function with arguments from queues.
+    validator = spec.validators.get(arg)
+    if validator is None:
+        return value
+    try:
+        return validator(value)
+    except ValidationError as e:
+        errors = e.errors(include_url=False)
+        for error in errors:
+            error["loc"] = (arg,) + tuple(error["loc"])
+        raise InvalidArguments(call[0], arg, errors, call[1]) from None
+
+
+async def _invoke_function_with_queues(
+        func: Callable,
+        queues: Dict,
+        self: Optional = None,
+        executor: Optional[Executor] = None,
+        prefetcher: Optional[_Prefetcher] = None,
+) -> None:
+    """
+    Invokes a function with arguments from channels.
+    Sync functions are invoked in the executor, and receive their arguments as thread-safe iterators.
+
     :param func: The function to invoke
-    :param queues: A dictionary of argument names with their values queues
+    :param queues: A dictionary of argument names with their values channels
     :param self: An optional self argument to pass to the function
+    :param executor: The executor to run sync functions in (`None` for the loop's default thread pool)
+    :param prefetcher: The prefetcher of the call, whose futures are handed to the function (and abandoned once it
+        returns)
     :return: void
     """
-    args = {arg: _generator_from_queue(queues[arg]) for arg in getfullargspec(o_func(func)).args if arg in queues}
+    is_async = _function_spec(func).is_async
+    args = {arg: ch.__aiter__() if is_async else iter(ch) for arg, ch in queues.items()}
+    prefetched = prefetcher.futures if prefetcher is not None else {}
+    args.update(prefetched)
     if "self" in signature(func).parameters.keys() and self is not None:
         args['self'] = self
 
-    await func(**args)
+    try:
+        if is_async:
+            await func(**args)
+        else:
+            await get_running_loop().run_in_executor(executor, partial(func, **args))
+    except (StreamInterrupted, InvalidArguments) as e:
+        # the function did not handle the notification (an invalid call is reported to the caller by the reader)
+        errors = [ch.error for ch in queues.values()] + \
+            [f.exception() for f in prefetched.values() if f.done() and not f.cancelled()]
+        if not any(_same_error(e, error) for error in errors):
+            raise
+    finally:
+        if prefetcher is not None:
+            prefetcher.abandon()
+
+
+def _same_error(e: BaseException, other: Optional[BaseException]) -> bool:
+    # errors that were raised in other processes are copies of the original one
+    return e is other or (other is not None and type(e) is type(other) and e.args == other.args)
+
+
+CallKey = Tuple[str, int]  # The name of a function, and the index of the call among the calls of the function
 
 
 async def _read_stream(
         gen: Callable[[], AsyncGenerator[Tuple[str, Dict], None]],
         dict_preprocessor: Optional[Callable[[str, Dict], Dict]],
-        args_queues: Dict[str, Dict[str, Queue]],
-        args_types: Dict[str, Dict[str, Type]],
-        yielded_functions: Queue[Optional[str]],
-) -> None:
+        func_map: Dict[str, Callable],
+        args_queues: Dict[CallKey, Dict[str, Union[Channel, _SyncChannel]]],
+        yielded_functions: Queue[Optional[CallKey]],
+        executor: Optional[Executor] = None,
+        prefetchers: Optional[Dict[CallKey, _Prefetcher]] = None,
+        middleware: Optional[Any] = None,
+        rejected: Optional[List[InvalidArguments]] = None,
+) -> Optional[StreamInterrupted]:
     """
-    Reads from a generator and puts the values in the queues per function per argument.
+    Reads from a generator and sends the values to the channels per function call per argument.
+    The channels of a call are created only when the call starts, and each call is dispatched on its own.
+    If the generator is interrupted, the channels are closed with the interruption, so the functions are notified.
+    The values are validated by the functions' annotations: fragments of string arguments are passed as they are, and
+    other values are validated (and delivered) once they are complete. An invalid call is recorded in `rejected`, and
+    its channels are closed with the `InvalidArguments` error, while the rest of the stream is read normally.
+    The prefetches of a call are started as soon as their arguments are complete.
 
     :param gen: A generator that yields function names and a dictionary of arguments
     :param dict_preprocessor: A function that takes a function name and a dictionary of arguments and returns a new
         dictionary of arguments
-    :param args_queues: A dictionary of function names to dictionaries of argument names to queues of values
-    :param args_types: A dictionary of function names to a dictionaries of argument names to their type
-    :param yielded_functions: A queue of function names that were yielded
-    :return: void
+    :param func_map: A dictionary of function names to their functions
+    :param args_queues: A dictionary of calls to dictionaries of argument names to channels of values. It is populated
+        as calls start
+    :param yielded_functions: A queue of the calls that have started
+    :param executor: The executor sync functions run in
+    :param prefetchers: A dictionary of calls to their prefetchers. It is populated as calls (of functions that declare
+        prefetches) start
+    :param middleware: A `MiddlewareChain` to run on the arguments (after the preprocessor, before the validation)
+    :param rejected: A list to record the invalid calls in
+    :return: The interruption of the generator, if it was interrupted
     """
 
-    yielded_functions_set = set()
-    async for func_name, args_dict in gen():
-        if func_name not in yielded_functions_set:
-            await yielded_functions.put(func_name)
-            yielded_functions_set.add(func_name)
+    if prefetchers is None:
+        prefetchers = {}
+    if rejected is None:
+        rejected = []
+    run = middleware.start() if middleware is not None else None
+    interrupted = None
+    error: Optional[BaseException] = StreamInterrupted("The stream has failed")
+    calls = _Calls(prefetchers, rejected)
+    active: Dict[str, CallKey] = {}  # The open call of each function
+    counts: Dict[str, int] = {}  # The number of calls of each function
+    specs: Dict[str, _FunctionSpec] = {}  # The specs of the functions that were called, by their names
 
-        if dict_preprocessor is not None:
-            args_dict = dict_preprocessor(func_name, args_dict)
-        args = args_dict.items()
-        for arg_name, value in args:
-            if func_name not in args_queues:
+    def read(func_name: str, args_dict: Dict, released: bool = False) -> None:
+        spec = specs.get(func_name)
+        if spec is None:
+            if func_name not in func_map:
                 raise ValueError(f"Function {func_name} was not registered")
-            if arg_name not in args_queues[func_name]:
-                raise ValueError(f"Argument {arg_name} was not registered for function {func_name}")
-            if arg_name in args_types[func_name] and type(value) is not args_types[func_name][arg_name]:
-                raise ValidationError(f"Got invalid value type for argument `{arg_name}`")
-            await args_queues[func_name][arg_name].put(value)
+            spec = specs[func_name] = _function_spec(func_map[func_name])
+        call = active.get(func_name)
+        if call is None:
+            call = active[func_name] = (func_name, counts.get(func_name, 0))
+            counts[func_name] = call[1] + 1
+            if spec.is_async:
+                args_queues[call] = {arg: Channel() for arg in spec.args}
+            else:
+                args_queues[call] = {arg: _SyncChannel(_thread_safe_queue(executor)) for arg in spec.args}
+            if spec.prefetch:
+                prefetchers[call] = _Prefetcher(spec.prefetch, spec.arrays)
+            yielded_functions.put_nowait(call)  # the queue is unbounded
+        channels = args_queues[call]
+        prefetcher = prefetchers.get(call)
+
+        if dict_preprocessor is not None and not released:
+            args_dict = dict_preprocessor(func_name, args_dict)
+        complete = getattr(args_dict, "complete", False)
+        if run is not None and not released:  # the middleware stages run here, in a single pass (no extra generator)
+            args_dict = run(func_name, args_dict, spec.arrays)
+        if call not in calls.invalid:  # otherwise, it is the rest of an invalid call
+            try:
+                for arg_name, value in args_dict.items():
+                    channel = channels.get(arg_name)
+                    if channel is None:
+                        raise InvalidArguments(func_name, arg_name, [
+                            {"type": "unexpected_argument", "loc": (arg_name,), "msg": "Unexpected argument",
+                             "input": value}], call[1])
+                    if type(value) is str and arg_name in spec.text:  # a fragment of a string that is streaming
+                        channel.send(value)
+                        if prefetcher is not None:
+                            prefetcher.feed(arg_name, value)
+                        continue
+                    for item in calls.complete_values(spec, call, arg_name, value):
+                        channel.send(item)
+                        if prefetcher is not None:
+                            prefetcher.feed(arg_name, item)
+                    if isinstance(value, StreamedItems):
+                        if value.complete:
+                            channel.close()
+                            if prefetcher is not None:
+                                prefetcher.complete(arg_name)
+                    elif prefetcher is not None and type(value) is not str:
+                        prefetcher.complete(arg_name)  # a plain value is whole
+            except InvalidArguments as e:
+                calls.reject(call, e, channels)
+        if complete:
+            del active[func_name]
+            calls.end(spec, call, channels)
 
-    await yielded_functions.put(None)
-    for func_name in args_queues:
-        for arg_name in args_queues[func_name]:
-            await args_queues[func_name][arg_name].put(None)
+    try:
+        try:
+            async for func_name, args_dict in gen():
+                read(func_name, args_dict)
+        except StreamInterrupted as e:
+            interrupted = e
+        if run is not None:  # release what the stages have held back, even if the stream was interrupted
+            for func_name, args_dict in run.finish():
+                read(func_name, args_dict, released=True)
+        error = interrupted
+    finally:
+        for call in active.values():
+            if error is None:  # the calls end with the stream, and may have been cut off
+                calls.end(_function_spec(func_map[call[0]]), call, args_queues[call], complete=False)
+            elif call in prefetchers:
+                prefetchers[call].finish(error)
+        # always signal the end, so functions running in an executor are not left blocked on their arguments
+        await yielded_functions.put(None)
+        for channels in args_queues.values():
+            for ch in channels.values():
+                ch.close(interrupted)
+    return interrupted
+
+
+class _Calls:
+    """
+    The validation state of the calls of a stream: the parts of values that are validated once they are complete, and
+    the calls that were rejected.
+    """
+
+    def __init__(self, prefetchers: Dict[CallKey, _Prefetcher], rejected: List[InvalidArguments]):
+        self.prefetchers = prefetchers
+        self.rejected = rejected
+        self.invalid: Set[CallKey] = set()
+        self.pending: Dict[Tuple[CallKey, str], Union[str, list]] = {}
+
+    def complete_values(self, spec: _FunctionSpec, call: CallKey, arg: str, value) -> Iterable:
+        """
+        Returns the complete values of an argument to deliver, validated: a whole value, or the items of an array. The
+        parts of a value that is not complete yet (a string for an argument that is not text, or an array for an
+        argument that is not an array) are held until it is.
+        :raises InvalidArguments: If a value is invalid
+        """
+        key = (call, arg)
+        if type(value) is str:  # a fragment of a string, for an argument that is not text
+            if arg in spec.arrays:
+                raise _invalid(call, arg, "list_type", "Input should be a valid array", value)
+            self.pending[key] = self.pending.get(key, "") + value
+            return ()
+        if not isinstance(value, StreamedItems):  # a plain value (e.g. from a custom preprocessor)
+            return (_validate(spec, call, arg, value),)
+        if arg in spec.arrays:
+            if not value.array and any(item is not None for item in value):
+                raise _invalid(call, arg, "list_type", "Input should be a valid array", value[0])
+            return [_validate(spec, call, arg, item) for item in value if value.array]
+        if value.array:  # an array, for an argument that is validated as a whole
+            items = self.pending.pop(key, []) + value
+            if not value.complete:
+                self.pending[key] = items
+                return ()
+            return (_validate(spec, call, arg, items),)
+        text = self.pending.pop(key, None)
+        if text is not None:  # the end of a string, for an argument that is not text
+            return (_validate(spec, call, arg, text + "".join(value)),)
+        return [_validate(spec, call, arg, item) for item in value]
+
+    def reject(self, call: CallKey, error: InvalidArguments, channels: Dict) -> None:
+        """
+        Stops an invalid call: its function is notified, and the rest of its values are dropped.
+        """
+        self.invalid.add(call)
+        self.rejected.append(error)
+        for key in [key for key in self.pending if key[0] == call]:
+            del self.pending[key]
+        for ch in channels.values():
+            ch.close(error)
+        prefetcher = self.prefetchers.get(call)
+        if prefetcher is not None:
+            prefetcher.finish(error)
+
+    def end(self, spec: _FunctionSpec, call: CallKey, channels: Dict, complete: bool = True) -> None:
+        """
+        Ends a call: the values that are still held are validated and delivered, and its arguments are closed.
+        :param complete: Whether the call has ended with all its arguments (or was cut off with the stream)
+        """
+        if call in self.invalid:
+            return
+        prefetcher = self.prefetchers.get(call)
+        try:
+            for key in [key for key in self.pending if key[0] == call]:
+                value = self.pending.pop(key)
+                value = _validate(spec, call, key[1], value)
+                channels[key[1]].send(value)
+                if prefetcher is not None:
+                    prefetcher.feed(key[1], value)
+                    if complete:
+                        prefetcher.complete(key[1])
+        except InvalidArguments as e:
+            self.reject(call, e, channels)
+            return
+        for ch in channels.values():
+            ch.close()
+        if prefetcher is not None:
+            prefetcher.finish(None, complete)
+
+
+def _invalid(call: CallKey, arg: str, typ: str, msg: str, value) -> InvalidArguments:
+    return InvalidArguments(call[0], arg, [{"type": typ, "loc": (arg,), "msg": msg, "input": value}], call[1])
 
 
 async def _dispatch_yielded_function_coroutines(
-        q: Queue[Optional[str]],
+        q: Queue[Optional[CallKey]],
         func_map: Dict[str, Callable],
-        args_queues: Dict[str, Dict],
+        args_queues: Dict[CallKey, Dict],
         self: Optional = None,
+        executor: Optional[Executor] = None,
+        prefetchers: Optional[Dict[CallKey, _Prefetcher]] = None,
+        scheduler: Optional[Scheduler] = None,
 ) -> Set[str]:
     """
-    Dispatches function invocation threads from a queue of function names.
-    This function is used to dynamically dispatch threads for functions that have been yielded from a generator.
+    Dispatches function invocation threads from a queue of function calls.
+    This function is used to dynamically dispatch threads for the calls that have been yielded from a generator.
+    With a scheduler, each invocation starts once the scheduler grants it a slot (its arguments are buffered until
+    then).
 
-    :param q: A queue of function names
+    :param q: A queue of function calls
     :param func_map: A dictionary of function names to their functions
-    :param args_queues: A dictionary of function names to dictionaries of argument names to queues of values
+    :param args_queues: A dictionary of calls to dictionaries of argument names to channels of values
     :param self: An optional self argument to pass to the functions
+    :param executor: The executor to run sync functions in
+    :param prefetchers: A dictionary of calls to their prefetchers
+    :param scheduler: The scheduler of the invocations, if any
     :return: A set of function names that were invoked
     """
 
     invoked = set()
     tasks = []
     while True:
-        func_name = await q.get()
-        if func_name is None:
+        call = await q.get()
+        if call is None:
             break
-        if func_name in invoked:
-            continue
 
-        tasks.append(create_task(_invoke_function_with_queues(func_map[func_name], args_queues[func_name], self)))
+        func_name = call[0]
+        prefetcher = prefetchers.get(call) if prefetchers is not None else None
+        invoke = partial(_invoke_function_with_queues, func_map[func_name], args_queues[call], self, executor,
+                         prefetcher)
+        tasks.append(create_task(invoke() if scheduler is None else _scheduled(scheduler, func_name, invoke)))
         invoked.add(func_name)
 
     await gather(*tasks)
     return invoked
 
 
+async def _scheduled(scheduler: Scheduler, func_name: str, invoke: Callable[[], Awaitable[Any]]) -> Any:
+    async with scheduler.slot(func_name):
+        return await invoke()
+
+
 async def dispatch_yielded_functions_with_args(
         gen: Callable[[], AsyncGenerator[Tuple[str, Dict], None]],
         funcs: Union[List[Callable], Dict[str, Callable]],
         dict_preprocessor: Optional[Callable[[str, Dict], Dict]],
-        self: Optional = None
+        self: Optional = None,
+        executor: Optional[Executor] = None,
+        middleware: Optional[Any] = None,
+        scheduler: Optional[Scheduler] = None,
 ) -> Set[str]:
     """
     Dispatches function calls from a generator that yields function names and arguments to the functions.
+    Async functions receive their arguments as async generators. Sync functions (e.g. CPU-bound handlers) are run in
+    the executor, and receive their arguments as thread-safe iterators.
+
     :param gen: The generator that yields function names and arguments
     :param funcs: The functions to dispatch to
     :param dict_preprocessor: A function that takes a function name and a dictionary of arguments and returns a new
         dictionary of arguments
     :param self: An optional self argument to pass to the functions
+    :param executor: The executor to run sync functions in. Defaults to the loop's default thread pool. When using a
+        `ProcessPoolExecutor`, the sync functions (and `self`) must be picklable
+    :param middleware: A `MiddlewareChain` to run on the arguments, after the preprocessor
+    :param scheduler: The scheduler of the invocations. Defaults to the process-wide scheduler (see
+        `set_default_scheduler`), if one is set
     :return: A set of function names that were invoked
+    :raises StreamInterrupted: If the generator was interrupted (after the invoked functions have finished)
+    :raises InvalidArguments: If a function was called with invalid arguments (after the invoked functions have
+        finished). The other calls are processed normally
     """
 
     if isinstance(funcs, dict):
@@ -149,33 +801,34 @@ async def dispatch_yielded_functions_with_args(
         func_map = {o_func(func).__name__: func for func in funcs}
 
     for func_name, func in func_map.items():
-        if not iscoroutinefunction(o_func(func)):
-            raise ValueError(f"Function {func_name} is not an async function")
+        if not callable(func):
+            raise ValueError(f"Function {func_name} is not callable")
+        if _function_spec(func).takes_self and self is None:
+            raise ValueError("self argument is required for functions that take self")
 
+    # Channels are created lazily, only for the calls that actually start
     args_queues = {}
-    args_types = {}
-    for func_name in func_map:
-        spec = getfullargspec(o_func(func_map[func_name]))
-        if len(spec.args) > 0 and spec.args[0] == "self" and self is None:
-            raise ValueError("self argument is required for functions that take self")
-        idx = 1 if len(spec.args) > 0 and spec.args[0] == "self" else 0
-        args_queues[func_name] = {arg: Queue() for arg in spec.args[idx:]}
-
-        # create type maps for validations
-        args_types[func_name] = {}
-        for arg in spec.args[idx:]:
-            if arg in spec.annotations:
-                a = spec.annotations[arg]
-                if get_origin(a) is get_origin(AsyncGenerator):
-                    a = get_args(a)[0]
-                args_types[func_name][arg] = a
+    prefetchers = {}
+    rejected: List[InvalidArguments] = []
 
     # Reading coroutine
     yielded_functions = Queue()
-    stream_processing = _read_stream(gen, dict_preprocessor, args_queues, args_types, yielded_functions)
+    stream_processing = _read_stream(gen, dict_preprocessor, func_map, args_queues, yielded_functions, executor,
+                                     prefetchers, middleware, rejected)
 
     # Dispatching thread per invoked function
-    dispatch_invokes = _dispatch_yielded_function_coroutines(yielded_functions, func_map, args_queues, self)
+    if scheduler is None:
+        scheduler = get_default_scheduler()
+    dispatch_invokes = _dispatch_yielded_function_coroutines(yielded_functions, func_map, args_queues, self, executor,
+                                                             prefetchers, scheduler)
 
-    _, invoked = await gather(stream_processing, dispatch_invokes)
+    interrupted, invoked = await gather(stream_processing, dispatch_invokes)
+    if interrupted is not None:
+        interrupted.invoked = invoked
+        raise interrupted
+    if rejected:
+        error = rejected[0]
+        error.invoked = invoked
+        error.rejected = rejected
+        raise error
     return invoked
@@ -0,0 +1,182 @@
+from asyncio import Task, create_task, wait, FIRST_COMPLETED
+from typing import Callable, Awaitable, Optional, List, Tuple, AsyncIterator, Set, Any
+
+from openai.types.chat import ChatCompletionChunk, ChatCompletionMessage
+
+from .stream_processing import OAIResponse, StreamFactory, process_response, _close_response
+
+
+def _is_meaningful(chunk: ChatCompletionChunk) -> bool:
+    """
+    Whether a chunk carries a delta that the handlers would see (content or a function call), or ends the stream.
+    """
+    if not chunk.choices:
+        return False
+    choice = chunk.choices[0]
+    delta = choice.delta
+    return bool(delta.content or delta.function_call or delta.tool_calls or choice.finish_reason)
+
+
+class HedgedStream:
+    """
+    Races redundant streams of the same request, and commits to the first one that yields a meaningful delta.
+
+    The first stream is requested immediately. If it has not produced a meaningful delta within `hedge_after`
+    seconds, a backup stream is requested (and so on, up to `max_streams`). If every requested stream has failed
+    before producing a meaningful delta, a backup is requested right away. Once a stream wins, the others are closed,
+    and only the winner's chunks are yielded - so the handlers see exactly one stream.
+
+    The streams must be async streams.
+
+    :Example:
+    ```python
+    stream = HedgedStream(lambda: client.chat.completions.create(..., stream=True), hedge_after=1.5)
+    await process_response(stream, content_handler, funcs=[error_message])
+    ```
+    """
+
+    def __init__(self, factory: StreamFactory, hedge_after: float = 1.0, max_streams: int = 2):
+        """
+        :param factory: A function that requests a new stream (it may be a coroutine function, like
+            `AsyncOpenAI().chat.completions.create`)
+        :param hedge_after: The time (in seconds) to wait for a meaningful delta before requesting a backup stream
+            (0 to race `max_streams` streams from the start)
+        :param max_streams: The maximum number of streams to request
+        """
+        if max_streams < 1:
+            raise ValueError("max_streams must be at least 1")
+
+        self._factory = factory
+        self.hedge_after = hedge_after
+        self.max_streams = max_streams
+
+        self.launched = 0  # The number of streams that were requested
+        self.winner: Optional[int] = None  # The index of the stream that won the race
+        self._response: Optional[OAIResponse] = None
+        self._gen = self._stream()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> ChatCompletionChunk:
+        return await self._gen.__anext__()
+
+    async def aclose(self) -> None:
+        """
+        Closes the stream (and every stream of the race that is still open).
+        """
+        await self._gen.aclose()
+
+    async def _open(self) -> Tuple[OAIResponse, AsyncIterator, List[ChatCompletionChunk]]:
+        """
+        Requests a stream, and reads it up to its first meaningful delta.
+        :return: The response, its iterator and the chunks that were read
+        """
+        response = self._factory()
+        if isinstance(response, Awaitable):
+            response = await response
+
+        buffered = []
+        try:
+            it = response.__aiter__()
+            while True:
+                try:
+                    chunk = await it.__anext__()
+                except StopAsyncIteration:
+                    break
+                buffered.append(chunk)
+                if _is_meaningful(chunk):
+                    break
+        except BaseException:
+            await _close_response(response)
+            raise
+        return response, it, buffered
+
+    def _launch(self, tasks: List[Task]) -> None:
+        tasks.append(create_task(self._open()))
+        self.launched += 1
+
+    async def _race(self) -> Tuple[OAIResponse, AsyncIterator, List[ChatCompletionChunk]]:
+        tasks: List[Task] = []
+        pending: Set[Task] = set()
+        won: Optional[Task] = None
+        error: Optional[BaseException] = None
+
+        try:
+            while True:
+                while self.launched < self.max_streams and (not pending or self.hedge_after <= 0):
+                    self._launch(tasks)
+                    pending.add(tasks[-1])
+
+                timeout = self.hedge_after if self.launched < self.max_streams else None
+                done, pending = await wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:  # the hedging threshold has passed
+                    self._launch(tasks)
+                    pending.add(tasks[-1])
+                    continue
+
+                for task in sorted(done, key=tasks.index):
+                    if task.exception() is None:
+                        won = task
+                        self.winner = tasks.index(task)
+                        return task.result()
+                    error = task.exception()
+
+                if not pending and self.launched >= self.max_streams:
+                    raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            try:
+                if pending:
+                    await wait(pending)  # unlike awaiting the tasks, this raises only if this task is cancelled
+            except BaseException:
+                won = None  # the race is abandoned, so its winner is closed too
+                raise
+            finally:
+                # Close every stream that has opened, but lost - including the ones that finished opening meanwhile
+                for task in tasks:
+                    if task is not won and task.done() and not task.cancelled() and task.exception() is None:
+                        await _close_response(task.result()[0])
+
+    async def _stream(self):
+        self._response, it, buffered = await self._race()
+        try:
+            for chunk in buffered:
+                yield chunk
+            del buffered
+            while True:
+                try:
+                    chunk = await it.__anext__()
+                except StopAsyncIteration:
+                    return
+                yield chunk
+        finally:
+            await _close_response(self._response)
+
+
+async def process_hedged_response(
+        factory: StreamFactory,
+        content_func: Optional[Callable[[Any], Awaitable[None]]] = None,
+        funcs: Optional[List[Callable[[], Awaitable[None]]]] = None,
+        hedge_after: float = 1.0,
+        max_streams: int = 2,
+        **kwargs,
+) -> Tuple[Set[str], ChatCompletionMessage]:
+    """
+    Processes a response like `process_response`, while hedging the request: redundant streams are raced, and the
+    fastest one is processed (see `HedgedStream`).
+
+    :param factory: A function that requests a new stream
+    :param content_func: The function to use for the assistant's text message
+    :param funcs: The functions to use when called by the assistant
+    :param hedge_after: The time (in seconds) to wait for a meaningful delta before requesting a backup stream
+    :param max_streams: The maximum number of streams to request
+    :param kwargs: Additional arguments for `process_response`
+    :return: The result of `process_response`
+    """
+    stream = HedgedStream(factory, hedge_after, max_streams)
+    try:
+        return await process_response(stream, content_func, funcs, **kwargs)
+    finally:
+        await stream.aclose()
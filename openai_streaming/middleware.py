@@ -0,0 +1,295 @@
+import re
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union, Pattern, Iterable, Set, AbstractSet
+
+from .fn_dispatcher import StreamedItems
+
+_HELD = object()
+
+
+class Middleware:
+    """
+    A stage of a `MiddlewareChain`, that transforms the values of the arguments between the parsing and the dispatch.
+
+    The stages are shared by the streams the chain is used for, so per-stream state is kept in the `state` dictionary
+    that is passed to them (a dictionary per stage, per stream).
+    """
+
+    text_only = False  # Whether the stage receives only the fragments of strings (and not array items or other values)
+
+    @property
+    def name(self) -> str:
+        """
+        The name of the stage (in the chain's timings).
+        """
+        return type(self).__name__
+
+    def process(self, state: Dict, func: str, arg: str, value: Any) -> Optional[Any]:
+        """
+        Transforms a value of an argument: a fragment of a string, an item of an array, or a complete value.
+        :param state: The stage's state for the stream
+        :param func: The name of the function (or the content function)
+        :param arg: The name of the argument
+        :param value: The value
+        :return: The transformed value. For a fragment of a string, an empty string holds it back (e.g. to look ahead)
+        """
+        return value
+
+    def end(self, state: Dict, func: str, arg: str) -> Optional[Any]:
+        """
+        Called when an argument has ended, to release what the stage has held back.
+        :param state: The stage's state for the stream
+        :param func: The name of the function
+        :param arg: The name of the argument
+        :return: A last value of the argument, or None
+        """
+        return None
+
+
+class TextMiddleware(Middleware):
+    """
+    A stage that transforms the text of string arguments, while looking ahead: the last `lookahead` characters of each
+    argument are held back until more text arrives (or the argument ends), so a pattern that is split between chunks is
+    transformed as a whole.
+    """
+
+    text_only = True
+
+    def __init__(self, lookahead: int = 0, args: Optional[Iterable[str]] = None):
+        """
+        :param lookahead: The number of characters to hold back (at least the length of the longest pattern)
+        :param args: The names of the arguments to transform (all the string arguments, if not set)
+        """
+        self.lookahead = lookahead
+        self.args: Optional[Set[str]] = set(args) if args is not None else None
+
+    def transform(self, func: str, arg: str, text: str) -> str:
+        """
+        Transforms a released piece of text.
+        """
+        return text
+
+    def cut(self, text: str) -> int:
+        """
+        Returns the position up to which the pending text can be released.
+        """
+        return max(len(text) - self.lookahead, 0)
+
+    def process(self, state: Dict, func: str, arg: str, value: Any) -> Optional[Any]:
+        if self.args is not None and arg not in self.args:
+            return value
+        key = (func, arg)
+        text = state.pop(key, "") + value
+        cut = self.cut(text)
+        if cut < len(text):
+            state[key] = text[cut:]
+        return self.transform(func, arg, text[:cut]) if cut else ""
+
+    def end(self, state: Dict, func: str, arg: str) -> Optional[Any]:
+        text = state.pop((func, arg), None)
+        return self.transform(func, arg, text) if text else None
+
+
+class Redact(TextMiddleware):
+    """
+    Replaces the matches of a pattern (e.g. emails, phone numbers or profanity) in string arguments, including matches
+    that are split between chunks - as long as they are not longer than `lookahead`.
+    """
+
+    def __init__(self, pattern: Union[str, Pattern], replacement: str = "[REDACTED]", lookahead: int = 64,
+                 args: Optional[Iterable[str]] = None):
+        """
+        :param pattern: The pattern to replace
+        :param replacement: The replacement (may refer to groups, like `re.sub`)
+        :param lookahead: The maximal length of a match
+        :param args: The names of the arguments to redact (all the string arguments, if not set)
+        """
+        super().__init__(lookahead, args)
+        self.pattern = re.compile(pattern)
+        self.replacement = replacement
+
+    def transform(self, func: str, arg: str, text: str) -> str:
+        return self.pattern.sub(self.replacement, text)
+
+    def cut(self, text: str) -> int:
+        cut = super().cut(text)
+        for m in self.pattern.finditer(text, max(cut - self.lookahead, 0)):
+            if m.start() < cut < m.end():  # don't split a match
+                return m.start()
+            if m.start() >= cut:
+                break
+        return cut
+
+
+class MiddlewareChain:
+    """
+    A chain of middleware stages, that runs between the parsing of the stream and the dispatch to the functions.
+
+    The stages run synchronously, one after the other, in a single pass per value - inside the coroutine that reads
+    the stream (no extra generators or tasks per stage). If the chain is timed, the time spent in each stage is
+    accumulated in `timings` (at the cost of two clock reads per stage per value).
+
+    :Example:
+    ```python
+    chain = MiddlewareChain([Redact(r"[\\w.+-]+@[\\w-]+\\.[\\w.]+", "[EMAIL]")], timed=True)
+    await process_response(resp, content_handler, funcs=[send_email], middleware=chain)
+    print(chain.timings)
+    ```
+    """
+
+    def __init__(self, stages: Sequence[Middleware], timed: bool = False):
+        """
+        :param stages: The stages, in the order they run
+        :param timed: Whether to measure the time spent in each stage
+        """
+        self.stages = list(stages)
+        self.timed = timed
+        self.values = 0  # The number of values that have entered the chain
+        self._times = [0.0] * len(self.stages)
+
+    @property
+    def timings(self) -> Dict[str, float]:
+        """
+        The time (in seconds) spent in each stage (by the stages' names), over all the streams. It is measured only if
+        the chain is timed.
+        """
+        timings = {}
+        for stage, t in zip(self.stages, self._times):
+            timings[stage.name] = timings.get(stage.name, 0.0) + t
+        return timings
+
+    def start(self) -> "_MiddlewareRun":
+        """
+        Starts the chain for a stream.
+        :return: The chain's run for the stream
+        """
+        return _MiddlewareRun(self)
+
+
+class _MiddlewareRun:
+    """
+    The run of a middleware chain for a single stream (with the stages' state for it).
+    """
+
+    def __init__(self, chain: MiddlewareChain):
+        self.chain = chain
+        self.times = chain._times if chain.timed else None
+        # per stage: its index, process and end methods, state, and whether it receives only text
+        self.stages = [(i, stage.process, stage.end, {}, stage.text_only) for i, stage in enumerate(chain.stages)]
+        self.value_stages = [s for s in self.stages if not s[4]]
+        # the stages to run on a value from the first one, when they are not timed (with the per-value work unpacked)
+        self.text_pass = [(process, state) for _, process, _, state, _ in self.stages]
+        self.value_pass = [(process, state) for _, process, _, state, _ in self.value_stages]
+        self.open: Dict[Tuple[str, str], bool] = {}  # The arguments that have not ended, and whether they are text
+        self.last_func: Optional[str] = None  # The text argument that was open last (kept apart, so a token doesn't
+        self.last_arg: Optional[str] = None  # build a tuple to compare)
+
+    def _run(self, func: str, arg: str, value: Any, text: bool, first: int = 0) -> Any:
+        times = self.times
+        if times is None and first == 0:
+            if text:
+                for process, state in self.text_pass:
+                    value = process(state, func, arg, value)
+                    if not value and type(value) is str:
+                        return _HELD
+            else:
+                for process, state in self.value_pass:
+                    value = process(state, func, arg, value)
+            return value
+        for i, process, _, state, _ in (self.stages if text else self.value_stages):
+            if i < first:
+                continue
+            if times is None:
+                value = process(state, func, arg, value)
+            else:
+                start = perf_counter()
+                value = process(state, func, arg, value)
+                times[i] += perf_counter() - start
+            if text and not value and type(value) is str:
+                return _HELD
+        return value
+
+    def _end(self, func: str, arg: str, text: bool) -> List[Any]:
+        times = self.times
+        out = []
+        for i, _, end, state, text_only in self.stages:
+            if text_only and not text:
+                continue
+            if times is None:
+                value = end(state, func, arg)
+            else:
+                start = perf_counter()
+                value = end(state, func, arg)
+                times[i] += perf_counter() - start
+            if value is not None and value != "":  # what was released goes through the next stages
+                value = self._run(func, arg, value, text, i + 1)
+                if value is not _HELD:
+                    out.append(value)
+        return out
+
+    def __call__(self, func: str, args: Dict, arrays: AbstractSet[str] = frozenset()) -> Dict:
+        """
+        Runs the stages on the changes of a function's arguments (in place).
+        :param func: The name of the function
+        :param args: The changes of the arguments
+        :param arrays: The names of the arguments that are arrays (whose string items are not text fragments)
+        :return: The transformed changes
+        """
+        held = None
+        for arg, value in args.items():
+            if type(value) is str:  # a fragment of a string that is still streaming
+                self.chain.values += 1
+                if arg != self.last_arg or func != self.last_func:
+                    self.last_func, self.last_arg = func, arg
+                    self.open[(func, arg)] = True
+                if self.times is None:  # the untimed text pass, inlined (it runs per token)
+                    for process, state in self.text_pass:
+                        value = process(state, func, arg, value)
+                        if not value and type(value) is str:
+                            value = _HELD
+                            break
+                else:
+                    value = self._run(func, arg, value, True)
+            elif not isinstance(value, StreamedItems):  # a plain value (e.g. from a custom preprocessor)
+                self.chain.values += 1
+                value = self._run(func, arg, value, False)
+            else:
+                value = self._items(func, arg, value, arg not in arrays and not value.array)
+            if value is _HELD:
+                held = held or []
+                held.append(arg)
+            else:
+                args[arg] = value  # replacing the value of a key doesn't disturb the iteration
+        if held:
+            for arg in held:
+                del args[arg]
+        return args
+
+    def _items(self, func: str, arg: str, value: StreamedItems, text: bool) -> StreamedItems:
+        self.chain.values += len(value)
+        ready = []
+        for item in value:
+            item = self._run(func, arg, item, text and type(item) is str)
+            if item is not _HELD:
+                ready.append(item)
+        if value.complete:
+            self.open.pop((func, arg), None)
+            self.last_func = self.last_arg = None
+            ready.extend(self._end(func, arg, text))
+        else:
+            self.open[(func, arg)] = text
+        return StreamedItems(ready, complete=value.complete, array=value.array)
+
+    def finish(self) -> List[Tuple[str, Dict]]:
+        """
+        Ends the arguments that are still open (e.g. the content) at the end of the stream.
+        :return: The last changes of the arguments, per function
+        """
+        out = []
+        for (func, arg), text in self.open.items():
+            ready = self._end(func, arg, text)
+            if ready:
+                out.append((func, {arg: "".join(ready) if text else StreamedItems(ready)}))
+        self.open.clear()
+        self.last_func = self.last_arg = None
+        return out
@@ -0,0 +1,322 @@
+import json
+import types
+from asyncio import Lock, create_task, sleep, CancelledError, Task, wait, FIRST_COMPLETED, gather
+from typing import Callable, Awaitable, Optional, List, Dict, Any, Tuple, Set, Literal, Union, Type, AsyncGenerator
+
+from openai.types.chat import ChatCompletionMessage
+from pydantic import BaseModel
+from pydantic_core import to_jsonable_python
+
+from .fn_dispatcher import o_func, _function_spec
+from .stream_processing import OAIResponse, process_response, _close_response
+from .struct.handler import BaseHandler, OutputSerialization, process_struct_response, Terminate
+
+RelayFormat = Literal["sse", "websocket"]
+
+
+class ClientDisconnected(ConnectionError):
+    """
+    Raised when the relayed client has disconnected.
+    """
+
+
+class Relay:
+    """
+    Relays a stream to a client as Server-Sent Events or websocket messages.
+
+    Events are batched: consecutive deltas of the same stream are merged into a single event, and the pending events
+    are flushed when they reach `flush_bytes`, or `flush_interval` seconds after the first of them was emitted.
+    Flushing awaits the client, so a slow client applies backpressure to the handlers.
+
+    Each event is a JSON object with a `type`:
+    - `content`: `{"type": "content", "delta": "..."}`
+    - `argument`: `{"type": "argument", "function": "...", "argument": "...", "delta": ...}`
+    - `partial`: `{"type": "partial", "data": {...}}` (for structured responses)
+    - `done`: `{"type": "done"}`
+
+    :Example:
+    ```python
+    async def send(data: str):
+        await ws.send_text(data)
+
+    relay = Relay(send, "websocket")
+    await relay.run(resp, funcs=[error_message])
+    ```
+    """
+
+    def __init__(
+            self,
+            send: Callable[[str], Awaitable[None]],
+            fmt: RelayFormat = "sse",
+            flush_bytes: int = 1024,
+            flush_interval: float = 0.05,
+    ):
+        """
+        :param send: A coroutine function that sends an encoded frame to the client
+        :param fmt: The frames format: "sse" or "websocket"
+        :param flush_bytes: Flush the pending events once their deltas reach this size (0 to flush every event)
+        :param flush_interval: The maximum time (in seconds) an event may wait before being flushed
+        """
+        if fmt not in ("sse", "websocket"):
+            raise ValueError("fmt must be either 'sse' or 'websocket'")
+
+        self._send = send
+        self.fmt = fmt
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_bytes = 0
+        self._lock = Lock()
+        self._timer: Optional[Task] = None
+        self.closed = False
+
+        self.frames = 0  # The number of frames that were sent
+        self.bytes_sent = 0  # The number of bytes that were sent
+        self.deltas = 0  # The number of deltas that were emitted
+
+    async def emit(self, typ: str, delta: Any = None, **fields) -> None:
+        """
+        Emits an event. String deltas are merged into the previous event if it belongs to the same stream.
+        :param typ: The event's type
+        :param delta: The event's delta (if any)
+        :param fields: Additional fields of the event
+        """
+        if self.closed:
+            raise ClientDisconnected()
+
+        self.deltas += 1
+        last = self._pending[-1] if self._pending else None
+        if (isinstance(delta, str) and last is not None and last["type"] == typ and "_parts" in last
+                and all(last.get(k) == v for k, v in fields.items())):
+            last["_parts"].append(delta)
+        else:
+            event = {"type": typ, **fields}
+            if isinstance(delta, str):
+                event["_parts"] = [delta]
+            elif delta is not None:
+                event["delta"] = delta
+            self._pending.append(event)
+
+        self._pending_bytes += len(delta) if isinstance(delta, str) else 1
+        if self._pending_bytes >= self.flush_bytes:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await sleep(self.flush_interval)
+        self._timer = None
+        try:
+            await self.flush()
+        except ClientDisconnected:
+            pass
+
+    async def flush(self) -> None:
+        """
+        Sends the pending events to the client as a single frame.
+        """
+        async with self._lock:
+            if not self._pending:
+                return
+            events, self._pending, self._pending_bytes = self._pending, [], 0
+            for event in events:
+                if "_parts" in event:
+                    event["delta"] = "".join(event.pop("_parts"))
+
+            frame = self._encode(events)
+            try:
+                await self._send(frame)
+            except (ConnectionError, OSError) as e:
+                self.closed = True
+                raise ClientDisconnected() from e
+            self.frames += 1
+            self.bytes_sent += len(frame.encode())
+
+    def _encode(self, events: List[Dict[str, Any]]) -> str:
+        if self.fmt == "websocket":
+            return json.dumps(to_jsonable_python(events))
+        return "".join(f"event: {e['type']}\ndata: {json.dumps(to_jsonable_python(e))}\n\n" for e in events)
+
+    async def close(self) -> None:
+        """
+        Flushes the pending events and emits the `done` event.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.closed:
+            await self.emit("done")
+            await self.flush()
+
+    def _function_handler(self, func: Callable) -> Callable:
+        if not _function_spec(func).is_async:
+            raise ValueError(f"Function {o_func(func).__name__} is not an async function")
+        return _ArgumentsRelay(self, func)
+
+    async def run(
+            self,
+            response: OAIResponse,
+            funcs: Optional[List[Callable]] = None,
+            content: bool = True,
+    ) -> Tuple[Set[str], ChatCompletionMessage]:
+        """
+        Relays an OpenAI response stream to the client.
+        :param response: The response stream from OpenAI
+        :param funcs: The functions whose arguments should be relayed
+        :param content: Whether to relay the assistant's text message
+        :return: The result of `process_response`
+        """
+        handlers = {o_func(func).__name__: self._function_handler(func) for func in funcs or []}
+        relay = self
+
+        async def content_handler(content: AsyncGenerator[str, None]):
+            async for token in content:
+                await relay.emit("content", token)
+
+        return await self._relay(response, process_response(
+            response,
+            content_func=content_handler if content else None,
+            funcs=list(handlers.values()) or None,
+        ))
+
+    async def run_struct(
+            self,
+            response: OAIResponse,
+            model: Type[BaseModel],
+            output_serialization: OutputSerialization = "json",
+    ) -> Tuple[Optional[Union[BaseModel, Terminate]], Dict[str, Any]]:
+        """
+        Relays a structured response to the client, as `partial` events of the parsed model.
+        :param response: The response stream from OpenAI
+        :param model: The model to parse the response to
+        :param output_serialization: The output serialization of the response. It should be either "json" or "yaml"
+        :return: The result of `process_struct_response`
+        """
+        relay = self
+
+        async def handle_partially_parsed(_, data):
+            await relay.emit("partial", data=data.model_dump())
+
+        async def terminated(_):
+            pass
+
+        handler_cls = types.new_class("RelayHandler", (BaseHandler[model],), {}, lambda ns: ns.update(
+            handle_partially_parsed=handle_partially_parsed, terminated=terminated))
+        return await self._relay(response, process_struct_response(response, handler_cls(), output_serialization))
+
+    async def _relay(self, response: OAIResponse, processing: Awaitable):
+        try:
+            ret = await processing
+            await self.close()
+            return ret
+        except ClientDisconnected:
+            await _close_response(response)
+            raise
+        except CancelledError:
+            await _close_response(response)
+            raise
+        finally:
+            if self._timer is not None:  # don't leave a pending flush behind (e.g. when the processing has failed)
+                self._timer.cancel()
+                self._timer = None
+
+
+class _ArgumentsRelay:
+    """
+    Relays the arguments of a function as they stream, instead of invoking it. The arguments are read concurrently, so
+    each one is relayed as soon as it streams (whatever their order in the call).
+    """
+
+    def __init__(self, relay: Relay, func: Callable):
+        self.relay = relay
+        self.func = func  # expose the original function, so the dispatcher inspects its arguments
+        self.name = o_func(func).__name__
+
+    async def __call__(self, **kwargs):
+        await gather(*(self._relay_argument(arg, gen) for arg, gen in kwargs.items()))
+
+    async def _relay_argument(self, arg: str, gen: AsyncGenerator):
+        async for item in gen:
+            await self.relay.emit("argument", item, function=self.name, argument=arg)
+
+
+def relay_app(
+        stream_factory: Callable[[Dict], Awaitable[OAIResponse]],
+        funcs: Optional[List[Callable]] = None,
+        flush_bytes: int = 1024,
+        flush_interval: float = 0.05,
+) -> Callable:
+    """
+    Creates an ASGI application that relays streams to its clients.
+    HTTP requests receive a Server-Sent Events stream, and websocket connections receive websocket messages.
+    When the client disconnects, the upstream stream is cancelled.
+
+    :param stream_factory: A coroutine function that receives the ASGI scope, and returns the response stream from
+        OpenAI
+    :param funcs: The functions whose arguments should be relayed
+    :param flush_bytes: Flush the pending events once their deltas reach this size
+    :param flush_interval: The maximum time (in seconds) an event may wait before being flushed
+    :return: An ASGI application
+    """
+
+    async def app(scope, receive, send):
+        if scope["type"] == "http":
+            fmt = "sse"
+        elif scope["type"] == "websocket":
+            fmt = "websocket"
+            message = await receive()
+            if message["type"] != "websocket.connect":
+                return
+        else:
+            return
+
+        # request the stream before the response starts, so the server can still respond with an error if it fails
+        response = await stream_factory(scope)
+        if fmt == "sse":
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")],
+            })
+
+            async def send_frame(frame: str):
+                await send({"type": "http.response.body", "body": frame.encode(), "more_body": True})
+        else:
+            await send({"type": "websocket.accept"})
+
+            async def send_frame(frame: str):
+                await send({"type": "websocket.send", "text": frame})
+
+        relay = Relay(send_frame, fmt, flush_bytes, flush_interval)
+        processing = create_task(relay.run(response, funcs))
+        disconnect = create_task(_wait_for_disconnect(receive))
+        done, _ = await wait({processing, disconnect}, return_when=FIRST_COMPLETED)
+
+        if processing in done:
+            disconnect.cancel()
+            try:
+                processing.result()
+            except ClientDisconnected:
+                return
+        else:
+            processing.cancel()
+            try:
+                await processing
+            except (CancelledError, ClientDisconnected):
+                pass
+            return
+
+        if fmt == "sse":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            await send({"type": "websocket.close", "code": 1000})
+
+    return app
+
+
+async def _wait_for_disconnect(receive) -> None:
+    while True:
+        message = await receive()
+        if message["type"] in ("http.disconnect", "websocket.disconnect"):
+            return
@@ -0,0 +1,345 @@
+from typing import Callable, Union, Awaitable, Optional, List, Tuple, Type, Set, Any, Generator
+
+import httpx
+from openai import APIConnectionError
+from openai.types.chat import ChatCompletionChunk, ChatCompletionMessage, ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_chunk import Choice, ChoiceDelta, ChoiceDeltaToolCall, \
+    ChoiceDeltaToolCallFunction
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+from .stream_processing import OAIResponse, process_response, _close_response
+
+ContinuationFactory = Callable[[ChatCompletionMessage], Union[OAIResponse, Awaitable[OAIResponse]]]
+
+# The errors of a dropped connection
+RESUMABLE_ERRORS: Tuple[Type[BaseException], ...] = (OSError, httpx.TransportError, APIConnectionError)
+
+
+class _Overlap:
+    """
+    Removes the overlap between the text that was already emitted, and the text of the continuation (that may repeat
+    the end of the emitted text, or start over).
+
+    The continuation's text is held back while it may still be a repetition, and released once it is not.
+    """
+
+    def __init__(self, emitted: str, min_overlap: int, window: int):
+        self.emitted = emitted
+        self.min_overlap = min_overlap
+        # the overlap is searched for at the end of the emitted text (within the window), or at its start
+        self.starts = [0] + list(range(max(len(emitted) - window, 1), len(emitted) - min_overlap + 1))
+        self.buffer = ""
+        self.resolved = False
+
+    def feed(self, text: str) -> Optional[str]:
+        """
+        Feeds the continuation's text.
+        :return: The text to emit, or None while the overlap is undecided
+        """
+        self.buffer += text
+        for start in self.starts:
+            tail = self.emitted[start:]
+            if self.buffer.startswith(tail):  # the largest overlap
+                return self._resolve(self.buffer[len(tail):])
+            if tail.startswith(self.buffer):  # may still be a repetition
+                return None
+        return self._resolve(self.buffer)
+
+    def flush(self) -> str:
+        """
+        Resolves the overlap once the continuation's text has ended (or moved to another call).
+        :return: The text to emit
+        """
+        if self.resolved:
+            return ""
+        for start in self.starts:
+            tail = self.emitted[start:]
+            if self.buffer.startswith(tail):
+                return self._resolve(self.buffer[len(tail):])
+            if tail.startswith(self.buffer):  # the whole continuation was a repetition
+                return self._resolve("")
+        return self._resolve(self.buffer)
+
+    def _resolve(self, text: str) -> str:
+        self.resolved = True
+        self.buffer = ""
+        return text
+
+
+class _Call:
+    __slots__ = ("index", "id", "name", "arguments")
+
+    def __init__(self, index: int, id: Optional[str], name: str):
+        self.index = index
+        self.id = id
+        self.name = name
+        self.arguments: List[str] = []
+
+
+def _chunk(template: Any, content: Optional[str] = None, call: Optional[_Call] = None,
+           arguments: Optional[str] = None) -> ChatCompletionChunk:
+    tool_calls = None
+    if call is not None:
+        tool_calls = [ChoiceDeltaToolCall.model_construct(
+            index=call.index, id=None, type=None,
+            function=ChoiceDeltaToolCallFunction.model_construct(name=None, arguments=arguments))]
+    delta = ChoiceDelta.model_construct(content=content, role=None, function_call=None, tool_calls=tool_calls)
+    return ChatCompletionChunk.model_construct(
+        id=getattr(template, "id", ""), created=getattr(template, "created", 0), model=getattr(template, "model", ""),
+        object="chat.completion.chunk",
+        choices=[Choice.model_construct(index=0, delta=delta, finish_reason=None, logprobs=None)])
+
+
+def _without(chunk: Any, content: bool = False, tool_calls: bool = False) -> Optional[ChatCompletionChunk]:
+    """
+    Returns a copy of the chunk without its content and/or tool calls (or None, if nothing is left).
+    """
+    choice = chunk.choices[0]
+    delta = choice.delta
+    new_content = None if content else delta.content
+    new_calls = None if tool_calls else delta.tool_calls
+    if not new_content and not new_calls and not delta.function_call and not choice.finish_reason:
+        return None
+    new_delta = ChoiceDelta.model_construct(content=new_content, role=delta.role, function_call=delta.function_call,
+                                            tool_calls=new_calls)
+    return ChatCompletionChunk.model_construct(
+        id=getattr(chunk, "id", ""), created=getattr(chunk, "created", 0), model=getattr(chunk, "model", ""),
+        object="chat.completion.chunk",
+        choices=[Choice.model_construct(index=0, delta=new_delta, finish_reason=choice.finish_reason,
+                                        logprobs=None)])
+
+
+class ResumableStream:
+    """
+    Resumes a stream whose connection has dropped, by continuing from its partial output.
+
+    The content and the function calls that were already emitted are tracked. When the stream fails with a connection
+    error, a continuation stream is requested from `continuation` (with the partial assistant message), and spliced in.
+    The beginning of the continuation that repeats the emitted output is removed, so the handlers see one seamless
+    stream, without duplicates.
+
+    The streams must be async streams.
+
+    :Example:
+    ```python
+    async def continuation(partial: ChatCompletionMessage):
+        return await client.chat.completions.create(
+            messages=messages + [{"role": "assistant", "content": partial.content},
+                                 {"role": "user", "content": "Continue exactly where you stopped."}],
+            stream=True, ...)
+
+    stream = ResumableStream(resp, continuation)
+    await process_response(stream, content_handler)
+    ```
+    """
+
+    def __init__(
+            self,
+            response: OAIResponse,
+            continuation: ContinuationFactory,
+            max_resumes: int = 3,
+            min_overlap: int = 8,
+            window: int = 1024,
+            resumable_errors: Tuple[Type[BaseException], ...] = RESUMABLE_ERRORS,
+    ):
+        """
+        :param response: The response stream from OpenAI
+        :param continuation: A function that receives the partial assistant message, and requests a stream that
+            continues it (it may be a coroutine function)
+        :param max_resumes: The maximum number of continuations to request
+        :param min_overlap: The minimal number of characters that are considered a repetition
+        :param window: The number of characters at the end of the emitted output that are searched for a repetition
+        :param resumable_errors: The errors that are resumed
+        """
+        self._response = response
+        self._continuation = continuation
+        self.max_resumes = max_resumes
+        self.min_overlap = min_overlap
+        self.window = window
+        self.resumable_errors = resumable_errors
+
+        self.resumes = 0  # The number of continuations that were requested
+        self._content: List[str] = []
+        self._calls: List[_Call] = []
+        self._in_call = False  # Whether the output was interrupted inside a function call
+        self._overlap: Optional[_Overlap] = None
+        self._header_pending = False  # Whether the continuation's header of the interrupted call is expected
+        self._gen = self._stream()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> ChatCompletionChunk:
+        return await self._gen.__anext__()
+
+    async def aclose(self) -> None:
+        await self._gen.aclose()
+
+    def partial_message(self) -> ChatCompletionMessage:
+        """
+        :return: The assistant message that was emitted so far
+        """
+        return ChatCompletionMessage(
+            role="assistant",
+            content="".join(self._content) or None,
+            tool_calls=[ChatCompletionMessageToolCall(
+                id=call.id or "", type="function", function=Function(name=call.name, arguments="".join(call.arguments))
+            ) for call in self._calls] or None,
+        )
+
+    async def _stream(self):
+        response = self._response
+        it = response.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await it.__anext__()
+                except StopAsyncIteration:
+                    break
+                except self.resumable_errors:
+                    if self.resumes >= self.max_resumes:
+                        raise
+                    await _close_response(response)
+                    response = await self._resume()
+                    it = response.__aiter__()
+                    continue
+
+                for out in self._process(chunk):
+                    yield out
+
+            if self._overlap is not None:
+                text = self._overlap.flush()
+                if text:
+                    yield self._emit(None, text)
+        finally:
+            await _close_response(response)
+
+    async def _resume(self) -> OAIResponse:
+        self.resumes += 1
+        response = self._continuation(self.partial_message())
+        if isinstance(response, Awaitable):
+            response = await response
+
+        if self._in_call:
+            emitted = "".join(self._calls[-1].arguments)
+            self._header_pending = True
+        else:
+            emitted = "".join(self._content)
+        self._overlap = _Overlap(emitted, self.min_overlap, self.window)
+        return response
+
+    def _emit(self, template: Any, text: str) -> ChatCompletionChunk:
+        if self._in_call:
+            call = self._calls[-1]
+            call.arguments.append(text)
+            return _chunk(template, call=call, arguments=text)
+        self._content.append(text)
+        return _chunk(template, content=text)
+
+    def _process(self, chunk: Any) -> Generator[ChatCompletionChunk, None, None]:
+        if not chunk.choices:
+            yield chunk
+            return
+
+        delta = chunk.choices[0].delta
+        call = delta.tool_calls[0] if delta.tool_calls else None
+        if self._overlap is None or self._overlap.resolved and not self._header_pending:
+            self._track(delta, call)
+            yield chunk
+            return
+
+        overlap = self._overlap
+        if not self._in_call:  # the content was interrupted
+            if delta.content and not overlap.resolved:
+                text = overlap.feed(delta.content)
+                if text:
+                    yield self._emit(chunk, text)
+                rest = _without(chunk, content=True)
+            else:
+                rest = chunk
+            if rest is not None:
+                if (rest.choices[0].delta.tool_calls or rest.choices[0].finish_reason) and not overlap.resolved:
+                    text = overlap.flush()
+                    if text:
+                        yield self._emit(chunk, text)
+                self._track(rest.choices[0].delta, call)
+                yield rest
+            return
+
+        # a function call was interrupted
+        if call is not None and call.function is not None:
+            if call.function.name and self._header_pending:
+                if call.function.name != self._calls[-1].name:  # another call - it's not a continuation
+                    self._header_pending = False
+                    overlap.flush()
+                    self._track(delta, call)
+                    yield chunk
+                    return
+                self._header_pending = False  # the handlers already saw the call's header
+            if call.function.arguments and not overlap.resolved:
+                text = overlap.feed(call.function.arguments)
+                if text:
+                    yield self._emit(chunk, text)
+                rest = _without(chunk, tool_calls=True)
+                if rest is not None:
+                    if rest.choices[0].finish_reason and not overlap.resolved:
+                        text = overlap.flush()
+                        if text:
+                            yield self._emit(chunk, text)
+                    self._track(rest.choices[0].delta, None)
+                    yield rest
+                return
+            if call.function.arguments:
+                yield self._emit(chunk, call.function.arguments)
+            rest = _without(chunk, tool_calls=True)
+        else:
+            rest = chunk
+
+        if rest is not None:
+            if rest.choices[0].finish_reason and not overlap.resolved:
+                text = overlap.flush()
+                if text:
+                    yield self._emit(chunk, text)
+            if rest.choices[0].delta.content:
+                self._content.append(rest.choices[0].delta.content)
+            yield rest
+
+    def _track(self, delta: Any, call: Any) -> None:
+        if delta.content:
+            self._content.append(delta.content)
+            self._in_call = False
+        function = call.function if call is not None else delta.function_call
+        if function is not None:
+            if function.name:
+                self._calls.append(_Call(getattr(call, "index", 0), getattr(call, "id", None), function.name))
+            if function.arguments and self._calls:
+                self._calls[-1].arguments.append(function.arguments)
+            self._in_call = True
+
+
+async def process_resumable_response(
+        response: OAIResponse,
+        continuation: ContinuationFactory,
+        content_func: Optional[Callable[[Any], Awaitable[None]]] = None,
+        funcs: Optional[List[Callable[[], Awaitable[None]]]] = None,
+        max_resumes: int = 3,
+        **kwargs,
+) -> Tuple[Set[str], ChatCompletionMessage]:
+    """
+    Processes a response like `process_response`, while resuming it when its connection drops (see
+    `ResumableStream`).
+
+    :param response: The response stream from OpenAI
+    :param continuation: A function that receives the partial assistant message, and requests a stream that continues
+        it
+    :param content_func: The function to use for the assistant's text message
+    :param funcs: The functions to use when called by the assistant
+    :param max_resumes: The maximum number of continuations to request
+    :param kwargs: Additional arguments for `process_response`
+    :return: The result of `process_response`
+    """
+    stream = ResumableStream(response, continuation, max_resumes)
+    try:
+        return await process_response(stream, content_func, funcs, **kwargs)
+    finally:
+        await stream.aclose()
@@ -0,0 +1,252 @@
+import re
+from asyncio import create_task, gather
+from typing import AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Union
+
+from .fn_dispatcher import Channel
+
+_ATTR = re.compile(r'([\w:.-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+))')
+_FENCE = "```"
+
+
+class Segment:
+    """
+    A segment of the assistant's text message - prose, a fenced code block or an XML-tagged section - streamed to its
+    handler as it is generated. Iterate over it to receive its text (without the delimiters).
+    """
+
+    def __init__(self, kind: str, name: Optional[str] = None, attrs: Optional[Dict[str, str]] = None):
+        """
+        :param kind: The kind of the segment: "text", "code" or "tag"
+        :param name: The language of a code block (None if not set), or the name of a tag
+        :param attrs: The attributes of a tag
+        """
+        self.kind = kind
+        self.name = name
+        self.attrs = attrs or {}
+        self.terminated = False  # Whether the segment has ended with its closing delimiter (set once it has ended)
+        self._channel = Channel()
+
+    def __aiter__(self) -> AsyncGenerator[str, None]:
+        return self._channel.__aiter__()
+
+    def __repr__(self) -> str:
+        return f"Segment(kind={self.kind!r}, name={self.name!r})"
+
+
+SegmentHandler = Callable[[Segment], Awaitable[None]]
+
+
+class ContentRouter:
+    """
+    Routes the segments of the assistant's text message to their own streaming handlers: prose, fenced code blocks (by
+    their language) and XML-tagged sections (by their tag). Each segment's handler is started as soon as the segment
+    opens, so e.g. a code block can start rendering (or running) while the rest of the answer is still generated.
+
+    The content is scanned once, as it streams. Delimiters that are split between chunks are recognized: only the
+    short tail of a chunk that may be the beginning of a delimiter is held back until the next chunk arrives. Tags are
+    not nested, and the content of a segment is not scanned for other delimiters.
+
+    Segments that have no handler are skipped. Only the configured tags are recognized, and code blocks are recognized
+    only if there is a handler for code.
+
+    :Example:
+    ```python
+    async def render_code(segment: Segment):
+        async for text in segment:
+            ...
+
+    router = ContentRouter(text=print_prose, code={"python": run_python, None: render_code},
+                           tags={"thinking": log_reasoning})
+    await process_response(resp, router.content_func, funcs=[...])
+    ```
+    """
+
+    def __init__(
+            self,
+            text: Optional[SegmentHandler] = None,
+            code: Union[SegmentHandler, Dict[Optional[str], SegmentHandler], None] = None,
+            tags: Optional[Dict[str, SegmentHandler]] = None,
+            max_delimiter: int = 256,
+    ):
+        """
+        :param text: The handler of prose segments
+        :param code: The handler of fenced code blocks, or the handlers by language (`None` for the other languages)
+        :param tags: The handlers of XML-tagged sections, by the tag's name
+        :param max_delimiter: The maximal length of a delimiter (e.g. a fence's info line, or an opening tag)
+        """
+        self.text = text
+        self.code: Dict[Optional[str], SegmentHandler] = code if isinstance(code, dict) else \
+            ({None: code} if code is not None else {})
+        self.tags = dict(tags or {})
+        self.max_delimiter = max_delimiter
+
+        openers = []
+        if self.code:
+            openers.append(r"(?P<fence>^```[ \t]*(?P<info>[^\n`]*)\n)")
+        if self.tags:
+            names = "|".join(re.escape(tag) for tag in sorted(self.tags, key=len, reverse=True))
+            openers.append(rf"(?P<tag><(?P<name>{names})(?P<attrs>\s[^<>]*)?>)")
+        self._opener = re.compile("|".join(openers), re.MULTILINE) if openers else None
+        self._closer = re.compile(r"^```[ \t]*\n", re.MULTILINE)
+
+        router = self
+
+        async def content_router(content: AsyncGenerator[str, None]):
+            run = _RouterRun(router)
+            try:
+                async for token in content:
+                    run.feed(token)
+            finally:
+                run.end()
+                await run.wait()
+
+        self.content_func: Callable[[AsyncGenerator[str, None]], Awaitable[None]] = content_router
+        """The content function to pass to `process_response`."""
+
+    def _code_handler(self, language: Optional[str]) -> Optional[SegmentHandler]:
+        return self.code.get(language, self.code.get(None))
+
+
+class _RouterRun:
+    """
+    The routing of a single message: a scanner over the content, with the segment that is currently open.
+    """
+
+    def __init__(self, router: ContentRouter):
+        self.router = router
+        self.segment: Optional[Segment] = None  # The open segment (None for prose, until it has text)
+        self.mode = "text"
+        self.closer: Optional[str] = None  # The closing tag of the open tagged section
+        self.held = ""  # The tail that may be the beginning of a delimiter
+        self.line_start = True  # Whether the held text starts at the beginning of a line
+        self.skipping = False  # Whether the open segment has no handler
+        self.tasks: List[Awaitable[None]] = []
+
+    def feed(self, chunk: str) -> None:
+        buf = self.held + chunk if self.held else chunk
+        self.held = ""
+        while buf:
+            if self.mode == "text":
+                buf = self._scan_text(buf)
+            elif self.mode == "code":
+                buf = self._scan_code(buf)
+            else:
+                buf = self._scan_tag(buf)
+
+    def end(self) -> None:
+        if self.held:
+            if self.mode == "code" and self.held.rstrip(" \t") == _FENCE and self.line_start:
+                self._close(terminated=True)  # the closing fence, at the very end
+            else:
+                self._emit(self.held)
+            self.held = ""
+        if self.segment is not None:
+            self._close(terminated=self.mode == "text")
+
+    async def wait(self) -> None:
+        await gather(*self.tasks)
+
+    def _scan_text(self, buf: str) -> str:
+        opener = self.router._opener
+        m = opener.search(buf) if opener is not None else None
+        while m is not None and m.groupdict().get("fence") and m.start() == 0 and not self.line_start:
+            m = opener.search(buf, 1)  # `^` matches the beginning of the buffer, which is not a line start
+        if m is None:
+            return self._hold(buf, self._partial_opener(buf))
+        self._emit(buf[:m.start()])
+        self._close(terminated=True)
+        if m.groupdict().get("fence"):
+            language = m.group("info").strip().split(" ")[0] or None
+            self._open(Segment("code", language), self.router._code_handler(language))
+            self.mode = "code"
+        else:
+            attrs = {a[0]: a[1] or a[2] or a[3] for a in _ATTR.findall(m.group("attrs") or "")}
+            name = m.group("name")
+            self._open(Segment("tag", name, attrs), self.router.tags.get(name))
+            self.mode = "tag"
+            self.closer = f"</{name}>"
+        self.line_start = m.group(0).endswith("\n")
+        return buf[m.end():]
+
+    def _scan_code(self, buf: str) -> str:
+        m = self.router._closer.search(buf)
+        while m is not None and m.start() == 0 and not self.line_start:
+            m = self.router._closer.search(buf, 1)
+        if m is None:
+            start = buf.rfind("\n") + 1
+            line = buf[start:]
+            partial = (start > 0 or self.line_start) and (_FENCE.startswith(line) or
+                                                          line.startswith(_FENCE) and not line[3:].strip(" \t"))
+            return self._hold(buf, start if partial and line else len(buf))
+        self._emit(buf[:m.start()])
+        self._close(terminated=True)
+        self.mode = "text"
+        self.line_start = True
+        return buf[m.end():]
+
+    def _scan_tag(self, buf: str) -> str:
+        i = buf.find(self.closer)
+        if i < 0:
+            start = buf.rfind("<")
+            partial = start >= 0 and self.closer.startswith(buf[start:])
+            return self._hold(buf, start if partial else len(buf))
+        end = i + len(self.closer)
+        self._emit(buf[:i])
+        self._close(terminated=True)
+        self.mode = "text"
+        self.closer = None
+        self.line_start = False
+        return buf[end:]
+
+    def _partial_opener(self, buf: str) -> int:
+        """
+        Returns the position from which the buffer may be the beginning of an opening delimiter.
+        """
+        n = len(buf)
+        limit = self.router.max_delimiter
+        hold = n
+        if self.router.code:
+            start = buf.rfind("\n") + 1
+            line = buf[start:]
+            if line and (start > 0 or self.line_start) and n - start <= limit and \
+                    (_FENCE.startswith(line) or line.startswith(_FENCE) and "`" not in line[3:]):
+                hold = start
+        if self.router.tags:
+            start = buf.rfind("<")
+            if start >= 0 and n - start <= limit and ">" not in buf[start:]:
+                head = buf[start + 1:]
+                for tag in self.router.tags:
+                    if tag.startswith(head) or head.startswith(tag) and head[len(tag)].isspace():
+                        hold = min(hold, start)
+                        break
+        return hold
+
+    def _hold(self, buf: str, hold: int) -> str:
+        if hold < len(buf):
+            self.held = buf[hold:]
+        if hold:
+            self._emit(buf[:hold])
+            self.line_start = buf[hold - 1] == "\n"
+        return ""
+
+    def _emit(self, text: str) -> None:
+        if not text:
+            return
+        if self.mode == "text" and self.segment is None:
+            self._open(Segment("text"), self.router.text)
+        if not self.skipping:
+            self.segment._channel.send(text)
+
+    def _open(self, segment: Segment, handler: Optional[SegmentHandler]) -> None:
+        self.segment = segment
+        self.skipping = handler is None
+        if handler is not None:
+            self.tasks.append(create_task(handler(segment)))
+
+    def _close(self, terminated: bool) -> None:
+        if self.segment is None:
+            return
+        self.segment.terminated = terminated
+        self.segment._channel.close()
+        self.segment = None
+
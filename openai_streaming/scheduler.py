@@ -0,0 +1,204 @@
+from asyncio import Future, get_running_loop, CancelledError
+from bisect import insort
+from contextlib import asynccontextmanager
+from itertools import count
+from time import monotonic
+from typing import Dict, Optional, List, NamedTuple, AsyncIterator
+
+# Priority classes (lower runs first)
+INTERACTIVE = 0
+DEFAULT = 10
+BACKGROUND = 20
+
+
+class FunctionStats(NamedTuple):
+    """
+    The queueing metrics of a function.
+    """
+    running: int  # The number of invocations that are running
+    queued: int  # The number of invocations that are waiting for a slot
+    admitted: int  # The number of invocations that were started
+    wait_time: float  # The total time (in seconds) invocations have waited for a slot
+    max_wait: float  # The longest time (in seconds) an invocation has waited for a slot
+
+
+class _Counters:
+    __slots__ = ("running", "queued", "admitted", "wait_time", "max_wait")
+
+    def __init__(self):
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+
+class _Waiter:
+    __slots__ = ("key", "func", "future", "since")
+
+    def __init__(self, key: tuple, func: str, future: Future):
+        self.key = key
+        self.func = func
+        self.future = future
+        self.since = monotonic()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return self.key < other.key
+
+
+class Scheduler:
+    """
+    Schedules the invocations of the functions (and the content functions) across all the streams of the process:
+    each function can be capped to a number of concurrent invocations, and the total number of running invocations
+    can be capped as well. When invocations have to wait, they are started by their priority class (e.g. user-facing
+    content before background tools), and then in their arrival order.
+
+    A function that waits for a slot does not hold the stream back: its arguments are buffered until it starts.
+
+    The scheduler is bound to a single event loop.
+
+    :Example:
+    ```python
+    set_default_scheduler(Scheduler(
+        limits={"search_db": 20},
+        max_concurrency=500,
+        priorities={"content_handler": INTERACTIVE, "search_db": BACKGROUND},
+    ))
+    ```
+    """
+
+    def __init__(
+            self,
+            limits: Optional[Dict[str, int]] = None,
+            max_concurrency: Optional[int] = None,
+            priorities: Optional[Dict[str, int]] = None,
+            default_priority: int = DEFAULT,
+    ):
+        """
+        :param limits: The maximum number of concurrent invocations per function name
+        :param max_concurrency: The maximum total number of concurrent invocations
+        :param priorities: The priority class per function name (lower runs first)
+        :param default_priority: The priority class of the other functions
+        """
+        self.limits = dict(limits or {})
+        self.max_concurrency = max_concurrency
+        self.priorities = dict(priorities or {})
+        self.default_priority = default_priority
+
+        self.running = 0  # The total number of running invocations
+        self._counters: Dict[str, _Counters] = {}
+        self._waiters: List[_Waiter] = []  # Sorted by priority and arrival
+        self._seq = count()
+
+    def _can_run(self, func: str, counters: _Counters) -> bool:
+        if self.max_concurrency is not None and self.running >= self.max_concurrency:
+            return False
+        limit = self.limits.get(func)
+        return limit is None or counters.running < limit
+
+    def _start(self, counters: _Counters, waited: float) -> None:
+        self.running += 1
+        counters.running += 1
+        counters.admitted += 1
+        counters.wait_time += waited
+        if waited > counters.max_wait:
+            counters.max_wait = waited
+
+    def _counters_of(self, func: str) -> _Counters:
+        counters = self._counters.get(func)
+        if counters is None:
+            counters = self._counters[func] = _Counters()
+        return counters
+
+    async def acquire(self, func: str) -> None:
+        """
+        Waits for a slot to invoke a function.
+        :param func: The name of the function
+        """
+        counters = self._counters_of(func)
+        if self._can_run(func, counters):
+            self._start(counters, 0.0)
+            return
+
+        priority = self.priorities.get(func, self.default_priority)
+        waiter = _Waiter((priority, next(self._seq)), func, get_running_loop().create_future())
+        insort(self._waiters, waiter)
+        counters.queued += 1
+        try:
+            await waiter.future
+        except CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():  # the slot was granted meanwhile
+                self.release(func)
+            else:
+                self._waiters.remove(waiter)
+                counters.queued -= 1
+            raise
+
+    def release(self, func: str) -> None:
+        """
+        Releases the slot of a function, and starts the waiting invocations that can run.
+        :param func: The name of the function
+        """
+        self.running -= 1
+        self._counters[func].running -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        i = 0
+        while i < len(self._waiters):
+            if self.max_concurrency is not None and self.running >= self.max_concurrency:
+                return
+            waiter = self._waiters[i]
+            counters = self._counters[waiter.func]
+            if not self._can_run(waiter.func, counters):
+                i += 1
+                continue
+            del self._waiters[i]
+            counters.queued -= 1
+            self._start(counters, monotonic() - waiter.since)
+            waiter.future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, func: str) -> AsyncIterator[None]:
+        """
+        Holds a slot of a function for the duration of the context.
+        :param func: The name of the function
+        """
+        await self.acquire(func)
+        try:
+            yield
+        finally:
+            self.release(func)
+
+    @property
+    def queued(self) -> int:
+        """
+        The total number of invocations that are waiting for a slot.
+        """
+        return len(self._waiters)
+
+    def stats(self) -> Dict[str, FunctionStats]:
+        """
+        :return: The queueing metrics per function name
+        """
+        return {func: FunctionStats(c.running, c.queued, c.admitted, c.wait_time, c.max_wait)
+                for func, c in self._counters.items()}
+
+
+_default_scheduler: Optional[Scheduler] = None
+
+
+def set_default_scheduler(scheduler: Optional[Scheduler]) -> None:
+    """
+    Sets the scheduler that is shared by all the `process_response` calls (that don't pass their own scheduler).
+    :param scheduler: The scheduler, or None to invoke the functions without scheduling
+    """
+    global _default_scheduler
+    _default_scheduler = scheduler
+
+
+def get_default_scheduler() -> Optional[Scheduler]:
+    """
+    :return: The scheduler that is shared by all the `process_response` calls, if any
+    """
+    return _default_scheduler
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Awaitable, Any, List, Sequence, Tuple, NamedTuple, Optional
+
+
+class ShardMetrics(NamedTuple):
+    """
+    The metrics of a single worker process.
+    """
+    shard: int  # The index of the shard
+    pid: int  # The worker process' id
+    jobs: int  # The number of jobs the worker has run
+    failures: int  # The number of jobs that raised an exception
+    elapsed: float  # The wall time (in seconds) of the shard
+    cpu_time: float  # The CPU time (in seconds) the worker has spent on the shard
+
+
+class ShardedResult(NamedTuple):
+    """
+    The aggregated result of `run_sharded`.
+    """
+    results: List[Any]  # The jobs' results, in the order of the jobs (exceptions in place of failed jobs)
+    shards: List[ShardMetrics]  # The metrics of each shard
+    elapsed: float  # The wall time (in seconds) of the whole run
+
+    @property
+    def failures(self) -> int:
+        return sum(s.failures for s in self.shards)
+
+    @property
+    def throughput(self) -> float:
+        """
+        The number of jobs per second.
+        """
+        return len(self.results) / self.elapsed if self.elapsed else 0.0
+
+
+async def _run_jobs(worker: Callable[[Any], Awaitable[Any]], jobs: List[Tuple[int, Any]], concurrency: int) \
+        -> List[Tuple[int, Any, bool]]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(i: int, job: Any) -> Tuple[int, Any, bool]:
+        async with semaphore:
+            try:
+                return i, await worker(job), True
+            except Exception as e:
+                return i, e, False
+
+    return await asyncio.gather(*(run(i, job) for i, job in jobs))
+
+
+def _run_shard(worker: Callable[[Any], Awaitable[Any]], shard: int, jobs: List[Tuple[int, Any]], concurrency: int) \
+        -> Tuple[List[Tuple[int, Any, bool]], ShardMetrics]:
+    """
+    Runs a shard of the jobs on its own event loop (in the worker process).
+    """
+    start, cpu_start = time.perf_counter(), time.process_time()
+    results = asyncio.run(_run_jobs(worker, jobs, concurrency))
+    metrics = ShardMetrics(
+        shard=shard,
+        pid=os.getpid(),
+        jobs=len(jobs),
+        failures=sum(1 for _, _, ok in results if not ok),
+        elapsed=time.perf_counter() - start,
+        cpu_time=time.process_time() - cpu_start,
+    )
+    return results, metrics
+
+
+def run_sharded(
+        worker: Callable[[Any], Awaitable[Any]],
+        jobs: Sequence[Any],
+        processes: Optional[int] = None,
+        concurrency: int = 64,
+        return_exceptions: bool = True,
+) -> ShardedResult:
+    """
+    Runs a CPU-bound batch of streams on multiple cores.
+
+    Partial parsing of the streams is pure Python, so a single event loop saturates one core. The jobs are sharded
+    between worker processes, each running its own event loop with up to `concurrency` jobs at a time, and the
+    results and metrics are aggregated back.
+
+    The worker and the jobs are sent to the worker processes, so they must be picklable: the worker must be a
+    module-level coroutine function, and the jobs are typically request parameters, or recorded logs (replayed with
+    `logs_to_response`).
+
+    :Example:
+    ```python
+    async def parse_log(log: List[dict]) -> str:
+        _, message = await process_response(logs_to_response(log), content_handler, funcs=[error_message])
+        return message.content
+
+    if __name__ == "__main__":
+        result = run_sharded(parse_log, logs)
+        print(result.throughput, result.results)
+    ```
+
+    :param worker: A coroutine function that processes a single job, and returns its result
+    :param jobs: The jobs to process
+    :param processes: The number of worker processes (defaults to the number of CPUs)
+    :param concurrency: The maximum number of concurrent jobs in each worker process
+    :param return_exceptions: Whether to return the exceptions of failed jobs as their results (otherwise, the first
+        exception is raised once all the jobs have finished)
+    :return: The results of the jobs and the metrics of the shards
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+
+    processes = min(processes or os.cpu_count() or 1, len(jobs)) or 1
+    indexed = list(enumerate(jobs))
+    shards = [indexed[i::processes] for i in range(processes)]  # round-robin, to balance mixed workloads
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(_run_shard, worker, i, shard, concurrency) for i, shard in enumerate(shards)]
+        outcomes = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+
+    results: List[Any] = [None] * len(jobs)
+    error: Optional[BaseException] = None
+    for shard_results, _ in outcomes:
+        for i, value, ok in shard_results:
+            results[i] = value
+            if not ok and error is None:
+                error = value
+
+    if error is not None and not return_exceptions:
+        raise error
+    return ShardedResult(results, [metrics for _, metrics in outcomes], elapsed)
@@ -0,0 +1,284 @@
+import asyncio
+import ctypes
+import multiprocessing
+import pickle
+import struct
+from multiprocessing import shared_memory
+from typing import Any, Optional, AsyncGenerator, Iterator, Callable, Awaitable, Union, AsyncIterator, Tuple
+
+# The header: the write position and the read position (both are monotonic byte counters), the writer's state, and the
+# buffer's capacity (the mapped size may be rounded up to a page)
+_WRITE_POS_OFFSET = 0
+_READ_POS_OFFSET = 8
+_STATE_OFFSET = 16
+_CAPACITY_OFFSET = 24
+_HEADER_SIZE = 64
+_RECORD = struct.Struct("IB")  # The record's header: the payload's size, and its kind
+_STR = 0
+_OBJECT = 1
+
+_OPEN = 0
+_CLOSED = 1
+_ABORTED = 2
+
+_ASYNC_WAIT = 0.1  # How long a waiting coroutine's helper thread blocks at a time (so a cancelled wait ends soon)
+
+
+class ShmRing:
+    """
+    A single-producer single-consumer ring buffer in shared memory, to hand a stream of fragments over to another
+    process without pickling them through a `multiprocessing.Queue`.
+
+    Strings are encoded into the buffer as UTF-8 and decoded straight out of it (a copy on each side), and other
+    values (e.g. array items) are pickled. The writer waits while the buffer is full (backpressure), and the reader
+    waits while it is empty, until the writer closes the ring.
+
+    The positions are read and updated under a `multiprocessing.Condition`, whose lock orders the copies against the
+    position updates on any CPU (not just x86). A waiting side sleeps on the condition until the other side notifies
+    it, rather than polling. The ring is passed to the worker process as an argument (it attaches to the same shared
+    memory and condition there), so it has to be created with the worker's multiprocessing context.
+
+    :Example:
+    ```python
+    ring = ShmRing.create()
+    worker = Process(target=speak, args=(ring,))  # def speak(ring): for text in ring: ...
+    worker.start()
+    await process_response(resp, content_sink(ring))
+    ```
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool, condition):
+        self._shm = shm
+        self._owner = owner
+        self._condition = condition
+        self._buf = shm.buf
+        self._write_pos = ctypes.c_uint64.from_buffer(self._buf, _WRITE_POS_OFFSET)
+        self._read_pos = ctypes.c_uint64.from_buffer(self._buf, _READ_POS_OFFSET)
+        self._state = ctypes.c_uint8.from_buffer(self._buf, _STATE_OFFSET)
+        self.capacity = ctypes.c_uint64.from_buffer_copy(self._buf, _CAPACITY_OFFSET).value
+
+    @classmethod
+    def create(cls, size: int = 1 << 20, ctx=None) -> "ShmRing":
+        """
+        Creates a new ring buffer.
+        :param size: The capacity of the buffer, in bytes
+        :param ctx: The multiprocessing context of the worker process (default: the default context)
+        :return: The ring buffer (its creator owns the shared memory, and should `release` it)
+        """
+        shm = shared_memory.SharedMemory(create=True, size=size + _HEADER_SIZE)
+        struct.pack_into("QQB", shm.buf, 0, 0, 0, _OPEN)
+        struct.pack_into("Q", shm.buf, _CAPACITY_OFFSET, size)
+        return cls(shm, True, (ctx or multiprocessing.get_context()).Condition())
+
+    @classmethod
+    def attach(cls, name: str, condition) -> "ShmRing":
+        """
+        Attaches to an existing ring buffer (this is how a ring passed to another process is unpickled).
+        :param name: The name of the ring buffer
+        :param condition: The ring buffer's condition
+        :return: The ring buffer
+        """
+        return cls(shared_memory.SharedMemory(name=name), False, condition)
+
+    def __reduce__(self) -> Tuple[Callable, Tuple[str, Any]]:
+        return ShmRing.attach, (self.name, self._condition)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def _positions(self) -> Tuple[int, int, int]:
+        return self._write_pos.value, self._read_pos.value, self._state.value
+
+    def _wait(self, attempt: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        with self._condition:
+            ret = self._condition.wait_for(attempt, timeout)
+        if not ret:
+            raise TimeoutError("Timed out waiting for the ring")
+        return ret
+
+    def _wait_for_change(self, positions: Tuple[int, int, int]) -> None:
+        with self._condition:
+            self._condition.wait_for(lambda: self._positions() != positions, _ASYNC_WAIT)
+
+    async def _wait_async(self, attempt: Callable[[], Any]) -> Any:
+        # the attempts run on the loop's thread, so a cancelled wait never writes or consumes a record
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                ret = attempt()
+                positions = self._positions()
+            if ret:
+                return ret
+            await loop.run_in_executor(None, self._wait_for_change, positions)
+
+    # Writing
+
+    def _encode(self, item: Any) -> bytes:
+        if isinstance(item, str):
+            data, kind = item.encode(), _STR
+        else:
+            data, kind = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL), _OBJECT
+        return _RECORD.pack(len(data), kind) + data
+
+    def _records(self, item: Any) -> Iterator[bytes]:
+        record = self._encode(item)
+        if len(record) <= self.capacity:
+            yield record
+            return
+        if not isinstance(item, str):
+            raise ValueError(f"An item of {len(record)} bytes exceeds the ring's capacity")
+        step = max((self.capacity - _RECORD.size) // 4, 1)  # a UTF-8 character takes up to 4 bytes
+        for i in range(0, len(item), step):
+            yield self._encode(item[i:i + step])
+
+    def _try_write(self, record: bytes) -> bool:  # with the condition held
+        if self._state.value != _OPEN:
+            raise ValueError("The ring is closed")
+        write_pos, read_pos = self._write_pos.value, self._read_pos.value
+        if self.capacity - (write_pos - read_pos) < len(record):
+            return False
+
+        offset = write_pos % self.capacity
+        first = min(len(record), self.capacity - offset)
+        self._buf[_HEADER_SIZE + offset:_HEADER_SIZE + offset + first] = record[:first]
+        if first < len(record):
+            self._buf[_HEADER_SIZE:_HEADER_SIZE + len(record) - first] = record[first:]
+        self._write_pos.value = write_pos + len(record)  # publish the record
+        self._condition.notify_all()
+        return True
+
+    def put(self, item: Any, timeout: Optional[float] = None) -> None:
+        """
+        Writes an item, and waits while the ring is full.
+        :param item: A string, or a picklable value
+        :param timeout: The maximum time (in seconds) to wait for free space
+        :raises TimeoutError: If the ring is still full after `timeout` seconds
+        """
+        for record in self._records(item):
+            self._wait(lambda: self._try_write(record), timeout)
+
+    async def send(self, item: Any) -> None:
+        """
+        Writes an item, and waits (without blocking the event loop) while the ring is full.
+        :param item: A string, or a picklable value
+        """
+        for record in self._records(item):
+            await self._wait_async(lambda: self._try_write(record))
+
+    async def feed(self, items: Union[AsyncIterator[Any], AsyncGenerator[Any, None]], close: bool = True) -> None:
+        """
+        Writes the items of a stream (e.g. the content or an argument handed to a function by `process_response`).
+        :param items: The stream of items
+        :param close: Whether to close the ring at the end of the stream (the ring is aborted if the stream fails)
+        """
+        try:
+            async for item in items:
+                await self.send(item)
+        except BaseException:
+            self.abort()
+            raise
+        if close:
+            self.close()
+
+    def _set_state(self, state: int) -> None:
+        with self._condition:
+            self._state.value = state
+            self._condition.notify_all()
+
+    def close(self) -> None:
+        """
+        Signals the end of the stream. The reader reads the remaining items, and then stops.
+        """
+        self._set_state(_CLOSED)
+
+    def abort(self) -> None:
+        """
+        Signals that the stream has failed. The reader raises `BrokenPipeError`.
+        """
+        self._set_state(_ABORTED)
+
+    # Reading
+
+    def _try_read(self):  # with the condition held
+        write_pos, read_pos, state = self._positions()
+        if state == _ABORTED:
+            raise BrokenPipeError("The writer has aborted the stream")
+        if write_pos == read_pos:
+            return StopIteration if state == _CLOSED else None
+
+        size, kind = self._read_bytes(read_pos, _RECORD.size, _RECORD.unpack)
+        item = self._read_bytes(read_pos + _RECORD.size, size, _decode if kind == _STR else pickle.loads)
+        self._read_pos.value = read_pos + _RECORD.size + size  # release the space
+        self._condition.notify_all()
+        return item,
+
+    def _read_bytes(self, pos: int, size: int, convert: Callable):
+        offset = pos % self.capacity
+        if offset + size <= self.capacity:
+            return convert(self._buf[_HEADER_SIZE + offset:_HEADER_SIZE + offset + size])
+        first = self.capacity - offset
+        return convert(bytes(self._buf[_HEADER_SIZE + offset:_HEADER_SIZE + self.capacity])
+                       + bytes(self._buf[_HEADER_SIZE:_HEADER_SIZE + size - first]))
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """
+        Reads the next item, and waits while the ring is empty.
+        :param timeout: The maximum time (in seconds) to wait for an item
+        :return: The next item
+        :raises StopIteration: If the stream has ended
+        :raises BrokenPipeError: If the writer has aborted the stream
+        :raises TimeoutError: If no item has arrived within `timeout` seconds
+        """
+        ret = self._wait(self._try_read, timeout)
+        if ret is StopIteration:
+            raise StopIteration
+        return ret[0]
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            ret = self._wait(self._try_read)
+            if ret is StopIteration:
+                return
+            yield ret[0]
+
+    async def __aiter__(self) -> AsyncGenerator[Any, None]:
+        while True:
+            ret = await self._wait_async(self._try_read)
+            if ret is StopIteration:
+                return
+            yield ret[0]
+
+    def release(self) -> None:
+        """
+        Releases this process' mapping of the shared memory (and unlinks it, if this process has created it).
+        """
+        del self._write_pos, self._read_pos, self._state  # release the exported pointers
+        self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self) -> "ShmRing":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+def _decode(data) -> str:
+    return str(data, "utf-8")
+
+
+def content_sink(ring: ShmRing) -> Callable[[AsyncGenerator[str, None]], Awaitable[None]]:
+    """
+    Creates a content function for `process_response` that writes the content to a ring buffer (and closes it at the
+    end of the stream).
+    :param ring: The ring buffer
+    :return: A content function
+    """
+
+    async def content_sink(content: AsyncGenerator[str, None]):
+        await ring.feed(content)
+
+    return content_sink
@@ -1,14 +1,20 @@
 import json
+from asyncio import wait_for, get_running_loop, TimeoutError as AsyncTimeoutError
+from concurrent.futures import Executor
 from inspect import getfullargspec
 from typing import List, Generator, Tuple, Callable, Optional, Union, Dict, Iterator, AsyncGenerator, Awaitable, \
-    Set, AsyncIterator
+    Set, AsyncIterator, NamedTuple, Literal
 
 from openai import AsyncStream, Stream
 from openai.types.chat import ChatCompletion, ChatCompletionChunk, ChatCompletionMessage, ChatCompletionMessageToolCall
 from openai.types.chat.chat_completion_message_tool_call import Function
 
 from json_streamer import ParseState, loads
-from .fn_dispatcher import dispatch_yielded_functions_with_args, o_func
+from .arguments_scanner import ArgumentsScanner
+from .fn_dispatcher import dispatch_yielded_functions_with_args, o_func, StreamedItems, StreamInterrupted, \
+    InvalidArguments, CallArguments
+from .middleware import MiddlewareChain
+from .scheduler import Scheduler
 
 OAIResponse = Union[
     ChatCompletion,
@@ -18,6 +24,51 @@ OAIResponse = Union[
     List[ChatCompletionChunk],
     AsyncGenerator[ChatCompletion, None],
 ]
+StreamFactory = Callable[[], Union[OAIResponse, Awaitable[OAIResponse]]]  # Starts a response stream (e.g. a request)
+
+
+class StreamTimeout(StreamInterrupted, TimeoutError):
+    """
+    Raised when a deadline of the stream has expired. The stream is cancelled, and the functions are notified (their
+    arguments' generators raise this exception).
+
+    The partial result (what the processing function would have returned) is available in `result`.
+    """
+
+    def __init__(self, deadline: Literal["first_chunk", "chunk", "total"], timeout: float):
+        super().__init__(f"The {deadline.replace('_', ' ')} deadline of {timeout}s has expired")
+        self.deadline = deadline  # The deadline that has expired: "first_chunk", "chunk" or "total"
+
+
+class _Deadlines(NamedTuple):
+    first_chunk: Optional[float]
+    chunk: Optional[float]
+    total: Optional[float]
+
+    @classmethod
+    def of(cls, first_chunk: Optional[float], chunk: Optional[float], total: Optional[float]) \
+            -> Optional["_Deadlines"]:
+        if first_chunk is None and chunk is None and total is None:
+            return None
+        return cls(first_chunk, chunk, total)
+
+
+def _check_response(response: OAIResponse) -> None:
+    if (not isinstance(response, Iterator) and not isinstance(response, List)
+            and not isinstance(response, AsyncIterator) and not isinstance(response, AsyncGenerator)):
+        raise ValueError("response must be an iterator (generator's stream from OpenAI or a log as a list)")
+
+
+async def _close_response(response: OAIResponse) -> None:
+    """
+    Closes the response (if possible), so the connection to OpenAI is released.
+    """
+    close = getattr(response, "aclose", None) or getattr(response, "close", None)
+    if close is None:
+        return
+    ret = close()
+    if isinstance(ret, Awaitable):
+        await ret
 
 
 class ContentFuncDef:
@@ -37,8 +88,10 @@ class ContentFuncDef:
             raise ValueError("content_func must have only one argument (aside to self)")
 
         if len(spec.annotations) == 1:
-            if spec.annotations[spec.args[0]] is not AsyncGenerator[str, None]:
-                raise ValueError("content_func must have only one argument of type AsyncGenerator[str, None]")
+            if spec.annotations[spec.args[0]] not in (AsyncGenerator[str, None], Iterator[str],
+                                                      Generator[str, None, None]):
+                raise ValueError("content_func must have only one argument of type AsyncGenerator[str, None] "
+                                 "(or Iterator[str] for sync functions)")
 
         self.arg = spec.args[0]
         self.name = func.__name__
@@ -47,7 +100,10 @@ class ContentFuncDef:
 def _simplified_generator(
         response: OAIResponse,
         content_fn_def: Optional[ContentFuncDef],
-        result: ChatCompletionMessage
+        result: ChatCompletionMessage,
+        on_complete: Optional[Callable[[str], None]] = None,
+        constant_memory: bool = False,
+        deadlines: Optional[_Deadlines] = None,
 ) -> Callable[[], AsyncGenerator[Tuple[str, Dict], None]]:
     """
     Return an async generator that converts an OpenAI response stream to a simple generator that yields function names
@@ -55,27 +111,37 @@ def _simplified_generator(
 
     :param response: The response stream
     :param content_fn_def: The content function definition
+    :param result: The message to accumulate the result in
+    :param on_complete: A callback that is called with the function name, before its complete arguments are yielded
+    :param constant_memory: Scan the arguments incrementally (yielding their changes instead of the parsed arguments),
+        and do not accumulate the content and arguments in the result
+    :param deadlines: The deadlines of the stream
     :return: A function that returns a generator
     """
 
     async def generator() -> AsyncGenerator[Tuple[str, Dict], None]:
 
-        async for r in _process_stream(response, content_fn_def):
+        async for r in _process_stream(response, content_fn_def, constant_memory, deadlines):
             if content_fn_def is not None and r[0] == content_fn_def.name:
                 yield content_fn_def.name, {content_fn_def.arg: r[2]}
 
+                if constant_memory:
+                    continue
                 if result.content is None:
                     result.content = ""
                 result.content += r[2]
             else:
-                yield r[0], r[2]
+                if r[1] == ParseState.COMPLETE and on_complete is not None:
+                    on_complete(r[0])
+                yield r[0], CallArguments(r[2], complete=True) if constant_memory and r[1] == ParseState.COMPLETE \
+                    else r[2]
                 if r[1] == ParseState.COMPLETE:
                     if result.tool_calls is None:
                         result.tool_calls = []
                     result.tool_calls.append(ChatCompletionMessageToolCall(
                         id=r[3] or "",
                         type="function",
-                        function=Function(name=r[0], arguments=json.dumps(r[2]))
+                        function=Function(name=r[0], arguments="" if constant_memory else json.dumps(r[2]))
                     ))
 
     return generator
@@ -86,11 +152,24 @@ class DiffPreprocessor:
     Preprocessor that returns only the difference between the current dictionary and the previous one.
     It is used to convert the parsed JSON stream to a dictionary of the changes, so we can stream the changes to the
     function calls.
+
+    Strings are streamed as the fragments that were added to them. Arrays are streamed item by item, as soon as each
+    item is complete. Other values (numbers, objects, etc.) are sent once they are complete.
+    A value is complete once the value after it has started, or when the whole function call is complete - and then
+    its stream is closed.
     """
 
     def __init__(self, content_fn: Optional[ContentFuncDef] = None):
         self.content_fn = content_fn
-        self.prev_dicts = {}
+        self.progress: Dict[str, Dict[str, Optional[int]]] = {}
+        self.completed: Set[str] = set()
+
+    def complete(self, key):
+        """
+        Marks the arguments of the next dictionary of the key as complete.
+        :param key: The key of the dictionary, this is usually the function name
+        """
+        self.completed.add(key)
 
     def preprocess(self, key, current_dict):
         """
@@ -103,22 +182,50 @@ class DiffPreprocessor:
         if self.content_fn is not None and key == self.content_fn.name:
             return current_dict
 
-        prev_dict = self.prev_dicts.get(key, {})
+        complete = key in self.completed
+        progress = self.progress.setdefault(key, {})
         diff_dict = {}
-        for field_key in current_dict:
-            if field_key not in prev_dict:
-                diff_dict[field_key] = current_dict[field_key]
-            elif current_dict[field_key] != prev_dict[field_key]:
-                diff_dict[field_key] = current_dict[field_key][len(prev_dict[field_key]):]
-        self.prev_dicts[key] = current_dict
-        return diff_dict
+        last = len(current_dict) - 1
+        for i, (field_key, value) in enumerate(current_dict.items()):
+            sent = progress.get(field_key, 0)
+            if sent is None:  # the value was already completed
+                continue
+            done = complete or i < last
+            if isinstance(value, str):
+                items = [value[sent:]] if len(value) > sent else []
+                progress[field_key] = len(value)
+            elif isinstance(value, list):
+                ready = len(value) if done else max(len(value) - 1, sent)
+                items = value[sent:ready]
+                progress[field_key] = ready
+            else:
+                items = [value] if done else []
+
+            array = isinstance(value, list)
+            if done:
+                progress[field_key] = None
+                diff_dict[field_key] = StreamedItems(items, complete=True, array=array)
+            elif items:
+                diff_dict[field_key] = items[0] if isinstance(value, str) else StreamedItems(items, array=array)
+
+        if complete:
+            self.completed.discard(key)
+            del self.progress[key]
+        return CallArguments(diff_dict, complete=complete)
 
 
 async def process_response(
         response: OAIResponse,
         content_func: Optional[Callable[[AsyncGenerator[str, None]], Awaitable[None]]] = None,
         funcs: Optional[List[Callable[[], Awaitable[None]]]] = None,
-        self: Optional = None
+        self: Optional = None,
+        executor: Optional[Executor] = None,
+        constant_memory: bool = False,
+        first_chunk_timeout: Optional[float] = None,
+        chunk_timeout: Optional[float] = None,
+        total_timeout: Optional[float] = None,
+        middleware: Optional[MiddlewareChain] = None,
+        scheduler: Optional[Scheduler] = None,
 ) -> Tuple[Set[str], ChatCompletionMessage]:
     """
     Processes an OpenAI response stream and returns a set of function names that were invoked, and a dictionary contains
@@ -128,9 +235,25 @@ async def process_response(
     :param content_func: The function to use for the assistant's text message
     :param funcs: The functions to use when called by the assistant
     :param self: An optional self argument to pass to the functions
+    :param executor: The executor to run sync functions in (e.g. a `ThreadPoolExecutor` or `ProcessPoolExecutor` for
+        CPU-bound handlers). Defaults to the loop's default thread pool
+    :param constant_memory: Keep only a bounded state per argument, for very long outputs. The arguments are scanned
+        incrementally instead of re-parsing them for every chunk, and the text is handed to the functions without being
+        retained: the returned message will not contain the content, and its tool calls will not contain the arguments
+    :param first_chunk_timeout: The maximum time (in seconds) to wait for the first chunk of the stream
+    :param chunk_timeout: The maximum time (in seconds) to wait between chunks of the stream
+    :param total_timeout: The maximum duration (in seconds) of the whole stream
+    :param middleware: A chain of stages that transform the arguments (and the content) before they are handed to the
+        functions, e.g. to redact PII. The returned message contains the original (untransformed) output
+    :param scheduler: The scheduler that limits and prioritizes the invocations of the functions (including the content
+        function). Defaults to the process-wide scheduler (see `set_default_scheduler`), if one is set
     :return: A tuple of the set of function names that were invoked and a dictionary of the results of the functions
     :raises ValueError: If the arguments are invalid
+    :raises InvalidArguments: If a function was called with invalid arguments. The other calls are processed normally,
+        and the result is available in the exception's `result`
     :raises LookupError: If the response does not contain a delta
+    :raises StreamTimeout: If a deadline has expired. The deadlines apply to async streams only. The stream is
+        cancelled, the functions are notified, and the partial result is available in the exception's `result`
     """
 
     if content_func is None and funcs is None:
@@ -139,9 +262,7 @@ async def process_response(
     # assert content_func signature is Generator[str, None, None]
     content_fn_def = ContentFuncDef(content_func) if content_func is not None else None
 
-    if (not isinstance(response, Iterator) and not isinstance(response, List)
-            and not isinstance(response, AsyncIterator) and not isinstance(response, AsyncGenerator)):
-        raise ValueError("response must be an iterator (generator's stream from OpenAI or a log as a list)")
+    _check_response(response)
 
     func_map: Dict[str, Callable] = {}
     if funcs is not None:
@@ -150,10 +271,24 @@ async def process_response(
     if content_fn_def is not None:
         func_map[content_fn_def.name] = content_func
 
+    deadlines = _Deadlines.of(first_chunk_timeout, chunk_timeout, total_timeout)
+
     result = ChatCompletionMessage(role="assistant")
-    gen = _simplified_generator(response, content_fn_def, result)
-    preprocess = DiffPreprocessor(content_fn_def)
-    return await dispatch_yielded_functions_with_args(gen, func_map, preprocess.preprocess, self), result
+    if constant_memory:
+        # the arguments scanner already yields the changes of the arguments
+        preprocess = None
+        gen = _simplified_generator(response, content_fn_def, result, constant_memory=True, deadlines=deadlines)
+    else:
+        diff = DiffPreprocessor(content_fn_def)
+        preprocess = diff.preprocess
+        gen = _simplified_generator(response, content_fn_def, result, diff.complete, deadlines=deadlines)
+
+    try:
+        return await dispatch_yielded_functions_with_args(gen, func_map, preprocess, self, executor, middleware,
+                                                          scheduler), result
+    except (StreamTimeout, InvalidArguments) as e:
+        e.result = (e.invoked, result)
+        raise
 
 
 def _arguments_processor(json_loader=loads) -> Generator[Tuple[ParseState, dict], str, None]:
@@ -185,29 +320,60 @@ def _arguments_processor(json_loader=loads) -> Generator[Tuple[ParseState, dict]
             break
 
 
+def _scanning_arguments_processor() -> Generator[Tuple[ParseState, dict], str, None]:
+    """
+    A generator that incrementally scans a JSON stream and yields the changes of the arguments.
+    :return: A generator that yields the changes of the arguments
+    """
+
+    scanner = ArgumentsScanner()
+    reported_complete = False
+    recv = yield
+    while True:
+        changes = scanner.feed(recv) if recv else {}
+        if scanner.complete and not reported_complete:
+            reported_complete = True
+            recv = yield ParseState.COMPLETE, changes
+        elif changes:
+            recv = yield ParseState.PARTIAL, changes
+        else:
+            recv = yield
+
+
 class StreamProcessorState:
     content_fn_def: Optional[ContentFuncDef] = None
     current_processor: Optional[Generator[Tuple[ParseState, dict], str, None]] = None
     current_fn: Optional[str] = None
     call_id: Optional[str] = None
+    processor_factory: Callable[[], Generator[Tuple[ParseState, dict], str, None]]
 
-    def __init__(self, content_fn_def: Optional[ContentFuncDef]):
+    def __init__(self, content_fn_def: Optional[ContentFuncDef], constant_memory: bool = False):
         self.content_fn_def = content_fn_def
+        self.processor_factory = _scanning_arguments_processor if constant_memory else _arguments_processor
 
 
 async def _process_stream(
         response: OAIResponse,
-        content_fn_def: Optional[ContentFuncDef]
+        content_fn_def: Optional[ContentFuncDef],
+        constant_memory: bool = False,
+        deadlines: Optional[_Deadlines] = None,
 ) -> AsyncGenerator[Tuple[str, ParseState, Union[dict, str], Optional[str]], None]:
     """
     Processes an OpenAI response stream and yields the function name, the parse state and the parsed arguments.
     :param response: The response stream from OpenAI
     :param content_fn_def: The content function definition
+    :param constant_memory: Yield the changes of the arguments (scanned incrementally) instead of the parsed arguments
+    :param deadlines: The deadlines of the stream (for async streams)
     :return: A generator that yields the function name, the parse state and the parsed arguments
+    :raises StreamTimeout: If a deadline has expired
     """
 
-    state = StreamProcessorState(content_fn_def=content_fn_def)
-    if isinstance(response, AsyncGenerator) or isinstance(response, AsyncIterator):
+    state = StreamProcessorState(content_fn_def=content_fn_def, constant_memory=constant_memory)
+    if deadlines is not None and (isinstance(response, AsyncGenerator) or isinstance(response, AsyncIterator)):
+        async for message in _with_deadlines(response, deadlines):
+            for res in _process_message(message, state):
+                yield res
+    elif isinstance(response, AsyncGenerator) or isinstance(response, AsyncIterator):
         async for message in response:
             for res in _process_message(message, state):
                 yield res
@@ -217,6 +383,39 @@ async def _process_stream(
                 yield res
 
 
+async def _with_deadlines(response: OAIResponse, deadlines: _Deadlines) -> AsyncGenerator[ChatCompletionChunk, None]:
+    """
+    Iterates an async stream, and cancels it when a deadline expires.
+    :param response: The async response stream
+    :param deadlines: The deadlines of the stream
+    :return: A generator that yields the stream's chunks
+    :raises StreamTimeout: If a deadline has expired
+    """
+    loop = get_running_loop()
+    it = response.__aiter__()
+    end = loop.time() + deadlines.total if deadlines.total is not None else None
+    first = True
+    while True:
+        deadline = "first_chunk" if first else "chunk"
+        timeout = deadlines.first_chunk if first else deadlines.chunk
+        if end is not None and (timeout is None or end - loop.time() < timeout):
+            deadline, timeout = "total", max(end - loop.time(), 0)
+
+        try:
+            if timeout is None:
+                message = await it.__anext__()
+            else:
+                message = await wait_for(it.__anext__(), timeout)
+        except StopAsyncIteration:
+            return
+        except AsyncTimeoutError:
+            await _close_response(response)
+            raise StreamTimeout(deadline, deadlines.total if deadline == "total" else timeout) from None
+
+        first = False
+        yield message
+
+
 def _process_message(
         message: ChatCompletionChunk,
         state: StreamProcessorState
@@ -228,6 +427,8 @@ def _process_message(
     :param state: The processing state
     :return: Generator
     """
+    if not message.choices:  # e.g. the usage chunk of `stream_options={"include_usage": True}`
+        return
     choice = message.choices[0]
     if not hasattr(choice, "delta"):
         raise LookupError("No delta in choice")
@@ -241,7 +442,7 @@ def _process_message(
 
             state.call_id = delta.tool_calls and delta.tool_calls[0].id or None
             state.current_fn = func.name
-            state.current_processor = _arguments_processor()
+            state.current_processor = state.processor_factory()
             next(state.current_processor)
         if func.arguments:
             arg = func.arguments
@@ -1 +1,26 @@
-from .handler import process_struct_response, Terminate, BaseHandler
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .handler import process_struct_response, Terminate, BaseHandler
+
+_LAZY = {
+    "process_struct_response": ".handler",
+    "Terminate": ".handler",
+    "BaseHandler": ".handler",
+}
+
+__all__ = ["process_struct_response", "Terminate", "BaseHandler"]
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
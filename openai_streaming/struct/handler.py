@@ -1,11 +1,12 @@
 from typing import Protocol, Literal, AsyncGenerator, Optional, TypeVar, Union, Dict, Any, Tuple, get_args, \
-    runtime_checkable
+    runtime_checkable, Iterable, Type
 
+from openai.types.chat import ChatCompletionMessage
 from pydantic import BaseModel
 
-from json_streamer import Parser, JsonParser
-from .yaml_parser import YamlParser
-from ..stream_processing import OAIResponse, process_response
+from json_streamer import Parser
+from .json_parser import ProjectedJsonParser
+from ..stream_processing import OAIResponse, StreamTimeout, _Deadlines, _check_response, _process_stream
 
 TModel = TypeVar('TModel', bound=BaseModel)
 
@@ -35,6 +36,14 @@ class BaseHandler(Protocol[TModel]):
         Called when the parsing was terminated
         """
 
+    def projection(self) -> Optional[Iterable[str]]:
+        """
+        The fields of the model to parse. The other fields of the response (e.g. a long `reasoning` field that the
+        handler ignores) are scanned past, without being decoded (JSON output only).
+        :return: The names of the fields to parse, or None for all the model's fields
+        """
+        return None
+
 
 OutputSerialization = Literal["json", "yaml"]
 
@@ -46,8 +55,9 @@ class _ContentHandler:
     def __init__(self, handler: BaseHandler, output_serialization: OutputSerialization = "yaml"):
         self.handler = handler
         if output_serialization.lower() == "json":
-            self.parser = JsonParser()
+            self.parser = ProjectedJsonParser(_projection(handler))
         elif output_serialization.lower() == "yaml":
+            from .yaml_parser import YamlParser  # the YAML path is optional, so it is imported only when used
             self.parser = YamlParser()
 
     async def handle_content(self, content: AsyncGenerator[str, None]):
@@ -62,18 +72,22 @@ class _ContentHandler:
 
         last_resp = None
 
-        async for token in content:
-            parsed = loader.send(token)  # send the token to the JSON loader
-            while parsed:  # loop until through the parsed parts as the loader yields them
-                last_resp = await self._handle_parsed(parsed[1])  # handle the parsed dict of the response
+        try:
+            async for token in content:
+                parsed = loader.send(token)  # send the token to the JSON loader
+                while parsed:  # loop until through the parsed parts as the loader yields them
+                    last_resp = await self._handle_parsed(parsed[1])  # handle the parsed dict of the response
+                    if isinstance(last_resp, Terminate):
+                        break
+                    try:
+                        parsed = next(loader)
+                    except StopIteration:
+                        break
                 if isinstance(last_resp, Terminate):
                     break
-                try:
-                    parsed = next(loader)
-                except StopIteration:
-                    break
-            if isinstance(last_resp, Terminate):
-                break
+        except StreamTimeout:
+            self._last_resp = last_resp  # keep the partially parsed response
+            raise
 
         if not last_resp:
             return
@@ -92,7 +106,7 @@ class _ContentHandler:
         or `None` if the part is not valid
         """
         try:
-            typ = get_args(type(self.handler).__orig_bases__[0])[0]
+            typ = _model_type(self.handler)
             parsed = typ.model_construct(**part)
         except (TypeError, ValueError):
             return
@@ -108,10 +122,53 @@ class _ContentHandler:
         return self._last_resp
 
 
+def _model_type(handler: BaseHandler) -> Type[BaseModel]:
+    return get_args(type(handler).__orig_bases__[0])[0]
+
+
+def _projection(handler: BaseHandler) -> Optional[Iterable[str]]:
+    """
+    Returns the keys of the response to parse for a handler: its projection, or the fields of its model (by their
+    names and aliases).
+    """
+    projection = handler.projection() if hasattr(handler, "projection") else None
+    if projection is not None:
+        return projection
+    try:
+        fields = _model_type(handler).model_fields
+    except (AttributeError, IndexError, TypeError):
+        return None
+    return set(fields) | {f.alias for f in fields.values() if f.alias}
+
+
+async def _content_generator(
+        response: OAIResponse,
+        result: ChatCompletionMessage,
+        deadlines: Optional[_Deadlines] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Yields the content of the response directly from the stream processing, in the consumer's coroutine (without the
+    functions' dispatching machinery), and accumulates it in the result.
+    :param response: The response from OpenAI
+    :param result: The message to accumulate the content in
+    :param deadlines: The deadlines of the stream
+    :return: A generator that yields the content of the response
+    :raises ValueError: If the response contains a function call
+    """
+    async for fn, _, content, _ in _process_stream(response, None, deadlines=deadlines):
+        if fn is not None:
+            raise ValueError(f"Function {fn} was not registered")
+        result.content = content if result.content is None else result.content + content
+        yield content
+
+
 async def process_struct_response(
         response: OAIResponse,
         handler: BaseHandler,
-        output_serialization: OutputSerialization = "json"
+        output_serialization: OutputSerialization = "json",
+        first_chunk_timeout: Optional[float] = None,
+        chunk_timeout: Optional[float] = None,
+        total_timeout: Optional[float] = None,
 ) -> Tuple[Optional[Union[TModel, Terminate]], Dict[str, Any]]:
     """
     Process the structured response from OpenAI.
@@ -122,18 +179,33 @@ async def process_struct_response(
     :param handler: The handler for the response. It should be a subclass of `BaseHandler[BaseModel]` with a generic
                     type provided
     :param output_serialization: The output serialization of the response. It should be either "json" or "yaml"
+    :param first_chunk_timeout: The maximum time (in seconds) to wait for the first chunk of the stream
+    :param chunk_timeout: The maximum time (in seconds) to wait between chunks of the stream
+    :param total_timeout: The maximum duration (in seconds) of the whole stream
     :return: A tuple of the last parsed response, and a dictionary containing the OpenAI response
+    :raises StreamTimeout: If a deadline has expired. The partial result (the last parsed response, and the OpenAI
+        response) is available in the exception's `result`
     """
 
     if not issubclass(type(handler), BaseHandler):
         raise ValueError("handler should be a subclass of BaseHandler")
 
-    tmodel = get_args(type(handler).__orig_bases__[0])[0]
+    tmodel = _model_type(handler)
     if tmodel == TModel:
         raise ValueError("handler should be a subclass of BaseHandler with a generic type")
 
+    _check_response(response)
     handler = _ContentHandler(handler, output_serialization)
-    _, result = await process_response(response, handler.handle_content, self=handler)
+    result = ChatCompletionMessage(role="assistant")
+    content = _content_generator(response, result,
+                                 _Deadlines.of(first_chunk_timeout, chunk_timeout, total_timeout))
+    try:
+        await handler.handle_content(content)
+        async for _ in content:  # the parsing was terminated - read the rest of the response
+            pass
+    except StreamTimeout as e:
+        e.result = (handler.get_last_response(), result)
+        raise
     if not handler.get_last_response():
         raise ValueError("Probably invalid response from OpenAI")
 
@@ -0,0 +1,200 @@
+import json
+import re
+from typing import List, Dict, Tuple, Generator, Optional, Iterable, Any
+
+from json_streamer import Parser, ParseState
+
+_WHITESPACE = " \t\n\r"
+_STRING_RUN = re.compile(r'[^"\\]+')
+_RAW_RUN = re.compile(r'[^"\\{}\[\],]+')
+_CLOSING = {'{': '}', '[': ']'}
+
+# Scanner states
+_BEFORE_OBJECT = 0
+_BEFORE_KEY = 1
+_KEY = 2
+_AFTER_KEY = 3
+_BEFORE_VALUE = 4
+_VALUE = 5
+_AFTER_VALUE = 6
+_DONE = 7
+
+
+class ProjectedJsonParser(Parser):
+    """
+    Parse partial JSON, keeping only a projection of the object's fields.
+
+    Unlike `JsonParser`, which re-decodes the whole buffer for every token, the object is scanned once: the values of
+    the projected fields are decoded as soon as they are complete (and only the current value is re-decoded while it
+    is partial), and the values of the other fields are scanned past without being buffered or decoded. A partial
+    object is yielded only when a projected field has changed.
+    """
+
+    def __init__(self, fields: Optional[Iterable[str]] = None):
+        """
+        :param fields: The fields to keep (all of them, if not set)
+        """
+        super().__init__()
+        self.fields = frozenset(fields) if fields is not None else None
+        self._state = _BEFORE_OBJECT
+        self._key: List[str] = []
+        self._field: Optional[str] = None
+        self._tracked = False
+        self._value: List[str] = []  # The raw text of the current (projected) value
+        self._stack: List[str] = []  # The open containers of the current value
+        self._in_string = False
+        self._escaped = False
+        self._values: Dict[str, Any] = {}  # The decoded values of the complete fields
+        self._changed = False
+
+    @staticmethod
+    def opening_symbols() -> List[chr]:
+        return ['{', '[', '"']
+
+    def raw_decode(self, s: str) -> Tuple[Dict, int]:
+        return json.JSONDecoder().raw_decode(s)
+
+    def parse_part(self, part: str) -> Generator[Tuple[ParseState, dict], None, None]:
+        if part is None or part == '' or self._state == _DONE:
+            return
+        self._changed = False
+        self._scan(part)
+        if self._state == _DONE:
+            yield ParseState.COMPLETE, dict(self._values)
+        elif self._changed:
+            obj = self._partial()
+            if obj:
+                yield ParseState.PARTIAL, obj
+
+    def _scan(self, chunk: str) -> None:
+        i, n = 0, len(chunk)
+        while i < n:
+            state = self._state
+            if state == _VALUE:
+                i = self._scan_value(chunk, i)
+                continue
+
+            c = chunk[i]
+            if state == _KEY:
+                self._key.append(c)
+                if c == '"' and not self._escaped:
+                    self._field = json.loads("".join(self._key))
+                    self._tracked = self.fields is None or self._field in self.fields
+                    self._state = _AFTER_KEY
+                self._escaped = c == '\\' and not self._escaped
+            elif c in _WHITESPACE:
+                pass
+            elif state == _BEFORE_OBJECT:
+                if c == '{':
+                    self._state = _BEFORE_KEY
+                # anything before the object (e.g. a code fence) is ignored
+            elif state == _BEFORE_KEY:
+                if c == '"':
+                    self._key = ['"']
+                    self._escaped = False
+                    self._state = _KEY
+                elif c == '}':
+                    self._state = _DONE
+                    return
+                elif c != ',':
+                    raise ValueError(f"Unexpected {c!r} in JSON object")
+            elif state == _AFTER_KEY:
+                if c != ':':
+                    raise ValueError(f"Unexpected {c!r} in JSON object")
+                self._state = _BEFORE_VALUE
+            elif state == _BEFORE_VALUE:
+                self._value = []
+                self._stack = []
+                self._in_string = False
+                self._escaped = False
+                self._state = _VALUE
+                continue  # the value starts with this character
+            elif state == _AFTER_VALUE:
+                if c == ',':
+                    self._state = _BEFORE_KEY
+                elif c == '}':
+                    self._state = _DONE
+                    return
+                else:
+                    raise ValueError(f"Unexpected {c!r} in JSON object")
+            i += 1
+
+    def _scan_value(self, chunk: str, i: int) -> int:
+        """
+        Scans the current value, until its end or the end of the chunk.
+        :return: The position after the scanned text
+        """
+        tracked = self._tracked
+        n = len(chunk)
+        self._changed = self._changed or tracked
+        while i < n:
+            if self._escaped:  # the escaped character of a string
+                self._escaped = False
+                if tracked:
+                    self._value.append(chunk[i])
+                i += 1
+                continue
+
+            run = _STRING_RUN if self._in_string else _RAW_RUN
+            m = run.match(chunk, i)
+            if m:
+                if tracked:
+                    self._value.append(m.group())
+                i = m.end()
+                continue
+
+            c = chunk[i]
+            if self._in_string:
+                if c == '\\':
+                    self._escaped = True
+                else:  # closing quote
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in '{[':
+                self._stack.append(c)
+            elif not self._stack:  # the terminator of a scalar value, which belongs to the object
+                self._finish_value()
+                return i
+            elif c != ',':
+                self._stack.pop()
+
+            if tracked:
+                self._value.append(c)
+            i += 1
+            if not self._stack and not self._in_string and c in '"}]':
+                self._finish_value()
+                return i
+        return i
+
+    def _finish_value(self) -> None:
+        if self._tracked:
+            self._values[self._field] = json.loads("".join(self._value))
+            self._value = []
+            self._changed = True
+        self._state = _AFTER_VALUE
+
+    def _partial(self) -> Dict[str, Any]:
+        obj = dict(self._values)
+        if self._state == _VALUE and self._tracked and self._value:
+            value = self._partial_value()
+            if value is not None:
+                obj[self._field] = value
+        return obj
+
+    def _partial_value(self) -> Optional[Any]:
+        """
+        Decodes the current value, as if it was complete.
+        """
+        raw = "".join(self._value)
+        if self._escaped:  # an incomplete escape sequence
+            raw = raw[:-1]
+        if self._in_string:
+            raw += '"'
+        else:
+            raw = raw.rstrip(_WHITESPACE + ",:")
+        raw += "".join(_CLOSING[s] for s in reversed(self._stack))
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
@@ -0,0 +1,59 @@
+import json
+from os.path import dirname
+from types import SimpleNamespace
+from typing import List
+
+from openai.types.chat import ChatCompletionChunk
+
+
+def load_log_items(name: str) -> List[dict]:
+    """
+    Loads a recorded response (from the tests directory) as its raw JSON items.
+    """
+    with open(f"{dirname(__file__)}/{name}", 'r') as f:
+        return json.load(f)
+
+
+def load_log(name: str) -> List[ChatCompletionChunk]:
+    """
+    Loads a recorded response (from the tests directory) as chunks.
+    """
+    return [ChatCompletionChunk.model_construct(**item) for item in load_log_items(name)]
+
+
+def chunk(content=None, name=None, arguments=None, finish_reason=None, index=0) -> ChatCompletionChunk:
+    """
+    Builds a chunk of a streamed response: a content delta, and/or a delta of the tool call at `index`.
+    """
+    tool_calls = None
+    if name is not None or arguments is not None:
+        tool_calls = [{"index": index, "id": f"call_{index}" if name else None, "type": "function" if name else None,
+                       "function": {"name": name, "arguments": arguments}}]
+    return ChatCompletionChunk.model_construct(**{
+        "id": "chatcmpl-test", "created": 1, "model": "gpt-4", "object": "chat.completion.chunk",
+        "choices": [{
+            "index": 0, "finish_reason": finish_reason, "logprobs": None,
+            "delta": {"role": None, "content": content, "function_call": None, "tool_calls": tool_calls},
+        }],
+    })
+
+
+def light_chunk(content=None, name=None, arguments=None, finish_reason=None, index=0) -> SimpleNamespace:
+    """
+    Builds a chunk like `chunk`, as plain namespaces - for streams of many chunks (e.g. under tracemalloc), where
+    constructing models would dominate.
+    """
+    function = SimpleNamespace(name=name, arguments=arguments)
+    tool_calls = None
+    if name is not None or arguments is not None:
+        tool_calls = [SimpleNamespace(index=index, id=f"call_{index}" if name else None, function=function)]
+    delta = SimpleNamespace(content=content, function_call=None, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=finish_reason)])
+
+
+def call(name: str, arguments: str, index: int = 0, size: int = 4) -> List[ChatCompletionChunk]:
+    """
+    Builds the chunks of a tool call, with its arguments split every `size` characters.
+    """
+    return [chunk(name=name, arguments="", index=index)] + \
+        [chunk(arguments=arguments[i:i + size], index=index) for i in range(0, len(arguments), size)]
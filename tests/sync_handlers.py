@@ -0,0 +1,14 @@
+from typing import Iterator
+
+from openai_streaming import openai_streaming_function
+
+
+@openai_streaming_function
+def error_message(self, typ: Iterator[str], description: Iterator[str]):
+    """
+    You MUST use this function when requested to do something that you cannot do.
+
+    :param typ: The type of error that occurred.
+    :param description: A description of the error.
+    """
+    self.append(f"Error: {''.join(typ)} - {''.join(description)}")
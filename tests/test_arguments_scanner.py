@@ -0,0 +1,128 @@
+import asyncio
+import json
+import tracemalloc
+import unittest
+from typing import AsyncGenerator
+
+from openai_streaming import process_response, openai_streaming_function
+from openai_streaming.arguments_scanner import ArgumentsScanner
+from tests.helpers import light_chunk
+
+
+def scan(arguments: str, chunk_size: int):
+    scanner = ArgumentsScanner()
+    values = {}
+    completed = set()
+    for i in range(0, len(arguments), chunk_size):
+        for field, value in scanner.feed(arguments[i:i + chunk_size]).items():
+            values.setdefault(field, []).extend([value] if isinstance(value, str) else value)
+            if not isinstance(value, str) and value.complete:
+                completed.add(field)
+    return scanner, values, completed
+
+
+class TestArgumentsScanner(unittest.TestCase):
+    def test_scan(self):
+        args = {
+            "text": "quote \" backslash \\ unicode é 😀 newline \n end",
+            "number": 12.5,
+            "items": [{"sku": "a]}", "qty": [1, 2]}, "s", 3, None, True],
+            "obj": {"k": [1, {"x": "y"}]},
+            "empty": "",
+            "none": [],
+        }
+        for indent in (None, 2):
+            for ensure_ascii in (True, False):
+                arguments = json.dumps(args, indent=indent, ensure_ascii=ensure_ascii)
+                for chunk_size in (1, 2, 3, 5, 8, 1000):
+                    scanner, values, completed = scan(arguments, chunk_size)
+                    self.assertTrue(scanner.complete)
+                    self.assertEqual(set(args), completed)
+                    self.assertEqual(args["text"], "".join(values["text"]))
+                    self.assertEqual(args["items"], values["items"])
+                    self.assertEqual([args["number"]], values["number"])
+                    self.assertEqual([args["obj"]], values["obj"])
+                    self.assertEqual([], values["empty"])
+
+    def test_items_are_released_when_complete(self):
+        scanner = ArgumentsScanner()
+        self.assertEqual([{"a": 1}], list(scanner.feed('{"items": [{"a": 1}, {"b"')["items"]))
+        changes = scanner.feed(': 2}')
+        self.assertEqual([{"b": 2}], list(changes["items"]))
+        self.assertFalse(changes["items"].complete)
+        self.assertTrue(scanner.feed(']')["items"].complete)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            ArgumentsScanner().feed('[1, 2]')
+
+
+received = []
+
+
+@openai_streaming_function
+async def write_document(title: AsyncGenerator[str, None], body: AsyncGenerator[str, None]):
+    """
+    Write a document.
+
+    :param title: The document's title.
+    :param body: The document's body.
+    """
+    size = 0
+    async for _ in title:
+        pass
+    async for token in body:
+        size += len(token)
+    received.append(size)
+
+
+async def content_handler(content: AsyncGenerator[str, None]):
+    size = 0
+    async for token in content:
+        size += len(token)
+    received.append(size)
+
+
+async def long_stream(size: int, chunk_size: int = 20):
+    words = "lorem ipsum \\n dolor \\\"sit\\\" amet "
+    for i in range(0, size, chunk_size):
+        yield light_chunk(content="content " * (chunk_size // 8))
+        await asyncio.sleep(0)
+    yield light_chunk(name="write_document", arguments='{"title": "A long document", "body": "')
+    sent = 0
+    while sent < size:
+        yield light_chunk(arguments=words)
+        sent += len(words)
+        await asyncio.sleep(0)
+    yield light_chunk(arguments='"}')
+    yield light_chunk(finish_reason="tool_calls")
+
+
+class TestConstantMemory(unittest.TestCase):
+    def _peak(self, size: int) -> int:
+        received.clear()
+        tracemalloc.start()
+        _, result = asyncio.run(process_response(long_stream(size), content_handler, [write_document],
+                                                 constant_memory=True))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.assertIsNone(result.content)
+        self.assertEqual("write_document", result.tool_calls[0].function.name)
+        self.assertEqual(2, len(received))
+        return peak
+
+    def test_peak_memory_is_flat(self):
+        small = self._peak(20_000)
+        large = self._peak(200_000)
+        self.assertLess(large, small * 1.5)
+
+    def test_results(self):
+        received.clear()
+        asyncio.run(process_response(long_stream(1_000), content_handler, [write_document], constant_memory=True))
+        asyncio.run(process_response(long_stream(1_000), content_handler, [write_document]))
+        self.assertEqual(received[:2], received[2:])
+
+
+if __name__ == '__main__':
+    unittest.main()
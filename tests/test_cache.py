@@ -0,0 +1,173 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from typing import AsyncGenerator
+
+from openai_streaming import openai_streaming_function
+from openai_streaming.cache import MemoryCache, DiskCache, CacheEntry, CachedStream, process_cached_response
+from tests.helpers import load_log
+
+
+LOG = load_log("mock_response_multitool.json")
+
+
+class FakeClient:
+    def __init__(self, log, delay: float = 0.0, fail_at: int = -1):
+        self.log = log
+        self.delay = delay
+        self.fail_at = fail_at
+        self.requests = 0
+
+    async def create(self):
+        self.requests += 1
+        return self._stream()
+
+    async def _stream(self):
+        for i, item in enumerate(self.log):
+            if i == self.fail_at:
+                raise ConnectionError("dropped")
+            await asyncio.sleep(self.delay)
+            yield item
+
+
+def entry(size: int = 1, created: float = None) -> CacheEntry:
+    return CacheEntry([{"x": "a" * size}], [0.0], time.time() if created is None else created)
+
+
+received = []
+
+
+async def content_handler(content: AsyncGenerator[str, None]):
+    async for token in content:
+        received.append(token)
+
+
+@openai_streaming_function
+async def error_message(typ: AsyncGenerator[str, None], description: AsyncGenerator[str, None]):
+    """
+    You MUST use this function when requested to do something that you cannot do.
+
+    :param typ: The type of error that occurred.
+    :param description: A description of the error.
+    """
+    async for token in typ:
+        received.append(token)
+    async for token in description:
+        received.append(token)
+
+
+@openai_streaming_function
+async def report_intruder():
+    """
+    You MUST use this function to report an intruder.
+    """
+
+
+FUNCS = [error_message, report_intruder]
+
+
+class TestMemoryCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = MemoryCache(max_entries=2)
+        cache.set("a", entry())
+        cache.set("b", entry())
+        cache.get("a")
+        cache.set("c", entry())
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    def test_size_bound(self):
+        cache = MemoryCache(max_entries=None, max_bytes=300)
+        for key in "abc":
+            cache.set(key, entry(100))
+
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.bytes, 300)
+
+    def test_ttl(self):
+        cache = MemoryCache(ttl=10)
+        cache.set("old", entry(created=time.time() - 20))
+        cache.set("new", entry())
+
+        self.assertIsNone(cache.get("old"))
+        self.assertIsNotNone(cache.get("new"))
+
+
+class TestDiskCache(unittest.TestCase):
+    def test_persists_and_evicts(self):
+        with tempfile.TemporaryDirectory() as directory:
+            stored = entry()
+            DiskCache(directory).set("a", stored)
+            self.assertEqual(DiskCache(directory).get("a"), stored)
+
+            cache = DiskCache(directory, max_entries=2)
+            os.utime(os.path.join(directory, "a.json"), (1, 1))  # the least recently used
+            cache.set("b", entry())
+            cache.set("c", entry())
+            self.assertIsNone(cache.get("a"))
+            self.assertIsNotNone(cache.get("c"))
+
+    def test_ttl(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = DiskCache(directory, ttl=10)
+            cache.set("old", entry(created=time.time() - 20))
+            self.assertIsNone(cache.get("old"))
+            self.assertFalse(os.path.exists(os.path.join(directory, "old.json")))
+
+
+class TestCachedStream(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        received.clear()
+
+    async def test_miss_then_hit_replays_through_handlers(self):
+        cache, client = MemoryCache(), FakeClient(LOG)
+        invoked, live = await process_cached_response(cache, "k", client.create, content_handler, FUNCS)
+        live_received = list(received)
+        received.clear()
+        invoked2, replayed = await process_cached_response(cache, "k", client.create, content_handler, FUNCS)
+
+        self.assertEqual(client.requests, 1)
+        self.assertEqual(invoked, invoked2)
+        self.assertEqual(replayed, live)
+        self.assertEqual(received, live_received)
+
+    async def test_disk_cache_hit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            client = FakeClient(LOG)
+            await process_cached_response(DiskCache(directory), "k", client.create, content_handler, FUNCS)
+            stream = CachedStream(DiskCache(directory), "k", client.create)
+            chunks = [chunk async for chunk in stream]
+
+        self.assertTrue(stream.hit)
+        self.assertEqual(client.requests, 1)
+        self.assertEqual([c.model_dump() for c in chunks], [c.model_dump() for c in LOG])
+
+    async def test_paced_replay(self):
+        cache = MemoryCache()
+        client = FakeClient(LOG[:9] + LOG[-1:], delay=0.01)  # the beginning of the content, and the finish
+        await process_cached_response(cache, "k", client.create, content_handler)
+
+        start = time.monotonic()
+        await process_cached_response(cache, "k", None, content_handler)
+        instant = time.monotonic() - start
+        start = time.monotonic()
+        await process_cached_response(cache, "k", None, content_handler, pace=1.0)
+        paced = time.monotonic() - start
+
+        self.assertLess(instant, 0.05)
+        self.assertGreaterEqual(paced, 0.09)
+
+    async def test_incomplete_stream_is_not_cached(self):
+        cache, client = MemoryCache(), FakeClient(LOG, fail_at=10)
+        with self.assertRaises(ConnectionError):
+            await process_cached_response(cache, "k", client.create, content_handler, FUNCS)
+
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import asyncio
+import unittest
+from typing import AsyncGenerator, List
+
+from openai_streaming import process_response
+from openai_streaming.coalescing import StreamCoalescer, request_key, process_coalesced_response
+from tests.helpers import load_log
+
+
+LOG = load_log("mock_response_multitool.json")[:15]  # the content only
+CONTENT = "".join(c.choices[0].delta.content or "" for c in LOG)
+
+
+class FakeClient:
+    def __init__(self, log, delay: float = 0.005, fail_at: int = -1):
+        self.log = log
+        self.delay = delay
+        self.fail_at = fail_at
+        self.requests = 0
+        self.closed = 0
+
+    async def create(self, **params):
+        self.requests += 1
+        return self._stream()
+
+    async def _stream(self):
+        try:
+            for i, item in enumerate(self.log):
+                if i == self.fail_at:
+                    raise ConnectionError("dropped")
+                await asyncio.sleep(self.delay)
+                yield item
+        finally:
+            self.closed += 1
+
+
+def collector(out: List[str]):
+    async def content_handler(content: AsyncGenerator[str, None]):
+        async for token in content:
+            out.append(token)
+
+    return content_handler
+
+
+PARAMS = dict(model="gpt-4", messages=[{"role": "user", "content": "hi"}], temperature=0, stream=True)
+
+
+class TestCoalescing(unittest.IsolatedAsyncioTestCase):
+    async def _process(self, coalescer: StreamCoalescer, client: FakeClient, out: List[str]):
+        stream = coalescer.create(client.create, **PARAMS)
+        try:
+            await process_response(stream, collector(out))
+        finally:
+            await stream.aclose()
+        return stream
+
+    def test_request_key(self):
+        self.assertEqual(request_key(model="gpt-4", temperature=0), request_key(temperature=0, model="gpt-4"))
+        self.assertNotEqual(request_key(model="gpt-4", temperature=0), request_key(model="gpt-4", temperature=1))
+
+    async def test_identical_requests_share_one_stream(self):
+        coalescer, client = StreamCoalescer(), FakeClient(LOG)
+        outs = [[] for _ in range(5)]
+        await asyncio.gather(*(self._process(coalescer, client, out) for out in outs))
+
+        self.assertEqual(client.requests, 1)
+        self.assertEqual(coalescer.coalesced, 4)
+        for out in outs:
+            self.assertEqual("".join(out), CONTENT)
+        self.assertEqual(coalescer.inflight, 0)
+
+    async def test_late_joiner_gets_the_prefix_replayed(self):
+        coalescer, client = StreamCoalescer(), FakeClient(LOG)
+        first, late = [], []
+        task = asyncio.create_task(self._process(coalescer, client, first))
+        await asyncio.sleep(client.delay * 8)
+        stream = await self._process(coalescer, client, late)
+        await task
+
+        self.assertEqual(client.requests, 1)
+        self.assertFalse(stream.leader)
+        self.assertGreater(stream.replayed, 0)
+        self.assertEqual("".join(late), CONTENT)
+        self.assertEqual("".join(first), CONTENT)
+
+    async def test_finished_stream_is_not_reused(self):
+        coalescer, client = StreamCoalescer(), FakeClient(LOG, delay=0)
+        await self._process(coalescer, client, [])
+        await self._process(coalescer, client, [])
+
+        self.assertEqual(client.requests, 2)
+
+    async def test_upstream_closed_when_all_subscribers_leave(self):
+        coalescer, client = StreamCoalescer(), FakeClient(LOG)
+        streams = [coalescer.create(client.create, **PARAMS) for _ in range(2)]
+        for stream in streams:
+            await stream.__anext__()
+        await streams[0].aclose()
+        self.assertEqual(coalescer.inflight, 1)
+        await streams[1].aclose()
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(coalescer.inflight, 0)
+        self.assertEqual(client.closed, 1)
+
+    async def test_upstream_error_reaches_every_subscriber(self):
+        coalescer, client = StreamCoalescer(), FakeClient(LOG, fail_at=5)
+        key = request_key(**PARAMS)
+        results = await asyncio.gather(
+            *(process_coalesced_response(coalescer, key, client.create, collector([])) for _ in range(3)),
+            return_exceptions=True,
+        )
+
+        self.assertEqual(client.requests, 1)
+        self.assertTrue(all(isinstance(r, ConnectionError) for r in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
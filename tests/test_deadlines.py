@@ -0,0 +1,143 @@
+import asyncio
+import time
+import unittest
+from typing import AsyncGenerator, List, Optional
+
+from pydantic import BaseModel
+
+from openai_streaming import process_response, openai_streaming_function, StreamTimeout
+from openai_streaming.struct import BaseHandler, Terminate, process_struct_response
+from tests.helpers import load_log
+
+
+async def stalling_stream(log, stall_after: int, stall: float = 10, first_delay: float = 0, closed: list = None):
+    try:
+        await asyncio.sleep(first_delay)
+        for i, item in enumerate(log):
+            if i == stall_after:
+                await asyncio.sleep(stall)
+            yield item
+    finally:
+        if closed is not None:
+            closed.append(True)
+
+
+notifications = []
+received = []
+
+
+async def content_handler(content: AsyncGenerator[str, None]):
+    tokens = []
+    try:
+        async for token in content:
+            tokens.append(token)
+    except StreamTimeout as e:
+        notifications.append(e.deadline)
+    received.append("".join(tokens))
+
+
+@openai_streaming_function
+async def error_message(typ: AsyncGenerator[str, None], description: AsyncGenerator[str, None]):
+    """
+    You MUST use this function when requested to do something that you cannot do.
+
+    :param typ: The type of error that occurred.
+    :param description: A description of the error.
+    """
+    async for token in typ:
+        received.append(token)
+    async for token in description:
+        received.append(token)
+
+
+@openai_streaming_function
+async def report_intruder():
+    """
+    You MUST use this function to report an intruder.
+    """
+
+
+class MathProblem(BaseModel):
+    steps: List[str]
+    answer: Optional[int] = None
+
+
+class Handler(BaseHandler[MathProblem]):
+    async def handle_partially_parsed(self, data: MathProblem) -> Optional[Terminate]:
+        pass
+
+    async def terminated(self):
+        pass
+
+
+class TestDeadlines(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        notifications.clear()
+        received.clear()
+
+    async def test_first_chunk_timeout(self):
+        closed = []
+        stream = stalling_stream(load_log("mock_response.json"), -1, first_delay=10, closed=closed)
+        start = time.monotonic()
+        with self.assertRaises(StreamTimeout) as cm:
+            await process_response(stream, content_handler, [error_message], first_chunk_timeout=0.05)
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual("first_chunk", cm.exception.deadline)
+        self.assertEqual([True], closed)
+        invoked, result = cm.exception.result
+        self.assertEqual(set(), invoked)
+        self.assertIsNone(result.content)
+
+    async def test_chunk_timeout_returns_partial_result(self):
+        closed = []
+        log = load_log("mock_response_multitool.json")
+        stream = stalling_stream(log, 10, closed=closed)
+        with self.assertRaises(StreamTimeout) as cm:
+            await process_response(stream, content_handler, [error_message, report_intruder],
+                                   first_chunk_timeout=1, chunk_timeout=0.05)
+
+        self.assertEqual("chunk", cm.exception.deadline)
+        self.assertEqual([True], closed)
+        self.assertEqual(["chunk"], notifications)
+        invoked, result = cm.exception.result
+        self.assertEqual({"content_handler"}, invoked)
+        self.assertEqual(received, [result.content])
+        self.assertTrue(result.content)
+
+    async def test_unhandled_notification(self):
+        stream = stalling_stream(load_log("mock_response.json"), 20)
+        with self.assertRaises(StreamTimeout) as cm:
+            await process_response(stream, content_handler, [error_message], chunk_timeout=0.05)
+
+        self.assertEqual({"error_message"}, cm.exception.result[0])
+        self.assertTrue(received)
+
+    async def test_total_timeout(self):
+        stream = stalling_stream(load_log("mock_response.json"), 20, stall=0.5)
+        start = time.monotonic()
+        with self.assertRaises(StreamTimeout) as cm:
+            await process_response(stream, content_handler, [error_message], chunk_timeout=1, total_timeout=0.1)
+
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual("total", cm.exception.deadline)
+
+    async def test_no_timeout(self):
+        stream = stalling_stream(load_log("mock_response.json"), 5, stall=0.01)
+        await process_response(stream, content_handler, [error_message], first_chunk_timeout=1, chunk_timeout=1,
+                               total_timeout=5)
+        self.assertIn("forbidden", "".join(received))
+        self.assertEqual([], notifications)
+
+    async def test_struct_partial_result(self):
+        stream = stalling_stream(load_log("mock_response_struct.json"), 20)
+        with self.assertRaises(StreamTimeout) as cm:
+            await process_struct_response(stream, Handler(), 'yaml', chunk_timeout=0.05)
+
+        last_resp, _ = cm.exception.result
+        self.assertIsInstance(last_resp, MathProblem)
+        self.assertIsNone(last_resp.answer)
+
+
+if __name__ == '__main__':
+    unittest.main()
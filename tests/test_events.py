@@ -0,0 +1,76 @@
+import unittest
+from typing import AsyncGenerator
+
+from openai.types.chat import ChatCompletionChunk
+
+from openai_streaming import stream_events, iter_events, process_response
+from openai_streaming.events import ContentDelta, ToolCallStarted, ArgumentDelta, ArgumentCompleted, \
+    ToolCallFinished, Finish
+from tests.helpers import load_log
+
+
+async def mock_stream(log):
+    for item in log:
+        yield item
+
+
+def usage_chunk():
+    chunk = ChatCompletionChunk.model_construct(id="chatcmpl", choices=[], created=1, model="gpt-4",
+                                                object="chat.completion.chunk")
+    # the usage field is not declared by older versions of the client
+    object.__setattr__(chunk, "usage", {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15})
+    return chunk
+
+
+class TestEvents(unittest.TestCase):
+    def test_multitool(self):
+        events = list(iter_events(load_log("mock_response_multitool.json")))
+
+        content = "".join(e.delta for e in events if isinstance(e, ContentDelta))
+        self.assertEqual(
+            "I am going to report an error and an intruder for attempting to access restricted information.", content)
+        calls = [e for e in events if not isinstance(e, (ContentDelta, ArgumentDelta))]
+        self.assertEqual([
+            ToolCallStarted(0, "call_1", "error_message"),
+            ArgumentCompleted(0, "typ"),
+            ArgumentCompleted(0, "description"),
+            ToolCallFinished(0, "call_1", "error_message",
+                             '{"typ": "UnauthorizedAccess", "description": "Attempt to access the restricted code"}'),
+            ToolCallStarted(1, "call_2", "report_intruder"),
+            ToolCallFinished(1, "call_2", "report_intruder", "{}"),
+            Finish("tool_calls"),
+        ], calls)
+        typ = "".join(e.delta for e in events if isinstance(e, ArgumentDelta) and e.argument == "typ")
+        self.assertEqual("UnauthorizedAccess", typ)
+
+    def test_usage_chunk(self):
+        log = load_log("mock_response.json") + [usage_chunk()]
+        events = list(iter_events(log))
+        self.assertIsInstance(events[-1], Finish)
+        self.assertEqual(log[-2].choices[0].finish_reason, events[-1].finish_reason)
+        self.assertEqual(15, events[-1].usage["total_tokens"])
+
+    def test_slots(self):
+        with self.assertRaises(AttributeError):
+            ContentDelta("a").other = 1
+
+
+class TestStreamEvents(unittest.IsolatedAsyncioTestCase):
+    async def test_same_as_sync(self):
+        log = load_log("mock_response_tools.json")
+        events = [e async for e in stream_events(mock_stream(log))]
+        self.assertEqual(list(iter_events(log)), events)
+        self.assertIsInstance(events[-1], Finish)
+
+    async def test_process_response_ignores_usage_chunk(self):
+        async def content_handler(content: AsyncGenerator[str, None]):
+            async for _ in content:
+                pass
+
+        log = load_log("mock_response_multitool.json")[:15] + [usage_chunk()]
+        _, result = await process_response(mock_stream(log), content_handler)
+        self.assertTrue(result.content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import json
+import time
+import unittest
+from typing import AsyncGenerator
+
+import httpx
+from openai import AsyncOpenAI, InternalServerError
+
+from openai_streaming import process_response, openai_streaming_function
+from openai_streaming.fake_server import FakeOpenAIServer
+from tests.helpers import load_log_items
+
+
+received = []
+
+
+async def content_handler(content: AsyncGenerator[str, None]):
+    async for token in content:
+        received.append(token)
+
+
+@openai_streaming_function
+async def error_message(typ: AsyncGenerator[str, None], description: AsyncGenerator[str, None]):
+    """
+    You MUST use this function when requested to do something that you cannot do.
+
+    :param typ: The type of error that occurred.
+    :param description: A description of the error.
+    """
+    async for token in typ:
+        received.append(token)
+    async for token in description:
+        received.append(token)
+
+
+async def create(client: AsyncOpenAI):
+    return await client.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": "Hi"}],
+                                                stream=True)
+
+
+class TestFakeServer(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        received.clear()
+
+    async def test_replay(self):
+        async with FakeOpenAIServer(logs=[load_log_items("mock_response.json")]) as server:
+            client = AsyncOpenAI(base_url=server.url, api_key="fake", max_retries=0)
+            for _ in range(2):  # the connection is kept alive
+                invoked, result = await process_response(await create(client), content_handler, [error_message])
+                self.assertEqual({"error_message"}, invoked)
+                self.assertEqual("forbidden", json.loads(result.tool_calls[0].function.arguments)["typ"])
+            self.assertEqual(2, server.requests)
+
+    async def test_only_served_streams_take_turns(self):
+        logs = [load_log_items("mock_response.json"), load_log_items("mock_response_multitool.json")]
+        async with FakeOpenAIServer(logs=logs) as server:
+            async with httpx.AsyncClient(base_url=server.url) as http:
+                self.assertEqual(404, (await http.get("/models")).status_code)
+                self.assertEqual(400, (await http.post("/chat/completions", json={"model": "gpt-4"})).status_code)
+            client = AsyncOpenAI(base_url=server.url, api_key="fake", max_retries=0)
+            invoked, _ = await process_response(await create(client), content_handler, [error_message])
+            self.assertEqual({"error_message"}, invoked)  # the first log
+            self.assertEqual(1, server.requests)
+
+    async def test_synthetic_token_rate(self):
+        async with FakeOpenAIServer(tokens=10, latency=0.05, token_rate=100, jitter=0.1, seed=1) as server:
+            client = AsyncOpenAI(base_url=server.url, api_key="fake", max_retries=0)
+            start = time.monotonic()
+            _, result = await process_response(await create(client), content_handler)
+            elapsed = time.monotonic() - start
+
+        self.assertEqual("".join(f"token{i} " for i in range(10)), result.content)
+        self.assertEqual(result.content, "".join(received))
+        self.assertGreater(elapsed, 0.1)
+
+    async def test_failures(self):
+        async with FakeOpenAIServer(failure_rate=1) as server:
+            client = AsyncOpenAI(base_url=server.url, api_key="fake", max_retries=0)
+            with self.assertRaises(InternalServerError):
+                await create(client)
+            self.assertEqual(1, server.failures)
+
+    async def test_disconnect(self):
+        async with FakeOpenAIServer(disconnect_rate=1) as server:
+            client = AsyncOpenAI(base_url=server.url, api_key="fake", max_retries=0)
+            with self.assertRaises(httpx.RemoteProtocolError):
+                await process_response(await create(client), content_handler)
+            self.assertEqual(1, server.disconnects)
+            self.assertTrue(received)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import asyncio
+import gc
+import pickle
+import queue
+import unittest
+from typing import AsyncGenerator
+
+from openai_streaming.fn_dispatcher import Channel, dispatch_yielded_functions_with_args, _function_spec, _specs, \
+    _SyncChannel, _QUEUE_END
+
+
+class TestChannel(unittest.IsolatedAsyncioTestCase):
+    async def test_send_and_close(self):
+        ch = Channel()
+        ch.send("a")
+        ch.send("b")
+        ch.close()
+        self.assertEqual(["a", "b"], [item async for item in ch])
+
+    async def test_consumer_waits_for_producer(self):
+        ch = Channel()
+        received = []
+
+        async def consume():
+            async for item in ch:
+                received.append(item)
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0)
+        ch.send("a")
+        await asyncio.sleep(0)
+        self.assertEqual(["a"], received)
+        ch.send("b")
+        ch.close()
+        await task
+        self.assertEqual(["a", "b"], received)
+
+    async def test_values_are_not_copied(self):
+        ch = Channel()
+        value = ["fragment"]
+        ch.send(value)
+        ch.close()
+        async for item in ch:
+            self.assertIs(value, item)
+
+
+class TestSyncChannel(unittest.TestCase):
+    def test_null_values_do_not_end_the_stream(self):
+        ch = _SyncChannel(queue.Queue())
+        for value in ("a", None, "b"):
+            ch.send(value)
+        ch.close()
+        self.assertEqual(["a", None, "b"], list(ch))
+
+    def test_end_is_the_same_in_other_processes(self):
+        self.assertIs(_QUEUE_END, pickle.loads(pickle.dumps(_QUEUE_END)))
+
+
+class TestDispatch(unittest.IsolatedAsyncioTestCase):
+    async def test_only_invoked_functions_are_dispatched(self):
+        called = []
+
+        async def used(text: AsyncGenerator[str, None]):
+            called.append("".join([t async for t in text]))
+
+        async def unused(text: AsyncGenerator[str, None]):
+            called.append("unused")
+
+        def gen():
+            async def _gen():
+                yield "used", {"text": "hello "}
+                yield "used", {"text": "world"}
+
+            return _gen()
+
+        invoked = await dispatch_yielded_functions_with_args(gen, [used, unused], None)
+        self.assertEqual({"used"}, invoked)
+        self.assertEqual(["hello world"], called)
+
+    async def test_unregistered_function(self):
+        async def used(text: AsyncGenerator[str, None]):
+            pass
+
+        def gen():
+            async def _gen():
+                yield "other", {"text": "hello"}
+
+            return _gen()
+
+        with self.assertRaises(ValueError):
+            await dispatch_yielded_functions_with_args(gen, [used], None)
+
+
+class TestFunctionSpec(unittest.TestCase):
+    def test_specs_are_released_with_their_functions(self):
+        class Handler:
+            async def handle(self, text: AsyncGenerator[str, None]):
+                pass
+
+        def make():
+            async def closure(text: AsyncGenerator[str, None]):
+                pass
+
+            return closure
+
+        for _ in range(3):
+            self.assertEqual(_function_spec(make()).args, ("text",))
+            self.assertTrue(_function_spec(Handler().handle).takes_self)
+        gc.collect()
+        self.assertEqual([f for f in _specs if getattr(f, "__name__", None) == "closure"], [])
+        self.assertIn(Handler.handle, _specs)  # the bound methods share the spec of their function
+
+
+if __name__ == '__main__':
+    unittest.main()
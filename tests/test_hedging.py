@@ -0,0 +1,153 @@
+import asyncio
+import time
+import unittest
+from typing import AsyncGenerator, Callable, List
+
+from openai_streaming import openai_streaming_function, process_response
+from openai_streaming.hedging import HedgedStream, process_hedged_response
+from tests.helpers import load_log
+
+
+class FakeClient:
+    """
+    A fake streaming client, whose time-to-first-token is drawn from a latency distribution.
+    """
+
+    def __init__(self, log, latency: Callable[[int], float], fail: Callable[[int], bool] = lambda i: False,
+                 close_delay: float = 0):
+        self.log = log
+        self.latency = latency
+        self.fail = fail
+        self.close_delay = close_delay
+        self.requests = 0
+        self.closed: List[int] = []
+        self.consumed: List[int] = []
+
+    async def create(self):
+        i = self.requests
+        self.requests += 1
+        return self._stream(i)
+
+    async def _stream(self, i: int):
+        try:
+            await asyncio.sleep(self.latency(i))
+            if self.fail(i):
+                raise ConnectionError(f"request {i} failed")
+            for item in self.log:
+                yield item
+                await asyncio.sleep(0)
+            self.consumed.append(i)
+        finally:
+            if self.close_delay:
+                await asyncio.sleep(self.close_delay)
+            self.closed.append(i)
+
+
+received = []
+
+
+async def content_handler(content: AsyncGenerator[str, None]):
+    async for token in content:
+        received.append(token)
+
+
+@openai_streaming_function
+async def error_message(typ: AsyncGenerator[str, None], description: AsyncGenerator[str, None]):
+    """
+    You MUST use this function when requested to do something that you cannot do.
+
+    :param typ: The type of error that occurred.
+    :param description: A description of the error.
+    """
+    async for token in typ:
+        received.append(token)
+    async for token in description:
+        received.append(token)
+
+
+class TestHedging(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        received.clear()
+
+    async def _expected(self):
+        await process_hedged_response(FakeClient(load_log("mock_response.json"), lambda i: 0).create,
+                                      content_handler, [error_message])
+        expected = list(received)
+        received.clear()
+        return expected
+
+    async def test_backup_wins(self):
+        expected = await self._expected()
+        client = FakeClient(load_log("mock_response.json"), lambda i: 10 if i == 0 else 0.01)
+        stream = HedgedStream(client.create, hedge_after=0.05)
+
+        start = time.monotonic()
+        invoked, _ = await process_response(stream, content_handler, [error_message])
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual({"error_message"}, invoked)
+        self.assertEqual(expected, received)  # the handlers saw a single stream
+        self.assertEqual(2, stream.launched)
+        self.assertEqual(1, stream.winner)
+        self.assertEqual([0, 1], sorted(client.closed))
+        self.assertEqual([1], client.consumed)
+
+    async def test_no_hedge_when_fast(self):
+        client = FakeClient(load_log("mock_response.json"), lambda i: 0.001)
+        stream = HedgedStream(client.create, hedge_after=1)
+        await process_response(stream, content_handler, [error_message])
+        self.assertEqual(1, client.requests)
+        self.assertEqual(1, stream.launched)
+        self.assertEqual(0, stream.winner)
+
+    async def test_race_from_start(self):
+        expected = await self._expected()
+        client = FakeClient(load_log("mock_response.json"), lambda i: [0.2, 0.05, 0.1][i])
+        stream = HedgedStream(client.create, hedge_after=0, max_streams=3)
+        await process_response(stream, content_handler, [error_message])
+
+        self.assertEqual(3, client.requests)
+        self.assertEqual(1, stream.winner)
+        self.assertEqual(expected, received)
+        self.assertEqual([0, 1, 2], sorted(client.closed))
+        self.assertEqual([1], client.consumed)
+
+    async def test_failure_is_replaced(self):
+        expected = await self._expected()
+        client = FakeClient(load_log("mock_response.json"), lambda i: 0, fail=lambda i: i == 0)
+        await process_hedged_response(client.create, content_handler, [error_message], hedge_after=10)
+        self.assertEqual(2, client.requests)
+        self.assertEqual(expected, received)
+
+    async def test_all_fail(self):
+        client = FakeClient(load_log("mock_response.json"), lambda i: 0, fail=lambda i: True)
+        with self.assertRaises(ConnectionError):
+            await process_hedged_response(client.create, content_handler, [error_message], max_streams=3)
+        self.assertEqual(3, client.requests)
+
+    async def test_tail_latency(self):
+        # a long-tailed time-to-first-token: every 4th request stalls
+        client = FakeClient(load_log("mock_response.json"), lambda i: 0.5 if i % 4 == 0 else 0.01)
+        durations = []
+        for _ in range(20):
+            start = time.monotonic()
+            await process_hedged_response(client.create, content_handler, [error_message], hedge_after=0.05)
+            durations.append(time.monotonic() - start)
+        self.assertLess(max(durations), 0.4)
+
+    async def test_cancelled_while_closing_the_losers(self):
+        client = FakeClient(load_log("mock_response.json"), lambda i: [10, 0.01][i], close_delay=0.1)
+        stream = HedgedStream(client.create, hedge_after=0, max_streams=2)
+        first = asyncio.create_task(stream.__anext__())
+        await asyncio.sleep(0.05)  # the backup has won, and the first stream is still closing
+        first.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+
+        await asyncio.sleep(0.3)
+        self.assertEqual([0, 1], sorted(client.closed))  # the winner was closed too
+        await stream.aclose()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import json
+import subprocess
+import sys
+import unittest
+
+
+def imported_modules(code: str) -> set:
+    out = subprocess.run([sys.executable, "-c", f"{code}\nimport sys, json\nprint(json.dumps(list(sys.modules)))"],
+                         check=True, capture_output=True, text=True).stdout
+    return set(json.loads(out.splitlines()[-1]))
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_package_import_is_light(self):
+        modules = imported_modules("import openai_streaming, openai_streaming.struct")
+
+        for heavy in ("openai", "docstring_parser", "json_streamer", "yaml", "openai_streaming.stream_processing",
+                      "openai_streaming.struct.handler"):
+            self.assertNotIn(heavy, modules)
+
+    def test_names_are_resolved_on_use(self):
+        modules = imported_modules("from openai_streaming import process_response, openai_streaming_function\n"
+                                   "from openai_streaming.struct import process_struct_response")
+
+        self.assertIn("openai_streaming.stream_processing", modules)
+        self.assertIn("openai_streaming.struct.handler", modules)
+        self.assertNotIn("openai_streaming.struct.yaml_parser", modules)
+        self.assertNotIn("docstring_parser", modules)  # until a function is decorated
+
+    def test_unknown_name(self):
+        import openai_streaming
+
+        with self.assertRaises(AttributeError):
+            openai_streaming.not_a_name  # noqa
+        with self.assertRaises(ImportError):
+            from openai_streaming import not_a_name  # noqa
+
+    def test_public_names(self):
+        import openai_streaming
+        import openai_streaming.struct
+
+        for package in (openai_streaming, openai_streaming.struct):
+            self.assertEqual(sorted(package.__all__), sorted(package._LAZY))
+            for name in package.__all__:
+                self.assertIsNotNone(getattr(package, name))
+
+
+if __name__ == '__main__':
+    unittest.main()
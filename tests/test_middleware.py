@@ -0,0 +1,94 @@
+import unittest
+from typing import AsyncGenerator, Dict, List
+
+from openai_streaming import process_response, openai_streaming_function
+from openai_streaming.fn_dispatcher import dispatch_yielded_functions_with_args
+from openai_streaming.middleware import MiddlewareChain, Middleware, Redact
+from tests.helpers import chunk
+
+
+def split(text: str, size: int) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+EMAIL = r"[\w.+-]+@[\w-]+\.[\w.]+"
+
+received: Dict[str, List] = {}
+
+
+async def content_handler(content: AsyncGenerator[str, None]):
+    received["content"] = [token async for token in content]
+
+
+@openai_streaming_function
+async def send_message(to: AsyncGenerator[str, None], tags: List[str]):
+    """
+    Sends a message.
+
+    :param to: The recipient
+    :param tags: The message's tags
+    """
+    received["to"] = [token async for token in to]
+    received["tags"] = [tag async for tag in tags]
+
+
+class Upper(Middleware):
+    def process(self, state: Dict, func: str, arg: str, value):
+        return value.upper() if arg == "tags" else value
+
+
+class Count(Middleware):
+    def process(self, state: Dict, func: str, arg: str, value):
+        state[arg] = state.get(arg, 0) + 1
+        return value
+
+
+class TestMiddleware(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        received.clear()
+
+    async def test_redacts_content_split_between_chunks(self):
+        text = "Contact me at john.doe@example.com or jane@example.org"
+        chain = MiddlewareChain([Redact(EMAIL, "[EMAIL]", lookahead=32)], timed=True)
+        _, message = await process_response([chunk(t) for t in split(text, 3)], content_handler, middleware=chain)
+
+        self.assertEqual("".join(received["content"]), "Contact me at [EMAIL] or [EMAIL]")
+        self.assertEqual(message.content, text)  # the message keeps the original output
+        self.assertGreater(chain.timings["Redact"], 0)
+
+    async def test_stages_run_on_function_arguments(self):
+        arguments = '{"to": "me@example.com", "tags": ["urgent", "personal"]}'
+        stream = [chunk(name="send_message", arguments="")] + [chunk(arguments=a) for a in split(arguments, 4)] + \
+                 [chunk(finish_reason="tool_calls")]
+        count = Count()
+        chain = MiddlewareChain([Redact(EMAIL, lookahead=32), Upper(), count])
+        await process_response(stream, funcs=[send_message], middleware=chain)
+
+        self.assertEqual("".join(received["to"]), "[REDACTED]")
+        self.assertEqual(received["tags"], ["URGENT", "PERSONAL"])
+        self.assertEqual(set(chain.timings), {"Redact", "Upper", "Count"})
+        self.assertGreaterEqual(chain.values, 3)
+        self.assertEqual(chain.timings, {"Redact": 0.0, "Upper": 0.0, "Count": 0.0})  # not timed by default
+
+    async def test_plain_values(self):
+        async def set_level(level: int):
+            received["level"] = [value async for value in level]
+
+        async def gen():
+            yield "set_level", {"level": 2}
+
+        chain = MiddlewareChain([Count()])
+        await dispatch_yielded_functions_with_args(gen, [set_level], None, middleware=chain)
+
+        self.assertEqual(received["level"], [2])
+        self.assertEqual(chain.values, 1)
+
+    async def test_lookahead_is_released_at_the_end(self):
+        chain = MiddlewareChain([Redact(EMAIL, lookahead=64)])
+        await process_response([chunk("short answer")], content_handler, middleware=chain)
+
+        self.assertEqual(received["content"], ["short answer"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import asyncio
+import gc
+import unittest
+from typing import AsyncGenerator, Awaitable, Dict, List
+
+from openai_streaming import process_response, openai_streaming_function, Prefetch, StreamTimeout
+from tests.helpers import chunk
+
+
+async def slow_stream(fragments: List[str], delay: float = 0.01, stall_at: int = -1, name: str = "refund"):
+    yield chunk(name=name, arguments="")
+    for i, fragment in enumerate(fragments):
+        if i == stall_at:
+            await asyncio.sleep(10)
+        await asyncio.sleep(delay)
+        yield chunk(arguments=fragment)
+
+
+FRAGMENTS = ['{"order_id": "', '4', '2", ', '"reason": "', 'too ', 'late', '"}']
+
+events = []
+
+
+async def load_order(order_id: str) -> Dict:
+    events.append(("load", order_id))
+    try:
+        await asyncio.sleep(0.1)
+    except asyncio.CancelledError:
+        events.append(("cancelled", order_id))
+        raise
+    return {"id": order_id, "total": 10}
+
+
+@openai_streaming_function(prefetch={"order": Prefetch(load_order, ("order_id",))})
+async def refund(order_id: AsyncGenerator[str, None], reason: AsyncGenerator[str, None], order: Awaitable[Dict]):
+    """
+    Refunds an order.
+
+    :param order_id: The order's id
+    :param reason: The reason for the refund
+    """
+    async for token in reason:
+        events.append(("reason", token))
+    events.append(("order", await order))
+
+
+async def check_fraud(order_id: str) -> bool:
+    events.append(("check", order_id))
+    raise LookupError(order_id)
+
+
+@openai_streaming_function(prefetch={"order": Prefetch(load_order, ("order_id",)),
+                                     "fraud": Prefetch(check_fraud, ("order_id",))})
+async def note_refund(order_id: AsyncGenerator[str, None], reason: AsyncGenerator[str, None], order: Awaitable[Dict],
+                      fraud: Awaitable[bool]):
+    """
+    Notes a refund request, without looking the order up.
+
+    :param order_id: The order's id
+    :param reason: The reason for the refund
+    """
+    async for token in reason:
+        events.append(("reason", token))
+
+
+class TestPrefetch(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        events.clear()
+
+    async def test_prefetch_starts_before_call_completes(self):
+        await process_response(slow_stream(FRAGMENTS), None, [refund])
+
+        self.assertEqual(events[0], ("load", "42"))
+        self.assertIn(("reason", "late"), events)
+        self.assertEqual(events[-1], ("order", {"id": "42", "total": 10}))
+
+    async def test_prefetch_cancelled_when_stream_is_cut(self):
+        with self.assertRaises(StreamTimeout):
+            await process_response(slow_stream(FRAGMENTS, stall_at=5), None, [refund], chunk_timeout=0.05)
+        await asyncio.sleep(0)
+
+        self.assertEqual(events[0], ("load", "42"))
+        self.assertIn(("cancelled", "42"), events)
+        self.assertNotIn("order", [e[0] for e in events])
+
+    async def test_prefetch_not_started_with_a_cut_off_argument(self):
+        stream = slow_stream(['{"reason": "too late", ', '"order_id": "ord-1234', '56'], delay=0)
+        await process_response(stream, None, [refund])  # a stream that has ended with the length limit
+
+        self.assertNotIn("load", [e[0] for e in events])
+        self.assertNotIn("order", [e[0] for e in events])
+
+    async def test_missing_argument_of_a_complete_call(self):
+        await process_response(slow_stream(['{"reason": "late"}'], delay=0), None, [refund])
+
+        self.assertEqual(events[0], ("load", None))
+        self.assertEqual(events[-1], ("order", {"id": None, "total": 10}))
+
+    async def test_ignored_prefetches_are_cancelled_and_retrieved(self):
+        reported = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: reported.append(context))
+        await process_response(slow_stream(FRAGMENTS, name="note_refund"), None, [note_refund])
+        await asyncio.sleep(0)
+        gc.collect()
+
+        self.assertEqual(events[:2], [("load", "42"), ("check", "42")])
+        self.assertIn(("cancelled", "42"), events)
+        self.assertEqual(reported, [])
+
+    async def test_prefetch_is_not_in_schema(self):
+        properties = refund.openai_schema.function.parameters["properties"]
+        self.assertEqual(set(properties), {"order_id", "reason"})
+
+    def test_invalid_prefetch(self):
+        with self.assertRaises(ValueError):
+            @openai_streaming_function(prefetch={"order": Prefetch(load_order, ("missing",))})
+            async def f(order_id: str, order: Awaitable[Dict]):
+                pass
+
+        with self.assertRaises(ValueError):
+            @openai_streaming_function(prefetch={"order": Prefetch(load_order, ("order_id",))})
+            def g(order_id: str, order: Awaitable[Dict]):
+                pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import unittest
+from typing import AsyncGenerator, List, Optional
+
+from openai.types.chat import ChatCompletionChunk
+from pydantic import BaseModel
+
+from openai_streaming import openai_streaming_function
+from openai_streaming.relay import Relay, relay_app
+from tests.helpers import load_log_items, call, chunk
+
+
+@openai_streaming_function
+async def error_message(typ: AsyncGenerator[str, None], description: AsyncGenerator[str, None]):
+    """
+    You MUST use this function when requested to do something that you cannot do.
+
+    :param typ: The type of error that occurred.
+    :param description: A description of the error.
+    """
+
+
+@openai_streaming_function
+async def report_intruder():
+    """
+    You MUST use this function to report an intruder.
+    """
+
+
+class MathProblem(BaseModel):
+    steps: List[str]
+    answer: Optional[int] = None
+
+
+async def mock_stream(log, delay: float = 0, closed: Optional[list] = None):
+    try:
+        for item in log:
+            if delay:
+                await asyncio.sleep(delay)
+            yield ChatCompletionChunk.model_construct(**item)
+    finally:
+        if closed is not None:
+            closed.append(True)
+
+
+def parse_sse(body: str):
+    events = []
+    for frame in body.split("\n\n"):
+        for line in frame.split("\n"):
+            if line.startswith("data: "):
+                events.append(json.loads(line[len("data: "):]))
+    return events
+
+
+class TestRelay(unittest.IsolatedAsyncioTestCase):
+    async def test_batches_content(self):
+        frames = []
+
+        async def send(frame: str):
+            frames.append(frame)
+
+        relay = Relay(send, "websocket", flush_bytes=10_000, flush_interval=10)
+        await relay.run(mock_stream(load_log_items("mock_response_multitool.json")),
+                        funcs=[error_message, report_intruder])
+
+        self.assertEqual(1, len(frames))
+        events = json.loads(frames[0])
+        self.assertEqual(
+            "I am going to report an error and an intruder for attempting to access restricted information.",
+            "".join(e["delta"] for e in events if e["type"] == "content"))
+        self.assertEqual(1, len([e for e in events if e["type"] == "content"]))
+        description = [e for e in events if e["type"] == "argument" and e["argument"] == "description"]
+        self.assertEqual("Attempt to access the restricted code", "".join(e["delta"] for e in description))
+        self.assertEqual({"type": "done"}, events[-1])
+        self.assertLess(relay.frames, relay.deltas)
+
+    async def test_flushes_on_size(self):
+        frames = []
+
+        async def send(frame: str):
+            frames.append(frame)
+
+        relay = Relay(send, "sse", flush_bytes=0)
+        await relay.run(mock_stream(load_log_items("mock_response.json")), funcs=[error_message], content=False)
+
+        self.assertEqual(relay.deltas, len(frames))
+
+    async def test_failure_cancels_the_pending_flush(self):
+        async def failing():
+            async for item in mock_stream(load_log_items("mock_response.json")):
+                yield item
+            raise ConnectionError("upstream failed")
+
+        async def send(frame: str):
+            pass
+
+        relay = Relay(send, "sse", flush_bytes=10_000, flush_interval=10)
+        with self.assertRaises(ConnectionError):
+            await relay.run(failing(), funcs=[error_message])
+        self.assertIsNone(relay._timer)
+
+    async def test_arguments_are_relayed_in_the_order_they_stream(self):
+        frames = []
+
+        async def send(frame: str):
+            frames.append(frame)
+
+        async def stream():
+            for c in call("error_message", '{"description": "Not allowed", "typ": "forbidden"}') + \
+                    [chunk(finish_reason="tool_calls")]:
+                await asyncio.sleep(0.01)
+                yield c
+
+        relay = Relay(send, "sse", flush_bytes=0)
+        await relay.run(stream(), funcs=[error_message], content=False)
+
+        arguments = [e["argument"] for e in parse_sse("".join(frames)) if e["type"] == "argument"]
+        self.assertEqual("description", arguments[0])  # not held back until `typ` (the first parameter) has ended
+        self.assertEqual({"description", "typ"}, set(arguments))
+
+    async def test_struct(self):
+        frames = []
+
+        async def send(frame: str):
+            frames.append(frame)
+
+        relay = Relay(send, "sse", flush_bytes=0)
+        last, _ = await relay.run_struct(mock_stream(load_log_items("mock_response_struct.json")), MathProblem, "yaml")
+
+        events = parse_sse("".join(frames))
+        self.assertEqual(last.model_dump(), events[-2]["data"])
+        self.assertEqual("done", events[-1]["type"])
+
+
+class TestRelayApp(unittest.IsolatedAsyncioTestCase):
+    async def test_sse(self):
+        async def factory(scope):
+            return mock_stream(load_log_items("mock_response.json"))
+
+        app = relay_app(factory, funcs=[error_message])
+        messages = []
+        disconnect = asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+
+        await app({"type": "http"}, receive, send)
+
+        self.assertEqual(200, messages[0]["status"])
+        self.assertFalse(messages[-1]["more_body"])
+        events = parse_sse(b"".join(m.get("body", b"") for m in messages[1:]).decode())
+        typ = [e for e in events if e["type"] == "argument" and e["argument"] == "typ"]
+        self.assertEqual("forbidden", "".join(e["delta"] for e in typ))
+
+    async def test_websocket(self):
+        async def factory(scope):
+            return mock_stream(load_log_items("mock_response_multitool.json"))
+
+        app = relay_app(factory, funcs=[error_message, report_intruder])
+        messages = []
+        incoming = [{"type": "websocket.connect"}]
+        disconnect = asyncio.Event()
+
+        async def receive():
+            if incoming:
+                return incoming.pop(0)
+            await disconnect.wait()
+            return {"type": "websocket.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+
+        await app({"type": "websocket"}, receive, send)
+
+        self.assertEqual("websocket.accept", messages[0]["type"])
+        self.assertEqual("websocket.close", messages[-1]["type"])
+        events = [e for m in messages[1:-1] for e in json.loads(m["text"])]
+        self.assertIn("content", {e["type"] for e in events})
+
+    async def test_failed_request_before_the_response_starts(self):
+        async def factory(scope):
+            raise ConnectionError("upstream failed")
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        with self.assertRaises(ConnectionError):
+            await relay_app(factory)({"type": "http"}, None, send)
+        self.assertEqual([], messages)  # so the server can respond with an error
+
+    async def test_disconnect_cancels_upstream(self):
+        closed = []
+
+        async def factory(scope):
+            return mock_stream(load_log_items("mock_response.json"), delay=0.01, closed=closed)
+
+        app = relay_app(factory, funcs=[error_message], flush_bytes=0)
+        messages = []
+
+        async def receive():
+            while len(messages) < 3:
+                await asyncio.sleep(0.005)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+
+        await asyncio.wait_for(app({"type": "http"}, receive, send), 5)
+
+        self.assertEqual([True], closed)
+        self.assertTrue(messages[-1]["more_body"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import json
+import unittest
+from typing import AsyncGenerator, List, Optional
+
+from openai.types.chat import ChatCompletionChunk, ChatCompletionMessage
+
+from openai_streaming import openai_streaming_function
+from openai_streaming.resume import ResumableStream, process_resumable_response, _Overlap
+from tests.helpers import load_log_items
+
+
+def content_chunks(text: str, size: int = 5, finish_reason: Optional[str] = "stop") -> List[dict]:
+    chunks = [{"id": "chatcmpl", "object": "chat.completion.chunk", "created": 1, "model": "gpt-4", "choices": [
+        {"index": 0, "finish_reason": None, "delta": {"content": text[i:i + size]}}]} for i in range(0, len(text), size)]
+    if finish_reason:
+        chunks.append({"id": "chatcmpl", "object": "chat.completion.chunk", "created": 1, "model": "gpt-4",
+                       "choices": [{"index": 0, "finish_reason": finish_reason, "delta": {}}]})
+    return chunks
+
+
+class FaultyStream:
+    """
+    A fake stream that drops its connection after `fail_after` chunks.
+    """
+
+    def __init__(self, log: List[dict], fail_after: Optional[int] = None):
+        self.log = log
+        self.fail_after = fail_after
+        self.closed = False
+
+    async def _gen(self):
+        for i, item in enumerate(self.log):
+            if i == self.fail_after:
+                raise ConnectionResetError("connection dropped")
+            yield ChatCompletionChunk.model_construct(**item)
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def aclose(self):
+        self.closed = True
+
+
+received = []
+
+
+async def content_handler(content: AsyncGenerator[str, None]):
+    async for token in content:
+        received.append(token)
+
+
+@openai_streaming_function
+async def error_message(typ: AsyncGenerator[str, None], description: AsyncGenerator[str, None]):
+    """
+    You MUST use this function when requested to do something that you cannot do.
+
+    :param typ: The type of error that occurred.
+    :param description: A description of the error.
+    """
+    async for token in typ:
+        received.append(("typ", token))
+    async for token in description:
+        received.append(("description", token))
+
+
+TEXT = "The quick brown fox jumps over the lazy dog, and then it runs away into the forest."
+
+
+class TestOverlap(unittest.TestCase):
+    def test_overlap(self):
+        for emitted, continuation, expected in [
+            ("hello world, how", " are you", " are you"),  # no overlap
+            ("hello world, how", "world, how are you", " are you"),  # repeats the end
+            ("hello world, how", "hello world, how are you", " are you"),  # starts over
+            ("hello world, how", "world, ho", ""),  # only repeats
+        ]:
+            overlap = _Overlap(emitted, min_overlap=4, window=100)
+            out = []
+            for c in continuation:
+                text = overlap.feed(c)
+                if text:
+                    out.append(text)
+            out.append(overlap.flush())
+            self.assertEqual(expected, "".join(out), (emitted, continuation))
+
+
+class TestResume(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        received.clear()
+
+    async def _run(self, first: FaultyStream, continuations: List[FaultyStream], **kwargs):
+        partials = []
+
+        async def continuation(partial: ChatCompletionMessage):
+            partials.append(partial)
+            return continuations[len(partials) - 1]
+
+        result = await process_resumable_response(first, continuation, content_handler, [error_message], **kwargs)
+        return result, partials
+
+    async def test_content_with_overlap(self):
+        first = FaultyStream(content_chunks(TEXT), fail_after=6)  # 30 characters were emitted
+        second = FaultyStream(content_chunks(TEXT[18:], size=4))  # repeats "fox jumps ov"
+        (_, result), partials = await self._run(first, [second])
+
+        self.assertEqual(TEXT[:30], partials[0].content)
+        self.assertEqual(TEXT, "".join(received))
+        self.assertEqual(TEXT, result.content)
+        self.assertTrue(first.closed)
+
+    async def test_content_restarts(self):
+        first = FaultyStream(content_chunks(TEXT), fail_after=3)
+        second = FaultyStream(content_chunks(TEXT[:40]), fail_after=4)
+        third = FaultyStream(content_chunks(TEXT))
+        (_, result), partials = await self._run(first, [second, third])
+
+        self.assertEqual(2, len(partials))
+        self.assertEqual(TEXT[:20], partials[1].content)
+        self.assertEqual(TEXT, "".join(received))
+
+    async def test_arguments(self):
+        log = load_log_items("mock_response_tools.json")
+        # drop the connection inside the arguments, and restart the call in the continuation
+        first = FaultyStream(log, fail_after=5)
+        second = FaultyStream(log)
+        (invoked, result), partials = await self._run(first, [second])
+
+        self.assertEqual("error_message", partials[0].tool_calls[0].function.name)
+        self.assertEqual({"error_message"}, invoked)
+        args = json.loads(result.tool_calls[0].function.arguments)
+        self.assertEqual(args["typ"], "".join(t for a, t in received if a == "typ"))
+        self.assertEqual(args["description"], "".join(t for a, t in received if a == "description"))
+        self.assertEqual(1, len(result.tool_calls))
+
+    async def test_max_resumes(self):
+        first = FaultyStream(content_chunks(TEXT), fail_after=2)
+        second = FaultyStream(content_chunks(TEXT), fail_after=2)
+        with self.assertRaises(ConnectionResetError):
+            await self._run(first, [second], max_resumes=1)
+
+    async def test_no_failure(self):
+        stream = ResumableStream(FaultyStream(content_chunks(TEXT)), lambda partial: None)
+        chunks = [c async for c in stream]
+        self.assertEqual(TEXT, "".join(c.choices[0].delta.content or "" for c in chunks))
+        self.assertEqual(0, stream.resumes)
+
+
+if __name__ == '__main__':
+    unittest.main()
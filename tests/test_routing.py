@@ -0,0 +1,109 @@
+import asyncio
+import unittest
+from typing import List, Tuple
+
+from openai.types.chat import ChatCompletionChunk
+
+from openai_streaming import process_response
+from openai_streaming.routing import ContentRouter, Segment
+from tests.helpers import chunk
+
+
+def stream(*tokens: str) -> List[ChatCompletionChunk]:
+    return [chunk(token) for token in tokens] + [chunk(finish_reason="stop")]
+
+
+MESSAGE = 'Intro <thinking mode="deep">hmm a<b</thinking> then\n```python\nprint("```")\nx = 1\n```\n' \
+          'after ``` inline\n```\ncat x\n```\nbye'
+
+EXPECTED = [
+    ("text", None, "Intro ", True),
+    ("tag", "thinking", "hmm a<b", True),
+    ("text", None, " then\n", True),
+    ("code", "python", 'print("```")\nx = 1\n', True),
+    ("text", None, "after ``` inline\n", True),
+    ("code", None, "cat x\n", True),
+    ("text", None, "bye", True),
+]
+
+
+class Recorder:
+    def __init__(self):
+        self.segments: List[Tuple] = []
+        self.opened: List[Tuple[str, str]] = []
+
+    async def __call__(self, segment: Segment):
+        self.opened.append((segment.kind, segment.name))
+        text = "".join([t async for t in segment])
+        self.segments.append((segment.kind, segment.name, text, segment.terminated))
+
+
+class TestContentRouter(unittest.IsolatedAsyncioTestCase):
+    async def _route(self, *tokens: str, **handlers) -> Recorder:
+        recorder = Recorder()
+        if handlers.get("tags"):
+            handlers["tags"] = {tag: (recorder if v is True else v) for tag, v in handlers["tags"].items()}
+        router = ContentRouter(**{k: (recorder if v is True else v) for k, v in handlers.items()})
+        await process_response(stream(*tokens), router.content_func)
+        return recorder
+
+    async def test_segments(self):
+        recorder = await self._route(MESSAGE, text=True, code=True, tags={"thinking": None})
+        self.assertEqual(recorder.segments, [s for s in EXPECTED if s[0] != "tag"])  # the tag has no handler
+
+    async def test_delimiters_split_between_chunks(self):
+        for size in (1, 2, 3, 5, 7):
+            recorder = Recorder()
+            router = ContentRouter(text=recorder, code=recorder, tags={"thinking": recorder})
+            tokens = [MESSAGE[i:i + size] for i in range(0, len(MESSAGE), size)]
+            await process_response(stream(*tokens), router.content_func)
+            self.assertEqual(recorder.segments, EXPECTED, f"split every {size} characters")
+
+    async def test_code_by_language(self):
+        python, other = Recorder(), Recorder()
+        router = ContentRouter(code={"python": python, None: other})
+        await process_response(stream(MESSAGE), router.content_func)
+        self.assertEqual(python.segments, [("code", "python", 'print("```")\nx = 1\n', True)])
+        self.assertEqual(other.segments, [("code", None, "cat x\n", True)])
+
+    async def test_tag_attributes(self):
+        attrs = []
+
+        async def tool(segment: Segment):
+            attrs.append(segment.attrs)
+            async for _ in segment:
+                pass
+
+        router = ContentRouter(tags={"tool": tool})
+        await process_response(stream("<tool name='search' id=3 ", 'lang="en">q</tool>'), router.content_func)
+        self.assertEqual(attrs, [{"name": "search", "id": "3", "lang": "en"}])
+
+    async def test_handler_starts_when_the_segment_opens(self):
+        opened_before_end = []
+        recorder = Recorder()
+        router = ContentRouter(code=recorder)
+
+        async def tokens():
+            for token in ("Run:\n```sh\n", "ls", "\n```\n"):
+                yield chunk(token)
+                await asyncio.sleep(0.01)
+                opened_before_end.append(list(recorder.opened))
+            yield chunk(finish_reason="stop")
+
+        await process_response(tokens(), router.content_func)
+        self.assertEqual(opened_before_end[1], [("code", "sh")])  # before the block has ended
+
+    async def test_unterminated_segments(self):
+        recorder = await self._route("```js\nlet x", text=True, code=True)
+        self.assertEqual(recorder.segments, [("code", "js", "let x", False)])
+
+        recorder = await self._route("a <note>half", "way <no", text=True, tags={"note": True})
+        self.assertEqual(recorder.segments, [("text", None, "a ", True), ("tag", "note", "halfway <no", False)])
+
+    async def test_closing_fence_at_the_end(self):
+        recorder = await self._route("```\nx\n``", "`", code=True)
+        self.assertEqual(recorder.segments, [("code", None, "x\n", True)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import asyncio
+import unittest
+from typing import AsyncGenerator, List
+
+from openai_streaming import process_response, openai_streaming_function
+from openai_streaming.scheduler import Scheduler, set_default_scheduler, INTERACTIVE, BACKGROUND
+from tests.helpers import chunk
+
+
+active = {"search_db": 0, "peak": 0}
+order: List[str] = []
+
+
+@openai_streaming_function
+async def search_db(query: AsyncGenerator[str, None]):
+    """
+    Searches the database.
+
+    :param query: The query
+    """
+    active["search_db"] += 1
+    active["peak"] = max(active["peak"], active["search_db"])
+    order.append("".join([token async for token in query]))
+    await asyncio.sleep(0.02)
+    active["search_db"] -= 1
+
+
+async def content_handler(content: AsyncGenerator[str, None]):
+    order.append("".join([token async for token in content]))
+
+
+def search(query: str):
+    return [chunk(name="search_db", arguments=""), chunk(arguments=f'{{"query": "{query}"}}'),
+            chunk(finish_reason="tool_calls")]
+
+
+class TestScheduler(unittest.IsolatedAsyncioTestCase):
+    async def test_priorities_and_arrival_order(self):
+        scheduler = Scheduler(max_concurrency=1, priorities={"content": INTERACTIVE, "tool": BACKGROUND})
+        started = []
+
+        async def run(func: str, tag: str):
+            async with scheduler.slot(func):
+                started.append(tag)
+                await asyncio.sleep(0.01)
+
+        await scheduler.acquire("tool")  # occupy the only slot
+        tasks = [asyncio.create_task(run(func, tag)) for func, tag in
+                 [("tool", "tool-1"), ("content", "content-1"), ("tool", "tool-2"), ("content", "content-2")]]
+        await asyncio.sleep(0.01)
+        self.assertEqual(scheduler.queued, 4)
+        scheduler.release("tool")
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(started, ["content-1", "content-2", "tool-1", "tool-2"])
+        stats = scheduler.stats()
+        self.assertEqual(stats["tool"].admitted, 3)
+        self.assertEqual((stats["tool"].running, stats["tool"].queued), (0, 0))
+        self.assertGreater(stats["tool"].max_wait, stats["content"].max_wait)
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        scheduler = Scheduler(limits={"tool": 1})
+        await scheduler.acquire("tool")
+        waiter = asyncio.create_task(scheduler.acquire("tool"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+
+        self.assertEqual(scheduler.queued, 0)
+        scheduler.release("tool")
+        await asyncio.wait_for(scheduler.acquire("tool"), 1)  # the slot was not lost
+        self.assertEqual(scheduler.running, 1)
+
+    async def test_caps_invocations_across_streams(self):
+        active["peak"] = 0
+        order.clear()
+        scheduler = Scheduler(limits={"search_db": 2})
+        set_default_scheduler(scheduler)
+        try:
+            await asyncio.gather(*(process_response(search(f"q{i}"), funcs=[search_db]) for i in range(6)))
+        finally:
+            set_default_scheduler(None)
+
+        self.assertEqual(active["peak"], 2)
+        self.assertEqual(sorted(order), [f"q{i}" for i in range(6)])
+        self.assertEqual(scheduler.stats()["search_db"].admitted, 6)
+        self.assertGreater(scheduler.stats()["search_db"].wait_time, 0)
+
+    async def test_content_is_not_held_by_busy_tools(self):
+        order.clear()
+        scheduler = Scheduler(limits={"search_db": 1}, priorities={"content_handler": INTERACTIVE})
+        streams = [process_response(search(f"q{i}"), funcs=[search_db], scheduler=scheduler) for i in range(3)]
+        streams.append(process_response([chunk("hello"), chunk(finish_reason="stop")], content_handler,
+                                        scheduler=scheduler))
+        await asyncio.gather(*streams)
+
+        self.assertLess(order.index("hello"), order.index("q2"))
+        self.assertEqual(scheduler.stats()["content_handler"].max_wait, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import json
+import unittest
+from typing import AsyncGenerator, List
+
+from openai_streaming import process_response, openai_streaming_function
+from openai_streaming.sharding import run_sharded
+from openai_streaming.utils import logs_to_response
+from tests.helpers import load_log_items
+
+
+@openai_streaming_function
+async def error_message(typ: AsyncGenerator[str, None], description: AsyncGenerator[str, None]):
+    """
+    You MUST use this function when requested to do something that you cannot do.
+
+    :param typ: The type of error that occurred.
+    :param description: A description of the error.
+    """
+    async for _ in typ:
+        pass
+    async for _ in description:
+        pass
+
+
+async def content_handler(content: AsyncGenerator[str, None]):
+    async for _ in content:
+        pass
+
+
+async def parse_log(log: List[dict]):
+    if not log:
+        raise ValueError("empty log")
+    invoked, message = await process_response(logs_to_response(log), content_handler, [error_message])
+    return sorted(invoked), message.tool_calls[0].function.arguments
+
+
+class TestSharding(unittest.TestCase):
+    def test_run_sharded(self):
+        log = load_log_items("mock_response.json")
+        result = run_sharded(parse_log, [log] * 10, processes=2, concurrency=3)
+
+        self.assertEqual(10, len(result.results))
+        self.assertEqual([0, 1], [s.shard for s in result.shards])
+        self.assertEqual([5, 5], [s.jobs for s in result.shards])  # the pool may run both shards in one worker
+        self.assertEqual(0, result.failures)
+        invoked, arguments = result.results[0]
+        self.assertEqual(["error_message"], invoked)
+        self.assertEqual("forbidden", json.loads(arguments)["typ"])
+        self.assertTrue(all(r == result.results[0] for r in result.results))
+        self.assertGreater(result.throughput, 0)
+
+    def test_failures(self):
+        log = load_log_items("mock_response.json")
+        result = run_sharded(parse_log, [log, [], log], processes=2)
+        self.assertEqual(1, result.failures)
+        self.assertIsInstance(result.results[1], ValueError)
+        self.assertEqual(["error_message"], result.results[2][0])
+
+        with self.assertRaises(ValueError):
+            run_sharded(parse_log, [log, []], processes=2, return_exceptions=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import asyncio
+import multiprocessing
+import threading
+import unittest
+from typing import AsyncGenerator
+
+from openai_streaming import process_response
+from openai_streaming.shm_ring import ShmRing, content_sink
+from tests.helpers import load_log
+
+
+async def mock_stream(log):
+    for item in log:
+        yield item
+
+
+def collect(ring: ShmRing, results) -> None:
+    try:
+        results.put(list(ring))
+    finally:
+        ring.release()
+
+
+class TestShmRing(unittest.TestCase):
+    def test_wraparound_and_backpressure(self):
+        items = ["héllo 😀 " * (i % 4) for i in range(500)] + [{"sku": "a", "qty": 1}, [1, 2]]
+        with ShmRing.create(64) as ring:
+            def write():
+                for item in items:
+                    ring.put(item, timeout=10)
+                ring.close()
+
+            writer = threading.Thread(target=write)
+            writer.start()
+            received = list(ring)
+            writer.join()
+
+        self.assertEqual(items, received)
+
+    def test_full(self):
+        with ShmRing.create(64) as ring:
+            ring.put("x" * 50)
+            with self.assertRaises(TimeoutError):
+                ring.put("y" * 20, timeout=0.01)
+
+    def test_large_string_is_split(self):
+        ctx = multiprocessing.get_context("spawn")
+        with ShmRing.create(64, ctx) as ring:
+            text = "x" * 1000
+            results = ctx.Queue()
+            worker = ctx.Process(target=collect, args=(ring, results))
+            worker.start()
+            ring.put(text)
+            ring.close()
+            self.assertEqual(text, "".join(results.get(timeout=30)))
+            worker.join()
+
+    def test_abort(self):
+        with ShmRing.create(64) as ring:
+            ring.put("a")
+            ring.abort()
+            with self.assertRaises(BrokenPipeError):
+                ring.get()
+
+    def test_empty(self):
+        with ShmRing.create(64) as ring:
+            with self.assertRaises(TimeoutError):
+                ring.get(timeout=0.01)
+            ring.close()
+            with self.assertRaises(StopIteration):
+                ring.get()
+
+
+class TestContentSink(unittest.IsolatedAsyncioTestCase):
+    async def test_process_response(self):
+        ctx = multiprocessing.get_context("spawn")
+        with ShmRing.create(32, ctx) as ring:
+            results = ctx.Queue()
+            worker = ctx.Process(target=collect, args=(ring, results))
+            worker.start()
+            _, result = await process_response(mock_stream(load_log("mock_response_multitool.json")[:15]),
+                                               content_sink(ring))
+            received = results.get(timeout=30)
+            worker.join()
+        self.assertEqual(result.content, "".join(received))
+        self.assertGreater(len(received), 1)
+
+    async def test_async_reader(self):
+        with ShmRing.create(16) as ring:
+            async def produce(content: AsyncGenerator[str, None]):
+                await ring.feed(content)
+
+            async def tokens():
+                for i in range(100):
+                    yield f"token{i}"
+
+            writer = asyncio.create_task(produce(tokens()))
+            received = [item async for item in ring]
+            await writer
+        self.assertEqual([f"token{i}" for i in range(100)], received)
+
+    async def test_cancelled_reader_consumes_nothing(self):
+        with ShmRing.create(16) as ring:
+            async def read():
+                return [item async for item in ring]
+
+            reader = asyncio.create_task(read())
+            await asyncio.sleep(0.05)
+            reader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await reader
+            ring.put("a")
+            self.assertEqual("a", ring.get(timeout=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import json
+import unittest
+from types import SimpleNamespace
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from openai_streaming.struct import BaseHandler, Terminate, process_struct_response
+from openai_streaming.struct.json_parser import ProjectedJsonParser
+
+
+class Answer(BaseModel):
+    steps: List[str]
+    answer: Optional[int] = None
+
+
+class Handler(BaseHandler[Answer]):
+    def __init__(self):
+        self.partials = []
+
+    async def handle_partially_parsed(self, data: Answer) -> Optional[Terminate]:
+        self.partials.append(data)
+
+    async def terminated(self):
+        pass
+
+
+class AnswerOnlyHandler(Handler):
+    def projection(self):
+        return {"answer"}
+
+
+RESPONSE = {
+    "reasoning": "Let me think about \"this\" {carefully}, [step] by step... \\ é 😀 " * 20,
+    "steps": ["Multiply 3 by 2", "Add 1, to get \"7\""],
+    "answer": 7,
+}
+
+
+def parse(text: str, fields=None, size: int = 3) -> list:
+    loader = ProjectedJsonParser(fields)()
+    next(loader)
+    out = []
+    for i in range(0, len(text), size):
+        parsed = loader.send(text[i:i + size])
+        while parsed:
+            out.append(parsed)
+            parsed = next(loader)
+    return out
+
+
+async def stream(text: str, size: int = 5):
+    for i in range(0, len(text), size):
+        delta = SimpleNamespace(content=text[i:i + size], function_call=None, tool_calls=None)
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)])
+
+
+class TestProjectedJsonParser(unittest.TestCase):
+    def test_parses_whole_object(self):
+        text = json.dumps({**RESPONSE, "nested": {"a": [1, {"b": None}], "c": True}, "neg": -1.5e3})
+        for size in (1, 2, 7, 1000):
+            out = parse(text, size=size)
+            self.assertEqual(out[-1][1], json.loads(text))
+            self.assertEqual(out[-1][0].name, "COMPLETE")
+
+    def test_skips_unprojected_fields(self):
+        out = parse(json.dumps(RESPONSE, indent=2), {"steps", "answer"})
+        self.assertEqual(out[-1][1], {"steps": RESPONSE["steps"], "answer": 7})
+        self.assertTrue(all("reasoning" not in obj for _, obj in out))
+        # nothing is yielded while the skipped field streams
+        self.assertEqual(out[0][1], {"steps": []})
+
+    def test_partial_values(self):
+        out = [obj for _, obj in parse('{"steps": ["Multiply \\"3\\" by 2", "Add', size=1)]
+        self.assertIn({"steps": ['Multiply "3']}, out)
+        self.assertEqual(out[-1], {"steps": ['Multiply "3" by 2', "Add"]})
+
+
+class TestStructProjection(unittest.IsolatedAsyncioTestCase):
+    async def test_model_fields_are_the_default_projection(self):
+        handler = Handler()
+        last, message = await process_struct_response(stream(json.dumps(RESPONSE)), handler, "json")
+
+        self.assertEqual(last, Answer(steps=RESPONSE["steps"], answer=7))
+        self.assertEqual(json.loads(message.content), RESPONSE)
+        self.assertTrue(all(not hasattr(p, "reasoning") for p in handler.partials))
+
+    async def test_handler_projection(self):
+        handler = AnswerOnlyHandler()
+        last, _ = await process_struct_response(stream(json.dumps(RESPONSE)), handler, "json")
+
+        self.assertEqual(last.answer, 7)
+        self.assertEqual(len(handler.partials), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
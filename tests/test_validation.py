@@ -0,0 +1,163 @@
+import unittest
+from typing import AsyncGenerator, Dict, List, Literal, Optional
+
+from pydantic import BaseModel
+
+from openai_streaming import process_response, openai_streaming_function, InvalidArguments
+from openai_streaming.fn_dispatcher import dispatch_yielded_functions_with_args
+from tests.helpers import chunk, call
+
+
+received: Dict[str, List] = {}
+
+
+class Address(BaseModel):
+    city: str
+    zip: int
+
+
+@openai_streaming_function
+async def ship(priority: Literal["low", "high"], weight: float, address: Address,
+               note: Optional[AsyncGenerator[str, None]]):
+    """
+    Ships a package.
+
+    :param priority: The shipping priority
+    :param weight: The weight, in kilograms
+    :param address: The destination
+    :param note: A note for the courier
+    """
+    received["priority"] = "".join([p async for p in priority])
+    received["weight"] = [w async for w in weight]
+    received["address"] = [a async for a in address]
+    received["note"] = [n async for n in note]
+
+
+@openai_streaming_function
+async def count_items(count: int):
+    """
+    Counts items.
+
+    :param count: The number of items
+    """
+    received["count"] = [c async for c in count]
+
+
+@openai_streaming_function
+async def careful_count(count: int):
+    """
+    Counts items, and reports invalid counts.
+
+    :param count: The number of items
+    """
+    try:
+        received["careful"] = [c async for c in count]
+    except InvalidArguments as e:
+        received["careful_error"] = e
+
+
+@openai_streaming_function
+async def remember(fact: AsyncGenerator[str, None]):
+    """
+    Remembers a fact.
+
+    :param fact: The fact
+    """
+    received.setdefault("facts", []).append("".join([f async for f in fact]))
+
+
+async def content_handler(content: AsyncGenerator[str, None]):
+    received["content"] = "".join([token async for token in content])
+
+
+class TestArgumentValidation(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        received.clear()
+
+    async def test_complete_values_are_validated_by_their_annotations(self):
+        arguments = '{"priority": "high", "weight": 3, "address": {"city": "Paris", "zip": "75001"}, ' \
+                    '"note": "leave it at the door"}'
+        await process_response(call("ship", arguments) + [chunk(finish_reason="tool_calls")], funcs=[ship])
+
+        self.assertEqual(received["priority"], "high")  # streamed as fragments, validated as a whole
+        self.assertEqual(received["weight"], [3.0])
+        self.assertEqual(received["address"], [Address(city="Paris", zip=75001)])
+        self.assertEqual("".join(received["note"]), "leave it at the door")
+
+    async def test_invalid_call_does_not_stop_the_stream(self):
+        stream = call("count_items", '{"count": "many"}', 0) + call("ship", '{"priority": "low", "weight": 1, '
+                                                                            '"address": {"city": "Rome", "zip": 1}, '
+                                                                            '"note": "ok"}', 1) + \
+            [chunk(finish_reason="tool_calls")]
+        with self.assertRaises(InvalidArguments) as raised:
+            await process_response(stream, funcs=[count_items, ship])
+
+        e = raised.exception
+        self.assertEqual((e.func, e.arg), ("count_items", "count"))
+        self.assertEqual(e.errors[0]["loc"], ("count",))
+        self.assertEqual(e.errors[0]["type"], "int_parsing")
+        self.assertEqual(e.invoked, {"count_items", "ship"})
+        self.assertEqual(e.result[0], {"count_items", "ship"})
+        self.assertNotIn("count", received)
+        self.assertEqual(received["note"], ["ok"])  # the other call was processed
+
+    async def test_invalid_literal(self):
+        arguments = '{"priority": "urgent", "weight": 1, "address": {"city": "Rome", "zip": 1}, "note": ""}'
+        with self.assertRaises(InvalidArguments) as raised:
+            await process_response(call("ship", arguments) + [chunk(finish_reason="tool_calls")], funcs=[ship])
+
+        self.assertEqual(raised.exception.errors[0]["type"], "literal_error")
+        self.assertNotIn("note", received)
+
+    async def test_function_is_notified_and_the_call_is_reported(self):
+        stream = call("careful_count", '{"count": [1, 2]}') + [chunk(finish_reason="tool_calls")]
+        with self.assertRaises(InvalidArguments) as raised:
+            await process_response(stream, funcs=[careful_count])
+
+        self.assertEqual(raised.exception.errors[0]["type"], "int_type")  # a list is not split for a scalar argument
+        self.assertEqual(received["careful_error"].arg, "count")
+
+    async def test_unexpected_argument(self):
+        stream = call("count_items", '{"count": 2, "color": "red"}') + [chunk(finish_reason="tool_calls")]
+        with self.assertRaises(ValueError) as raised:  # InvalidArguments is a ValueError, as it was before
+            await process_response(stream, funcs=[count_items])
+
+        self.assertIsInstance(raised.exception, InvalidArguments)
+        self.assertEqual(raised.exception.errors[0]["loc"], ("color",))
+        self.assertIn("Unexpected argument", str(raised.exception))
+
+    async def test_later_calls_of_the_same_function_run(self):
+        stream = call("careful_count", '{"count": "many"}', 0) + call("careful_count", '{"count": 3}', 1) + \
+            [chunk(finish_reason="tool_calls")]
+        with self.assertRaises(InvalidArguments) as raised:
+            await process_response(stream, funcs=[careful_count])
+
+        self.assertEqual(raised.exception.call, 0)
+        self.assertEqual(len(raised.exception.rejected), 1)
+        self.assertEqual(received["careful"], [3])
+
+    async def test_each_call_is_a_separate_invocation(self):
+        stream = call("remember", '{"fact": "the sky is blue"}', 0) + call("remember", '{"fact": "grass is green"}', 1) \
+            + [chunk(finish_reason="tool_calls")]
+        invoked, _ = await process_response(stream, funcs=[remember])
+
+        self.assertEqual(invoked, {"remember"})
+        self.assertEqual(sorted(received["facts"]), ["grass is green", "the sky is blue"])  # not joined
+
+    async def test_strings_are_coerced_once_complete(self):
+        arguments = '{"priority": "low", "weight": "3.5", "address": {"city": "Rome", "zip": 1}, "note": null}'
+        await process_response(call("ship", arguments) + [chunk(finish_reason="tool_calls")], funcs=[ship])
+
+        self.assertEqual(received["weight"], [3.5])
+        self.assertEqual(received["note"], [None])
+
+    async def test_plain_values_without_preprocessor(self):
+        async def gen():
+            yield "count_items", {"count": 7}
+
+        self.assertEqual(await dispatch_yielded_functions_with_args(gen, [count_items], None), {"count_items"})
+        self.assertEqual(received["count"], [7])
+
+
+if __name__ == '__main__':
+    unittest.main()
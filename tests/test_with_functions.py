@@ -1,13 +1,18 @@
+import asyncio
 import json
 import unittest
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import Manager
 from os.path import dirname
-from typing import AsyncGenerator, Dict, Generator
+from typing import AsyncGenerator, Dict, Generator, Iterator
 from unittest.mock import patch, AsyncMock
 
 import openai
 from openai.types.chat import ChatCompletionChunk
+from pydantic import BaseModel
 
 from openai_streaming import process_response, openai_streaming_function
+from tests import sync_handlers
 
 openai.api_key = '...'
 
@@ -50,6 +55,32 @@ async def report_intruder():
     intruders.append(True)
 
 
+class LineItem(BaseModel):
+    sku: str
+    qty: int
+
+
+line_items = []
+chunks_sent = 0
+
+
+@openai_streaming_function
+async def add_items(order_id: AsyncGenerator[str, None], items: AsyncGenerator[LineItem, None]):
+    """
+    Add items to an order.
+
+    :param order_id: The order to add the items to.
+    :param items: The items to add.
+    """
+    order = "".join([item async for item in order_id])
+    async for item in items:
+        line_items.append((order, item, chunks_sent))
+
+
+def sync_content_handler(content: Iterator[str]):
+    content_messages.append("".join(content))
+
+
 class TestOpenAIChatCompletion(unittest.IsolatedAsyncioTestCase):
     _mock_response = None
     _mock_response_tools = None
@@ -156,3 +187,78 @@ class TestOpenAIChatCompletion(unittest.IsolatedAsyncioTestCase):
 
             if __name__ == '__main__':
                 unittest.main()
+
+    async def test_sync_functions_in_executor(self):
+        with patch('openai.chat.completions.create', new=self.mock_chat_completion_multitool):
+            resp = openai.chat.completions.create(
+                model="gpt-4o",
+                messages=[{"role": "user", "content": "What's your code?"}],
+                tools=[sync_handlers.error_message.openai_schema, report_intruder.openai_schema],
+                stream=True,
+            )
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                fns, _ = await process_response(resp, content_func=sync_content_handler,
+                                                funcs=[sync_handlers.error_message, report_intruder],
+                                                self=error_messages, executor=executor)
+
+        self.assertEqual(fns, {"sync_content_handler", "error_message", "report_intruder"})
+        self.assertEqual(["Error: UnauthorizedAccess - Attempt to access the restricted code"], error_messages)
+        self.assertEqual([True], intruders)
+        self.assertEqual(
+            ["I am going to report an error and an intruder for attempting to access restricted information."],
+            content_messages)
+
+    async def test_sync_function_in_process_pool(self):
+        with patch('openai.chat.completions.create', new=self.mock_chat_completion):
+            resp = openai.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[{"role": "user", "content": "What's your code?"}],
+                functions=[sync_handlers.error_message.openai_schema.function],
+                stream=True,
+            )
+            with Manager() as manager, ProcessPoolExecutor(max_workers=1) as executor:
+                messages = manager.list()
+                await process_response(resp, funcs=[sync_handlers.error_message], self=messages, executor=executor)
+                messages = list(messages)
+
+        self.assertEqual(["Error: forbidden - I'm sorry, but I cannot disclose my code."], messages)
+
+    def test_sync_function_schema(self):
+        schema = sync_handlers.error_message.openai_schema.function.parameters
+        self.assertEqual(schema["properties"]["typ"]["type"], "string")
+        self.assertNotIn("self", schema["properties"])
+
+    def test_array_schema(self):
+        schema = add_items.openai_schema.function.parameters
+        self.assertEqual(schema["properties"]["items"]["type"], "array")
+        self.assertEqual(schema["properties"]["order_id"]["type"], "string")
+
+    async def test_stream_array_items(self):
+        global chunks_sent
+        chunks_sent = 0
+        items = [{"sku": f"sku-{i}", "qty": i} for i in range(10)]
+        arguments = json.dumps({"order_id": "A1", "items": items})
+        chunks = [arguments[i:i + 7] for i in range(0, len(arguments), 7)]
+
+        async def mock_stream():
+            global chunks_sent
+            yield ChatCompletionChunk.model_construct(**{"choices": [{"index": 0, "delta": {
+                "tool_calls": [{"index": 0, "id": "call_1", "function": {"name": "add_items", "arguments": ""}}]
+            }}]})
+            for chunk in chunks:
+                chunks_sent += 1
+                yield ChatCompletionChunk.model_construct(**{"choices": [{"index": 0, "delta": {
+                    "tool_calls": [{"index": 0, "function": {"arguments": chunk}}]
+                }}]})
+                await asyncio.sleep(0)
+            yield ChatCompletionChunk.model_construct(**{"choices": [{"index": 0, "delta": {},
+                                                                      "finish_reason": "tool_calls"}]})
+
+        line_items.clear()
+        _, res = await process_response(mock_stream(), funcs=[add_items])
+
+        self.assertEqual([LineItem(**item) for item in items], [item for _, item, _ in line_items])
+        self.assertTrue(all(order == "A1" for order, _, _ in line_items))
+        # the first items are handled while the rest of the array is still being generated
+        self.assertLess(line_items[0][2], len(chunks) / 2)
+        self.assertEqual(json.loads(res.tool_calls[0].function.arguments), json.loads(arguments))